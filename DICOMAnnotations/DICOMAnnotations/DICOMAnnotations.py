@@ -1,682 +1,2526 @@
-import os
-import unittest
-from __main__ import vtk, qt, ctk, slicer
-
-#
-# DICOMAnnotations
-#
-
-class DICOMAnnotations:
-  def __init__(self, parent):
-    parent.title = "DICOM Annotations" # TODO make this more human readable by adding spaces
-    parent.categories = ["Quantification"]
-    parent.dependencies = []
-    parent.contributors = ["Alireza Mehrtash (SPL, BWH), Andrey Fedorov (SPL, BWH), Steve Pieper (Isomics)"]
-    parent.helpText = """
-    The DICOM Annotations module is used to get the useful meta-data information from DICOM images
-    and add display them on the corners of Slice views.
-    """
-    parent.acknowledgementText = """
-    Supported by NIH U01CA151261 (PI Fennessy) and U24 CA180918 (PIs Kikinis and Fedorov).
-    """
-    self.parent = parent
-
-    # Add this test to the SelfTest module's list for discovery when the module
-    # is created.  Since this module may be discovered before SelfTests itself,
-    # create the list if it doesn't already exist.
-    try:
-      slicer.selfTests
-    except AttributeError:
-      slicer.selfTests = {}
-    slicer.selfTests['DICOMAnnotations'] = self.runTest
-
-  def runTest(self):
-    tester = DICOMAnnotationsTest()
-    tester.runTest()
-
-#
-# DICOMAnnotationsWidget
-#
-
-class DICOMAnnotationsWidget:
-  def __init__(self, parent = None):
-    if not parent:
-      self.parent = slicer.qMRMLWidget()
-      self.parent.setLayout(qt.QVBoxLayout())
-      self.parent.setMRMLScene(slicer.mrmlScene)
-    else:
-      self.parent = parent
-    self.layout = self.parent.layout()
-    if not parent:
-      self.setup()
-      self.parent.show()
-
-    self.backgroundVolumeName = 'None'
-    self.foregroundVolumeName = 'None'
-    self.labelVolumeName = 'None'
-    self.backgroundDicomDic = {}
-    self.foregroundDicomDic = {}
-    self.topLeftLines =  ['']*7
-    self.topRightLines =  ['']*5
-    self.cornerTexts =[]
-    # Bottom Left Corner Text
-    self.cornerTexts.append({'1-Label':'','2-Foreground':'','3-Background':''})
-    # Bottom Rihgt Corner Text
-    self.cornerTexts.append({'1-TR':'','2-TE':''})
-    # Top Left Corner Text
-    self.cornerTexts.append({'1-PatientName':'','2-PatientID':'','3-PatientInfo':'',
-      '4-Bg-StudyDate':'','5-Fg-StudyDate':'','6-Bg-StudyTime':'','7-Bg-StudyTime':'',
-      '8-Bg-SeriesDescription':'','9-Fg-SeriesDescription':''})
-    # Top Rihgt Corner Text
-    self.cornerTexts.append({'1-Institution-Name':'','2-Referring-Phisycian':'','3-Manufacturer':'',
-      '4-Model':'','5-Patient-Position':''})
-
-    self.topLeftAnnotationDisplay = True
-    self.topRightAnnotationDisplay = True
-    self.bottomLeftAnnotationDisplay = True
-    self.bottomRightAnnotationDisplay = True
-
-    self.layoutManager = slicer.app.layoutManager()
-    self.sliceCornerAnnotations = {}
-
-  def setup(self):
-    # Instantiate and connect widgets ...
-
-    #
-    # Reload and Test area
-    #
-    reloadCollapsibleButton = ctk.ctkCollapsibleButton()
-    reloadCollapsibleButton.text = "Reload && Test"
-    self.layout.addWidget(reloadCollapsibleButton)
-    reloadFormLayout = qt.QFormLayout(reloadCollapsibleButton)
-
-    # reload button
-    # (use this during development, but remove it when delivering
-    #  your module to users)
-    self.reloadButton = qt.QPushButton("Reload")
-    self.reloadButton.toolTip = "Reload this module."
-    self.reloadButton.name = "DICOMAnnotations Reload"
-    reloadFormLayout.addWidget(self.reloadButton)
-    self.reloadButton.connect('clicked()', self.onReload)
-
-    # reload and test button
-    # (use this during development, but remove it when delivering
-    #  your module to users)
-    self.reloadAndTestButton = qt.QPushButton("Reload and Test")
-    self.reloadAndTestButton.toolTip = "Reload this module and then run the self tests."
-    reloadFormLayout.addWidget(self.reloadAndTestButton)
-    self.reloadAndTestButton.connect('clicked()', self.onReloadAndTest)
-
-    #
-    # Parameters Area
-    #
-    parametersCollapsibleButton = ctk.ctkCollapsibleButton()
-    parametersCollapsibleButton.text = "Parameters"
-    self.layout.addWidget(parametersCollapsibleButton)
-
-    # Layout within the dummy collapsible button
-    parametersFormLayout = qt.QFormLayout(parametersCollapsibleButton)
-
-    #
-    # DICOM Annotations Checkbox
-    #
-    self.dicomAnnotationsCheckBox = qt.QCheckBox('DICOM Slice Annotations')
-    parametersFormLayout.addRow(self.dicomAnnotationsCheckBox)
-
-    #
-    # Corner Annotations Activation Checkboxes
-    #
-    self.cornerActivationsGroupBox = ctk.ctkCollapsibleGroupBox()
-    self.cornerActivationsGroupBox.setTitle('Active Corners')
-    self.cornerActivationsGroupBox.enabled = False
-    parametersFormLayout.addRow(self.cornerActivationsGroupBox)
-    cornerActionHBoxLayout = qt.QHBoxLayout(self.cornerActivationsGroupBox)
-
-    self.cornerActivationCheckbox = []
-
-    for i in xrange(4):
-      self.cornerActivationCheckbox.append(qt.QCheckBox())
-      self.cornerActivationCheckbox[i].checked = True
-      cornerActionHBoxLayout.addWidget(self.cornerActivationCheckbox[i])
-      self.cornerActivationCheckbox[i].connect('clicked()', self.updateSliceViewFromGUI)
-
-    self.cornerActivationCheckbox[0].setText('Top Left')
-    self.cornerActivationCheckbox[1].setText('Top Right')
-    self.cornerActivationCheckbox[2].setText('Bottom Left')
-    self.cornerActivationCheckbox[3].setText('Bottom Right')
-
-    #
-    # Corner Annotations Font Properties
-    #
-    self.fontPropertiesGroupBox = ctk.ctkCollapsibleGroupBox()
-    self.fontPropertiesGroupBox.setTitle('Font Properties')
-    self.fontPropertiesGroupBox.enabled = False
-    parametersFormLayout.addRow(self.fontPropertiesGroupBox)
-    fontPropertiesHBoxLayout = qt.QHBoxLayout(self.fontPropertiesGroupBox)
-
-    fontFamilyLabel = qt.QLabel('Font Family: ')
-    fontPropertiesHBoxLayout.addWidget(fontFamilyLabel)
-    self.timesFontRadioButton = qt.QRadioButton('Times')
-    fontPropertiesHBoxLayout.addWidget(self.timesFontRadioButton)
-    self.timesFontRadioButton.connect('clicked()', self.updateSliceViewFromGUI)
-    self.timesFontRadioButton.checked = True
-    self.arialFontRadioButton = qt.QRadioButton('Arial')
-    self.arialFontRadioButton.connect('clicked()', self.updateSliceViewFromGUI)
-    fontPropertiesHBoxLayout.addWidget(self.arialFontRadioButton)
-
-    fontSizeLabel = qt.QLabel('Font Size: ')
-    fontPropertiesHBoxLayout.addWidget(fontSizeLabel)
-    self.fontSizeSpinBox = qt.QSpinBox()
-    self.fontSizeSpinBox.setMinimum(10)
-    self.fontSizeSpinBox.setMaximum(20)
-    self.fontSizeSpinBox.value = 14
-    fontPropertiesHBoxLayout.addWidget(self.fontSizeSpinBox)
-    self.fontSizeSpinBox.connect('valueChanged(int)', self.updateSliceViewFromGUI)
-
-    # connections
-
-    # Add vertical spacer
-    self.layout.addStretch(1)
-    self.dicomAnnotationsCheckBox.connect('clicked()', self.updateSliceViewFromGUI)
-
-  def cleanup(self):
-    pass
-
-  def updateSliceViewFromGUI(self):
-    #print 'update sliceview from gui'
-
-    # Create corner annotations if have not created already
-    if len(self.sliceCornerAnnotations.items()) == 0:
-      self.createCornerAnnotations()
-
-    if self.timesFontRadioButton.checked:
-      fontFamily = 'Times'
-    else:
-      fontFamily = 'Arial'
-
-    fontSize = self.fontSizeSpinBox.value
-
-    for sliceViewName in self.sliceViewNames:
-      cornerAnnotation = self.sliceCornerAnnotations[sliceViewName]
-      cornerAnnotation.SetMaximumFontSize(fontSize)
-      cornerAnnotation.SetMinimumFontSize(fontSize)
-      textProperty = cornerAnnotation.GetTextProperty()
-      if fontFamily == 'Times':
-        textProperty.SetFontFamilyToTimes()
-      else:
-        textProperty.SetFontFamilyToArial()
-
-    if self.cornerActivationCheckbox[0].checked:
-      self.topLeftAnnotationDisplay = True
-    else:
-      self.topLeftAnnotationDisplay = False
-
-    if self.cornerActivationCheckbox[1].checked:
-      self.topRightAnnotationDisplay = True
-    else:
-      self.topRightAnnotationDisplay = False
-
-    if self.cornerActivationCheckbox[2].checked:
-      self.bottomLeftAnnotationDisplay = True
-    else:
-      self.bottomLeftAnnotationDisplay = False
-
-    if self.cornerActivationCheckbox[3].checked:
-      self.bottomRightAnnotationDisplay = True
-    else:
-      self.bottomRightAnnotationDisplay = False
-
-    if self.dicomAnnotationsCheckBox.checked:
-      self.cornerActivationsGroupBox.enabled = True
-      self.fontPropertiesGroupBox.enabled = True
-
-      for sliceViewName in self.sliceViewNames:
-        sliceWidget = self.layoutManager.sliceWidget(sliceViewName)
-        sl = sliceWidget.sliceLogic()
-        #bl =sl.GetBackgroundLayer()
-        self.foo2(sl)
-    else:
-      self.cornerActivationsGroupBox.enabled = False
-      self.fontPropertiesGroupBox.enabled = False
-
-      for sliceViewName in self.sliceViewNames:
-        self.sliceCornerAnnotations[sliceViewName].SetText(0, "")
-        self.sliceCornerAnnotations[sliceViewName].SetText(1, "")
-        self.sliceCornerAnnotations[sliceViewName].SetText(2, "")
-        self.sliceCornerAnnotations[sliceViewName].SetText(3, "")
-        self.sliceViews[sliceViewName].scheduleRender()
-
-  def createCornerAnnotations(self):
-
-    #print 'create corner annotations'
-    self.sliceViewNames = []
-    self.sliceWidgets = {}
-    self.sliceViews = {}
-    self.blNodeObserverTag = {}
-    self.sliceLogicObserverTag = {}
-    self.sliceCornerAnnotations = {}
-
-    sliceViewNames = self.layoutManager.sliceViewNames()
-
-    for sliceViewName in sliceViewNames:
-      self.sliceViewNames.append(sliceViewName)
-    for sliceViewName in self.sliceViewNames:
-      self.addObserver(sliceViewName)
-
-  def addObserver(self, sliceViewName):
-    sliceWidget = self.layoutManager.sliceWidget(sliceViewName)
-    self.sliceWidgets[sliceViewName] = sliceWidget
-    sliceView = sliceWidget.sliceView()
-    self.sliceViews[sliceViewName] = sliceView
-    self.sliceCornerAnnotations[sliceViewName] = sliceView.cornerAnnotation()
-    sliceLogic = sliceWidget.sliceLogic()
-
-    self.sliceLogicObserverTag[sliceViewName] = sliceLogic.AddObserver(vtk.vtkCommand.ModifiedEvent, 
-                                              self.updateCornerAnnotations)
-
-  def updateCornerAnnotations(self,caller,event):
-
-    sliceViewNames = self.layoutManager.sliceViewNames()
-    for sliceViewName in sliceViewNames:
-      if sliceViewName not in self.sliceViewNames:
-        self.sliceViewNames.append(sliceViewName)
-        self.addObserver(sliceViewName)
-        self.updateSliceViewFromGUI()
-
-    self.foo2(caller)
-
-  def sliceLogicModifiedEvent(self, caller, event):
-    self.updateLayersAnnotation(caller)
-
-  def makeAnnotationText(self, sliceLogic):
-
-    backgroundLayer = sliceLogic.GetBackgroundLayer()
-    foregroundLayer = sliceLogic.GetForegroundLayer()
-
-    sliceNode = backgroundLayer.GetSliceNode()
-    sliceViewName = sliceNode.GetLayoutName()
-    self.currentSliceViewName = sliceNode.GetLayoutName()
-
-    backgroundVolume = backgroundLayer.GetVolumeNode()
-
-    backgroundVolumeNode = backgroundLayer.GetVolumeNode()
-    if backgroundVolumeNode:
-      self.foo2(sliceLogic,backgroundVolumeNode,'background')
-    else:
-      self.backgroundVolumeName = 'None'
-      self.backgroundDicomDic = {}
-      self.topLeftLines =  ['']*7
-      self.topRightLines =  ['']*5
-
-    foregroundVolumeNode = foregroundLayer.GetVolumeNode()
-    if foregroundVolumeNode:
-      self.foo2(sliceLogic,foregroundVolumeNode,'foreground')
-    else:
-      self.foregroundVolumeName = 'None'
-      self.foregroundDicomDic = {}
-      self.topLeftLines =  ['']*7
-      self.topRightLines =  ['']*5
-
-    labelLayer = sliceLogic.GetLabelLayer()
-    labelVolumeNode = labelLayer.GetVolumeNode()
-    if labelVolumeNode:
-      self.foo2(sliceLogic,labelVolumeNode,'label')
-    else:
-      self.labelVolumeName = 'None'
-
-  def foo2(self, sliceLogic):
-
-    #print 'foo2'
-    self.resetTexts()
-    sliceCompositeNode = sliceLogic.GetSliceCompositeNode()
-
-    backgroundLayer = sliceLogic.GetBackgroundLayer()
-    foregroundLayer = sliceLogic.GetForegroundLayer()
-    labelLayer = sliceLogic.GetLabelLayer()
-
-    backgroundVolume = backgroundLayer.GetVolumeNode()
-    foregroundVolume = foregroundLayer.GetVolumeNode()
-    labelVolume = labelLayer.GetVolumeNode()
-
-    sliceNode = backgroundLayer.GetSliceNode()
-    sliceViewName = sliceNode.GetLayoutName()
-    self.currentSliceViewName = sliceNode.GetLayoutName()
-
-    # Both background and foregraound
-    if ( backgroundVolume != None and foregroundVolume != None):
-      foregroundOpacity = sliceCompositeNode.GetForegroundOpacity()
-      backgroundVolumeName = backgroundVolume.GetName()
-      foregroundVolumeName = foregroundVolume.GetName()
-      self.cornerTexts[0]['3-Background'] = 'B: ' + backgroundVolumeName
-      self.cornerTexts[0]['2-Foreground'] = 'F: ' + foregroundVolumeName +  ' (' + str(
-                    "%.1f"%foregroundOpacity) + ')'
-
-      bgUids = backgroundVolume.GetAttribute('DICOM.instanceUIDs')
-      fgUids = foregroundVolume.GetAttribute('DICOM.instanceUIDs')
-      if (bgUids and fgUids):
-        bgUid = bgUids.partition(' ')[0]
-        fgUid = fgUids.partition(' ')[0]
-        self.foo4(bgUid,fgUid)
-      else:
-        for key in self.cornerTexts[2]:
-          self.cornerTexts[2][key] = ''
-
-    # Only background
-    elif (backgroundVolume != None):
-      #print 'only bg is present'
-      backgroundVolumeName = backgroundVolume.GetName()
-      if self.bottomLeftAnnotationDisplay:
-        self.cornerTexts[0]['3-Background'] = 'B: ' + backgroundVolumeName
-
-      if self.topLeftAnnotationDisplay:
-        uids = backgroundVolume.GetAttribute('DICOM.instanceUIDs')
-        if uids:
-          uid = uids.partition(' ')[0]
-          self.foo4(uid,None)
-
-    # Only foreground
-    elif (foregroundVolume != None):
-      if self.bottomLeftAnnotationDisplay:
-        foregroundVolumeName = foregroundVolume.GetName()
-        self.cornerTexts[0]['2-Foreground'] = 'F: ' + foregroundVolumeName
-
-      if self.topLeftAnnotationDisplay:
-        uids = foregroundVolume.GetAttribute('DICOM.instanceUIDs')
-        if uids:
-          uid = uids.partition(' ')[0]
-          # passed UID as bg
-          self.foo4(uid,None)
-
-    if (labelVolume != None):
-      labelOpacity = sliceCompositeNode.GetLabelOpacity()
-      labelVolumeName = labelVolume.GetName()
-      self.cornerTexts[0]['1-Label'] = 'L: ' + labelVolumeName + ' (' + str(
-                    "%.1f"%labelOpacity) + ')'
-
-    self.drawCornerAnnotations()
-    #labelOpacity = sliceCompositeNode.GetLabelOpacity()
-
-  def foo4(self,bgUid,fgUid):
-
-    if fgUid != None and bgUid != None:
-      backgroundDicomDic = self.extractDICOMValues(bgUid)
-      foregroundDicomDic = self.extractDICOMValues(fgUid)
-      # check if background and foreground are from different patients
-      # and remove the annotations
-      if backgroundDicomDic['Patient Name'] != foregroundDicomDic['Patient Name'
-          ] or backgroundDicomDic['Patient ID'] != foregroundDicomDic['Patient ID'
-            ] or backgroundDicomDic['Patient Birth Date'] != foregroundDicomDic['Patient Birth Date']:
-            for key in self.cornerTexts[2]:
-              self.cornerTexts[2][key] = ''
-      else:
-        self.cornerTexts[2]['1-PatientName'] = backgroundDicomDic['Patient Name'].replace('^',', ')
-        self.cornerTexts[2]['2-PatientID'] = 'ID: ' + backgroundDicomDic['Patient ID']
-        backgroundDicomDic['Patient Birth Date'] = self.formatDICOMDate(backgroundDicomDic['Patient Birth Date'])
-        self.cornerTexts[2]['3-PatientInfo'] = self.makePatientInfo(backgroundDicomDic)
-
-        if (backgroundDicomDic['Study Date'] != foregroundDicomDic['Study Date']):
-          self.cornerTexts[2]['4-Bg-StudyDate'] = 'B: ' + self.formatDICOMDate(backgroundDicomDic['Study Date'])
-          self.cornerTexts[2]['5-Fg-StudyDate'] = 'F: ' + self.formatDICOMDate(foregroundDicomDic['Study Date'])
-        else:
-          self.cornerTexts[2]['4-Bg-StudyDate'] =  self.formatDICOMDate(backgroundDicomDic['Study Date'])
-
-        if (backgroundDicomDic['Study Time'] != foregroundDicomDic['Study Time']):
-          self.cornerTexts[2]['6-Bg-StudyTime'] = 'B: ' + self.formatDICOMTime(backgroundDicomDic['Study Time'])
-          self.cornerTexts[2]['7-Fg-StudyTime'] = 'F: ' + self.formatDICOMTime(foregroundDicomDic['Study Time'])
-        else:
-          self.cornerTexts[2]['6-Bg-StudyTime'] = self.formatDICOMTime(backgroundDicomDic['Study Time'])
-
-        if (backgroundDicomDic['Series Description'] != foregroundDicomDic['Series Description']):
-          self.cornerTexts[2]['8-Bg-SeriesDescription'] = 'B: ' + backgroundDicomDic['Series Description']
-          self.cornerTexts[2]['9-Fg-SeriesDescription'] = 'F: ' + foregroundDicomDic['Series Description']
-        else:
-          self.cornerTexts[2]['8-Bg-SeriesDescription'] = backgroundDicomDic['Series Description']
-
-    # Only Background or Only Foreground
-    else:
-      uid = bgUid
-      dicomDic = self.extractDICOMValues(uid)
-      self.cornerTexts[2]['1-PatientName'] = dicomDic['Patient Name'].replace('^',', ')
-      self.cornerTexts[2]['2-PatientID'] = 'ID: ' + dicomDic ['Patient ID']
-      dicomDic['Patient Birth Date'] = self.formatDICOMDate(dicomDic['Patient Birth Date'])
-      self.cornerTexts[2]['3-PatientInfo'] = self.makePatientInfo(dicomDic)
-      self.cornerTexts[2]['4-Bg-StudyDate']  = self.formatDICOMDate(dicomDic['Study Date'])
-      self.cornerTexts[2]['6-Bg-StudyTime'] = self.formatDICOMTime(dicomDic['Study Time'])
-      self.cornerTexts[2]['8-Bg-SeriesDescription'] = dicomDic['Series Description']
-
-      if (self.sliceWidgets[self.currentSliceViewName].width > 600 and self.topRightAnnotationDisplay):
-        self.cornerTexts[3]['1-Institution-Name'] = dicomDic['Institution Name']
-        self.cornerTexts[3]['2-Referring-Phisycian'] = dicomDic['Referring Physician Name'].replace('^',', ')
-        self.cornerTexts[3]['3-Manufacturer'] = dicomDic['Manufacturer']
-        self.cornerTexts[3]['4-Model'] = dicomDic['Model']
-        self.cornerTexts[3]['5-Patient-Position'] = dicomDic['Patient Position']
-
-      # Bottom Right Corner Annotations:
-      # Modality Specific and Image Comments
-      #
-      if self.bottomRightAnnotationDisplay:
-        modality = dicomDic['Modality']
-        if modality == 'MR':
-         self.cornerTexts[1]['1-TR']  = 'TR ' + dicomDic['Repetition Time']
-         self.cornerTexts[1]['2-TE'] = 'TE ' + dicomDic['Echo Time']
-  
-  def makePatientInfo(self,dicomDic):
-    # This will give an string of patient's birth date,
-    # patient's age and sex
-    patientInfo = dicomDic['Patient Birth Date'
-          ] + ', ' + dicomDic['Patient Age'
-              ] + ', ' + dicomDic['Patient Sex']
-    return patientInfo
-
-  def formatDICOMDate(self, date):
-      return date[4:6] + '/' + date[6:]+ '/' + date[:4]
-
-  def formatDICOMTime(self, time):
-    studyH = time[:2]
-    if int(studyH) > 12 :
-      studyH = str (int(studyH) - 12)
-      clockTime = ' PM'
-    else:
-      studyH = studyH
-      clockTime = ' AM'
-    studyM = time[2:4]
-    studyS = time[4:6]
-    return studyH + ':' + studyM  + ':' + studyS +clockTime
-
-  def drawCornerAnnotations(self):
-    cornerAnnotation = ''
-    for i, cornerText in enumerate(self.cornerTexts):
-      keys = sorted(cornerText.keys())
-      cornerAnnotation = ''
-      for key in keys:
-        if ( cornerText[key] != ''):
-          cornerAnnotation = cornerAnnotation+ cornerText[key] + '\n'
-      sliceCornerAnnotation = self.sliceCornerAnnotations[self.currentSliceViewName]
-      sliceCornerAnnotation.SetText(i, cornerAnnotation)
-    self.sliceViews[self.currentSliceViewName].scheduleRender()
-
-  def resetTexts(self):
-    for i, cornerText in enumerate(self.cornerTexts):
-      self.cornerTexts[i] =  dict((k,'') for k,v in cornerText.iteritems())
-
-  def extractDICOMValues(self,uid):
-    p ={}
-    slicer.dicomDatabase.loadInstanceHeader(uid)
-    tags = {
-    "0008,0020": "Study Date",
-    "0008,0030": "Study Time",
-    "0008,0060": "Modality",
-    "0008,0070": "Manufacturer",
-    "0008,0080": "Institution Name",
-    "0008,0090": "Referring Physician Name",
-    "0008,1030": "Study Description",
-    "0008,103e": "Series Description",
-    "0008,1090": "Model",
-    "0010,0010": "Patient Name",
-    "0010,0020": "Patient ID",
-    "0010,0030": "Patient Birth Date",
-    "0010,0040": "Patient Sex",
-    "0010,1010": "Patient Age",
-    "0010,4000": "Patient Comments",
-    "0018,1030": "Protocol Name",
-    "0018,5100": "Patient Position",
-    "0020,0010": "Study ID",
-    "0020,0011": "Series Number",
-    "0020,4000": "Image Comments"
-    }
-    p = self.extractTagValue(p, tags)
-    if self.bottomRightAnnotationDisplay:
-      if p['Modality'] == 'MR':
-        mrTags = {
-        "0018,0080": "Repetition Time",
-        "0018,0081": "Echo Time"
-        }
-        p = self.extractTagValue(p, mrTags)
-      '''
-      These tags are not available in dicom tag cache now
-      if p['Modality'] == 'CT':
-        ctTags = {
-        "0018,0060": "KVP",
-        "0018,1152": "Exposure"
-        }
-        p = self.extractTagValue(p, ctTags)
-      '''
-    return p
-
-  def extractTagValue(self,p,tags):
-    for tag in tags.keys():
-        dump = slicer.dicomDatabase.headerValue(tag)
-        try:
-          value = dump[dump.index('[')+1:dump.index(']')]
-        except ValueError:
-          value = "Unknown"
-        p[tags[tag]] = value
-    return p
-  
-  def onReload(self,moduleName="DICOMAnnotations"):
-    """Generic reload method for any scripted module.
-    ModuleWizard will subsitute correct default moduleName.
-    """
-    globals()[moduleName] = slicer.util.reloadScriptedModule(moduleName)
-
-  def onReloadAndTest(self,moduleName="DICOMAnnotations"):
-    try:
-      self.onReload()
-      evalString = 'globals()["%s"].%sTest()' % (moduleName, moduleName)
-      tester = eval(evalString)
-      tester.runTest()
-    except Exception, e:
-      import traceback
-      traceback.print_exc()
-      qt.QMessageBox.warning(slicer.util.mainWindow(),
-          "Reload and Test", 'Exception!\n\n' + str(e) + "\n\nSee Python Console for Stack Trace")
-
-#
-# DICOMAnnotationsLogic
-#
-
-class DICOMAnnotationsLogic:
-  """This class should implement all the actual
-  computation done by your module.  The interface
-  should be such that other python code can import
-  this class and make use of the functionality without
-  requiring an instance of the Widget
-  """
-  def __init__(self):
-    pass
-
-  def hasImageData(self,volumeNode):
-    """This is a dummy logic method that
-    returns true if the passed in volume
-    node has valid image data
-    """
-    if not volumeNode:
-      print('no volume node')
-      return False
-    if volumeNode.GetImageData() == None:
-      print('no image data')
-      return False
-    return True
-
-  def delayDisplay(self,message,msec=1000):
-    #
-    # logic version of delay display
-    #
-    print(message)
-    self.info = qt.QDialog()
-    self.infoLayout = qt.QVBoxLayout()
-    self.info.setLayout(self.infoLayout)
-    self.label = qt.QLabel(message,self.info)
-    self.infoLayout.addWidget(self.label)
-    qt.QTimer.singleShot(msec, self.info.close)
-    self.info.exec_()
-
-
-class DICOMAnnotationsTest(unittest.TestCase):
-  """
-  This is the test case for your scripted module.
-  """
-
-  def delayDisplay(self,message,msec=1000):
-    """This utility method displays a small dialog and waits.
-    This does two things: 1) it lets the event loop catch up
-    to the state of the test so that rendering and widget updates
-    have all taken place before the test continues and 2) it
-    shows the user/developer/tester the state of the test
-    so that we'll know when it breaks.
-    """
-    print(message)
-    self.info = qt.QDialog()
-    self.infoLayout = qt.QVBoxLayout()
-    self.info.setLayout(self.infoLayout)
-    self.label = qt.QLabel(message,self.info)
-    self.infoLayout.addWidget(self.label)
-    qt.QTimer.singleShot(msec, self.info.close)
-    self.info.exec_()
-
-  def setUp(self):
-    """ Do whatever is needed to reset the state - typically a scene clear will be enough.
-    """
-    slicer.mrmlScene.Clear(0)
-
-  def runTest(self):
-    """Run as few or as many tests as needed here.
-    """
-    self.setUp()
-    self.test_DICOMAnnotations1()
-
-  def test_DICOMAnnotations1(self):
-    """ Ideally you should have several levels of tests.  At the lowest level
-    tests sould exercise the functionality of the logic with different inputs
-    (both valid and invalid).  At higher levels your tests should emulate the
-    way the user would interact with your code and confirm that it still works
-    the way you intended.
-    One of the most important features of the tests is that it should alert other
-    developers when their changes will have an impact on the behavior of your
-    module.  For example, if a developer removes a feature that you depend on,
-    your test should break so they know that the feature is needed.
-    """
-
-    self.delayDisplay("Starting the test")
-    #
-    # first, get some data
-    #
-    import urllib
-    downloads = (
-        ('http://slicer.kitware.com/midas3/download?items=5767', 'FA.nrrd', slicer.util.loadVolume),
-        )
-
-    for url,name,loader in downloads:
-      filePath = slicer.app.temporaryPath + '/' + name
-      if not os.path.exists(filePath) or os.stat(filePath).st_size == 0:
-        print('Requesting download %s from %s...\n' % (name, url))
-        urllib.urlretrieve(url, filePath)
-      if loader:
-        print('Loading %s...\n' % (name,))
-        loader(filePath)
-    self.delayDisplay('Finished with download and loading\n')
-
-    volumeNode = slicer.util.getNode(pattern="FA")
-    logic = DICOMAnnotationsLogic()
-    self.assertTrue( logic.hasImageData(volumeNode) )
-    self.delayDisplay('Test passed!')
+import os
+import sys
+import json
+import time
+import random
+import unittest
+from collections import OrderedDict
+from __main__ import vtk, qt, ctk, slicer
+from DICOMAnnotationsLib import HeaderCache, HeaderReader, HeaderPrefetcher, canReadFiles, hasAllValues
+from DICOMAnnotationsLib import profileContains
+from DICOMAnnotationsLib import InstanceUIDIndex, SlicePositionIndex
+from DICOMAnnotationsLib import AnnotationEngine, AnnotationLayer, PerformanceCounters, EventCapture
+from DICOMAnnotationsLib import ObserverRegistry, PersistentHeaderCache, CornerTemplates
+from DICOMAnnotationsLib import SeriesIdentity, LayerComparison
+from DICOMAnnotationsLib import PixelReadout, formatVoxelValue, voxelIndex
+from DICOMAnnotationsLib import LabelStatistics, sliceAxis, labelCounts
+from DICOMAnnotationsLib.BatchExport import BatchExport
+
+#
+# DICOMAnnotations
+#
+
+class DICOMAnnotations:
+  def __init__(self, parent):
+    parent.title = "DICOM Annotations" # TODO make this more human readable by adding spaces
+    parent.categories = ["Quantification"]
+    parent.dependencies = []
+    parent.contributors = ["Alireza Mehrtash (SPL, BWH), Andrey Fedorov (SPL, BWH), Steve Pieper (Isomics)"]
+    parent.helpText = """
+    The DICOM Annotations module is used to get the useful meta-data information from DICOM images
+    and add display them on the corners of Slice views.
+    """
+    parent.acknowledgementText = """
+    Supported by NIH U01CA151261 (PI Fennessy) and U24 CA180918 (PIs Kikinis and Fedorov).
+    """
+    self.parent = parent
+
+    # Add this test to the SelfTest module's list for discovery when the module
+    # is created.  Since this module may be discovered before SelfTests itself,
+    # create the list if it doesn't already exist.
+    try:
+      slicer.selfTests
+    except AttributeError:
+      slicer.selfTests = {}
+    slicer.selfTests['DICOMAnnotations'] = self.runTest
+
+  def runTest(self):
+    tester = DICOMAnnotationsTest()
+    tester.runTest()
+
+#
+# DICOMAnnotationsWidget
+#
+
+class DICOMAnnotationsWidget:
+  def __init__(self, parent = None):
+    if not parent:
+      self.parent = slicer.qMRMLWidget()
+      self.parent.setLayout(qt.QVBoxLayout())
+      self.parent.setMRMLScene(slicer.mrmlScene)
+    else:
+      self.parent = parent
+    self.layout = self.parent.layout()
+
+    self.backgroundVolumeName = 'None'
+    self.foregroundVolumeName = 'None'
+    self.labelVolumeName = 'None'
+    self.backgroundDicomDic = {}
+    self.foregroundDicomDic = {}
+    self.topLeftLines =  ['']*7
+    self.topRightLines =  ['']*5
+
+    self.topLeftAnnotationDisplay = True
+    self.topRightAnnotationDisplay = True
+    self.bottomLeftAnnotationDisplay = True
+    self.bottomRightAnnotationDisplay = True
+    self.fontFamily = 'Times'
+    self.fontSize = 14
+
+    # Width above which the top right corner is filled in
+    self.topRightWidthThreshold = 600
+
+    # In asynchronous mode slice logic events only mark views as dirty,
+    # and views are updated once per event loop iteration
+    self.asynchronousUpdates = False
+    self.dirtyViews = set()
+    self.waitingViews = {}
+    self.dirtyViewsScheduled = False
+
+    # Slice events during scene batch processing and imports only record
+    # the view, which is updated once when the scene is done
+    self.sceneBatchDepth = 0
+    self.deferredViews = set()
+
+    self.layoutManager = slicer.app.layoutManager()
+    self.sliceViewNames = set()
+    self.sliceViewUpdateScheduled = False
+    self.sliceCornerAnnotations = {}
+    self.performanceCounters = PerformanceCounters()
+    self.performanceTimer = None
+    self.eventCapture = None
+    self.eventCaptureTimer = None
+    self.annotationFingerprints = {}
+    self.lastCornerTexts = {}
+
+    # Voxel values under the cursor, appended to the bottom right corner
+    # of the view the cursor is in at most once per display frame
+    self.pixelReadout = PixelReadout()
+    self.pixelReadouts = {}
+    self.baseCornerTexts = {}
+    self.cursorPosition = None
+    self.pixelReadoutTimer = None
+
+    # Voxel counts of the displayed label slices, reading the label
+    # arrays through the same views as the pixel readout
+    self.labelStatisticsDisplay = True
+    self.labelStatistics = LabelStatistics(self.pixelReadout.arrayView)
+    self.labelVolumeObserverTags = {}
+
+    # Corner texts by fingerprint, shared by views showing the same layers
+    self.sharedCornerTexts = OrderedDict()
+    self.sharedCornerTextsLimit = 256
+
+    # Parsed header values, kept until the DICOM database reports a change
+    self.headerCache = HeaderCache()
+    self.observedDICOMDatabase = None
+    self.headerReader = None
+
+    # Instances whose annotation tags are put in the database tag cache
+    self.precacheCandidates = []
+    self.precacheScheduled = False
+
+    # Optional SQLite file keeping the header values between sessions
+    self.persistentHeaderCache = None
+
+    # Formats the corner texts from the extracted header values. Only
+    # the tags used by the templates of the enabled corners are read from
+    # the headers.
+    self.cornerTemplates = CornerTemplates()
+    self.annotationTags = self.cornerTemplates.headerTags()
+    self.annotationEngine = AnnotationEngine(self.extractDICOMValues, self.cornerTemplates)
+
+    # Headers of newly added DICOM volumes are read ahead of display
+    self.headerPrefetcher = None
+    self.prefetchTimer = None
+    self.prefetchCandidates = []
+
+    # All observers and connections outside of the module panel
+    self.observers = ObserverRegistry()
+
+    # Parsed DICOM.instanceUIDs and slice positions of volume nodes, by node ID
+    self.instanceUIDIndexes = {}
+    self.slicePositionIndexes = {}
+
+    if not parent:
+      self.setup()
+      self.parent.show()
+
+  def setup(self):
+    # Instantiate and connect widgets ...
+
+    #
+    # Reload and Test area
+    #
+    reloadCollapsibleButton = ctk.ctkCollapsibleButton()
+    reloadCollapsibleButton.text = "Reload && Test"
+    self.layout.addWidget(reloadCollapsibleButton)
+    reloadFormLayout = qt.QFormLayout(reloadCollapsibleButton)
+
+    # reload button
+    # (use this during development, but remove it when delivering
+    #  your module to users)
+    self.reloadButton = qt.QPushButton("Reload")
+    self.reloadButton.toolTip = "Reload this module."
+    self.reloadButton.name = "DICOMAnnotations Reload"
+    reloadFormLayout.addWidget(self.reloadButton)
+    self.reloadButton.connect('clicked()', self.onReload)
+
+    # reload and test button
+    # (use this during development, but remove it when delivering
+    #  your module to users)
+    self.reloadAndTestButton = qt.QPushButton("Reload and Test")
+    self.reloadAndTestButton.toolTip = "Reload this module and then run the self tests."
+    reloadFormLayout.addWidget(self.reloadAndTestButton)
+    self.reloadAndTestButton.connect('clicked()', self.onReloadAndTest)
+
+    #
+    # Parameters Area
+    #
+    parametersCollapsibleButton = ctk.ctkCollapsibleButton()
+    parametersCollapsibleButton.text = "Parameters"
+    self.layout.addWidget(parametersCollapsibleButton)
+
+    # Layout within the dummy collapsible button
+    parametersFormLayout = qt.QFormLayout(parametersCollapsibleButton)
+
+    #
+    # DICOM Annotations Checkbox
+    #
+    self.dicomAnnotationsCheckBox = qt.QCheckBox('DICOM Slice Annotations')
+    parametersFormLayout.addRow(self.dicomAnnotationsCheckBox)
+
+    #
+    # Corner Annotations Activation Checkboxes
+    #
+    self.cornerActivationsGroupBox = ctk.ctkCollapsibleGroupBox()
+    self.cornerActivationsGroupBox.setTitle('Active Corners')
+    self.cornerActivationsGroupBox.enabled = False
+    parametersFormLayout.addRow(self.cornerActivationsGroupBox)
+    cornerActionHBoxLayout = qt.QHBoxLayout(self.cornerActivationsGroupBox)
+
+    self.cornerActivationCheckbox = []
+
+    for i in xrange(4):
+      self.cornerActivationCheckbox.append(qt.QCheckBox())
+      self.cornerActivationCheckbox[i].checked = True
+      cornerActionHBoxLayout.addWidget(self.cornerActivationCheckbox[i])
+      self.cornerActivationCheckbox[i].connect('clicked()', self.updateSliceViewFromGUI)
+
+    self.cornerActivationCheckbox[0].setText('Top Left')
+    self.cornerActivationCheckbox[1].setText('Top Right')
+    self.cornerActivationCheckbox[2].setText('Bottom Left')
+    self.cornerActivationCheckbox[3].setText('Bottom Right')
+
+    #
+    # Corner Annotations Font Properties
+    #
+    self.fontPropertiesGroupBox = ctk.ctkCollapsibleGroupBox()
+    self.fontPropertiesGroupBox.setTitle('Font Properties')
+    self.fontPropertiesGroupBox.enabled = False
+    parametersFormLayout.addRow(self.fontPropertiesGroupBox)
+    fontPropertiesHBoxLayout = qt.QHBoxLayout(self.fontPropertiesGroupBox)
+
+    fontFamilyLabel = qt.QLabel('Font Family: ')
+    fontPropertiesHBoxLayout.addWidget(fontFamilyLabel)
+    self.timesFontRadioButton = qt.QRadioButton('Times')
+    fontPropertiesHBoxLayout.addWidget(self.timesFontRadioButton)
+    self.timesFontRadioButton.connect('clicked()', self.updateSliceViewFromGUI)
+    self.timesFontRadioButton.checked = True
+    self.arialFontRadioButton = qt.QRadioButton('Arial')
+    self.arialFontRadioButton.connect('clicked()', self.updateSliceViewFromGUI)
+    fontPropertiesHBoxLayout.addWidget(self.arialFontRadioButton)
+
+    fontSizeLabel = qt.QLabel('Font Size: ')
+    fontPropertiesHBoxLayout.addWidget(fontSizeLabel)
+    self.fontSizeSpinBox = qt.QSpinBox()
+    self.fontSizeSpinBox.setMinimum(10)
+    self.fontSizeSpinBox.setMaximum(20)
+    self.fontSizeSpinBox.value = 14
+    fontPropertiesHBoxLayout.addWidget(self.fontSizeSpinBox)
+    self.fontSizeSpinBox.connect('valueChanged(int)', self.updateSliceViewFromGUI)
+
+    #
+    # Asynchronous Updates Checkbox
+    #
+    self.asynchronousUpdatesCheckBox = qt.QCheckBox('Asynchronous Updates')
+    self.asynchronousUpdatesCheckBox.toolTip = ("Update annotations from the event loop instead of "
+      "inside slice events, reading headers in the background.")
+    parametersFormLayout.addRow(self.asynchronousUpdatesCheckBox)
+    self.asynchronousUpdatesCheckBox.connect('clicked()', self.onAsynchronousUpdatesClicked)
+
+    #
+    # Pixel Readout Checkbox
+    #
+    self.pixelReadoutCheckBox = qt.QCheckBox('Values Under Cursor')
+    self.pixelReadoutCheckBox.toolTip = ("Show the background and foreground values under the "
+      "mouse and the window/level in the bottom right corner.")
+    parametersFormLayout.addRow(self.pixelReadoutCheckBox)
+    self.pixelReadoutCheckBox.connect('clicked()', self.onPixelReadoutClicked)
+    self.pixelReadoutTimer = qt.QTimer()
+    self.pixelReadoutTimer.setSingleShot(True)
+    self.pixelReadoutTimer.setInterval(self.displayFramePeriod())
+    self.observers.connect('timers', self.pixelReadoutTimer, 'timeout()', self.updatePixelReadout)
+
+    #
+    # Label Statistics Checkbox
+    #
+    self.labelStatisticsCheckBox = qt.QCheckBox('Label Statistics')
+    self.labelStatisticsCheckBox.toolTip = ("Show the number of segments, the labeled area and the "
+      "voxel count of each label of the displayed label slice under the label name.")
+    self.labelStatisticsCheckBox.checked = True
+    parametersFormLayout.addRow(self.labelStatisticsCheckBox)
+    self.labelStatisticsCheckBox.connect('clicked()', self.updateSliceViewFromGUI)
+
+    #
+    # Persistent Header Cache
+    #
+    persistentCacheHBoxLayout = qt.QHBoxLayout()
+    parametersFormLayout.addRow(persistentCacheHBoxLayout)
+    self.persistentCacheCheckBox = qt.QCheckBox('Keep Headers Between Sessions')
+    self.persistentCacheCheckBox.toolTip = ("Store the annotation values read from DICOM headers "
+      "in a cache file, so that studies open faster the next time.")
+    persistentCacheHBoxLayout.addWidget(self.persistentCacheCheckBox)
+    self.persistentCacheCheckBox.connect('clicked()', self.onPersistentCacheClicked)
+    self.clearPersistentCacheButton = qt.QPushButton('Clear Cache')
+    self.clearPersistentCacheButton.toolTip = "Delete the header values stored in the cache file."
+    persistentCacheHBoxLayout.addWidget(self.clearPersistentCacheButton)
+    self.clearPersistentCacheButton.connect('clicked()', self.onClearPersistentCache)
+    self.persistentCacheCheckBox.checked = str(
+      qt.QSettings().value('DICOMAnnotations/PersistentHeaderCache')).lower() == 'true'
+    self.onPersistentCacheClicked()
+
+    #
+    # Corner Templates File
+    #
+    self.templatesPathLineEdit = ctk.ctkPathLineEdit()
+    self.templatesPathLineEdit.filters = ctk.ctkPathLineEdit.Files
+    self.templatesPathLineEdit.nameFilters = ['Corner templates (*.json *.yaml *.yml)']
+    self.templatesPathLineEdit.toolTip = ("JSON or YAML file with the lines shown in each corner, "
+      "by modality. The built-in templates are used if empty.")
+    parametersFormLayout.addRow('Templates: ', self.templatesPathLineEdit)
+    templatesPath = qt.QSettings().value('DICOMAnnotations/TemplatesFile')
+    if templatesPath:
+      self.templatesPathLineEdit.currentPath = templatesPath
+      self.loadCornerTemplates(templatesPath)
+    self.templatesPathLineEdit.connect('currentPathChanged(QString)', self.onTemplatesPathChanged)
+
+    #
+    # Performance Area
+    #
+    performanceCollapsibleButton = ctk.ctkCollapsibleButton()
+    performanceCollapsibleButton.text = "Performance"
+    performanceCollapsibleButton.collapsed = True
+    self.layout.addWidget(performanceCollapsibleButton)
+    performanceFormLayout = qt.QFormLayout(performanceCollapsibleButton)
+
+    self.performanceCountersCheckBox = qt.QCheckBox('Collect Timings')
+    self.performanceCountersCheckBox.toolTip = "Count and time the stages of the annotation updates."
+    performanceFormLayout.addRow(self.performanceCountersCheckBox)
+    self.performanceCountersCheckBox.connect('clicked()', self.onPerformanceCountersClicked)
+
+    self.performanceTable = qt.QTableWidget()
+    self.performanceTable.setColumnCount(4)
+    self.performanceTable.setHorizontalHeaderLabels(['Stage', 'Calls', 'Total (ms)', 'Max (ms)'])
+    performanceFormLayout.addRow(self.performanceTable)
+
+    performanceButtonsHBoxLayout = qt.QHBoxLayout()
+    performanceFormLayout.addRow(performanceButtonsHBoxLayout)
+    self.resetPerformanceButton = qt.QPushButton("Reset")
+    self.resetPerformanceButton.toolTip = "Clear the counters."
+    performanceButtonsHBoxLayout.addWidget(self.resetPerformanceButton)
+    self.resetPerformanceButton.connect('clicked()', self.onResetPerformanceCounters)
+    self.exportPerformanceButton = qt.QPushButton("Export...")
+    self.exportPerformanceButton.toolTip = "Save the counters to a JSON file."
+    performanceButtonsHBoxLayout.addWidget(self.exportPerformanceButton)
+    self.exportPerformanceButton.connect('clicked()', self.onExportPerformanceCounters)
+
+    self.performanceTimer = qt.QTimer()
+    self.performanceTimer.setInterval(1000)
+    self.observers.connect('timers', self.performanceTimer, 'timeout()', self.refreshPerformanceTable)
+
+    captureHBoxLayout = qt.QHBoxLayout()
+    performanceFormLayout.addRow('Capture: ', captureHBoxLayout)
+    self.captureModeComboBox = qt.QComboBox()
+    self.captureModeComboBox.addItems(['Profile', 'Trace'])
+    self.captureModeComboBox.toolTip = "cProfile statistics or Chrome trace events"
+    captureHBoxLayout.addWidget(self.captureModeComboBox)
+    self.captureEventsSpinBox = qt.QSpinBox()
+    self.captureEventsSpinBox.setRange(1, 100000)
+    self.captureEventsSpinBox.value = 500
+    self.captureEventsSpinBox.suffix = ' events'
+    captureHBoxLayout.addWidget(self.captureEventsSpinBox)
+    self.captureSecondsSpinBox = qt.QSpinBox()
+    self.captureSecondsSpinBox.setRange(1, 86400)
+    self.captureSecondsSpinBox.value = 60
+    self.captureSecondsSpinBox.suffix = ' s'
+    captureHBoxLayout.addWidget(self.captureSecondsSpinBox)
+    self.captureSamplingSpinBox = qt.QSpinBox()
+    self.captureSamplingSpinBox.setRange(1, 1000)
+    self.captureSamplingSpinBox.value = 1
+    self.captureSamplingSpinBox.prefix = 'every '
+    self.captureSamplingSpinBox.toolTip = "Capture only every n-th event"
+    captureHBoxLayout.addWidget(self.captureSamplingSpinBox)
+    self.captureButton = qt.QPushButton("Capture")
+    self.captureButton.toolTip = "Capture the annotation callbacks to a file in the temporary directory."
+    self.captureButton.checkable = True
+    captureHBoxLayout.addWidget(self.captureButton)
+    self.captureButton.connect('toggled(bool)', self.onCaptureToggled)
+    # ends time limited captures in idle sessions, where no event would
+    self.eventCaptureTimer = qt.QTimer()
+    self.eventCaptureTimer.setSingleShot(True)
+    self.observers.connect('timers', self.eventCaptureTimer, 'timeout()', self.stopEventCapture)
+
+    # connections
+
+    # Add vertical spacer
+    self.layout.addStretch(1)
+    self.dicomAnnotationsCheckBox.connect('clicked()', self.updateSliceViewFromGUI)
+
+    self.prefetchTimer = qt.QTimer()
+    self.prefetchTimer.setInterval(20)
+    self.observers.connect('timers', self.prefetchTimer, 'timeout()', self.onPrefetchTimeout)
+    self.observers.addObserver('scene', slicer.mrmlScene,
+      slicer.vtkMRMLScene.NodeAddedEvent, self.onNodeAdded)
+    self.observers.addObserver('scene', slicer.mrmlScene,
+      slicer.vtkMRMLScene.NodeRemovedEvent, self.onNodeRemoved)
+    for event in (slicer.vtkMRMLScene.StartBatchProcessEvent, slicer.vtkMRMLScene.StartImportEvent):
+      self.observers.addObserver('scene', slicer.mrmlScene, event, self.onSceneBatchStarted)
+    for event in (slicer.vtkMRMLScene.EndBatchProcessEvent, slicer.vtkMRMLScene.EndImportEvent):
+      self.observers.addObserver('scene', slicer.mrmlScene, event, self.onSceneBatchEnded)
+    if self.layoutManager:
+      self.observers.connect('layout', self.layoutManager, 'layoutChanged(int)', self.onLayoutChanged)
+    # register the annotation tags before the next import
+    self.observeDICOMDatabase()
+
+  def cleanup(self):
+    self.observers.removeAll()
+    self.instanceUIDIndexes = {}
+    self.slicePositionIndexes = {}
+    self.sliceLogicObserverTag = {}
+    self.sliceLogics = {}
+    self.observedDICOMDatabase = None
+    if self.prefetchTimer:
+      self.prefetchTimer.stop()
+    if self.performanceTimer:
+      self.performanceTimer.stop()
+    self.stopEventCapture()
+    if self.pixelReadoutTimer:
+      self.pixelReadoutTimer.stop()
+    self.pixelReadout.clear()
+    self.labelStatistics.clear()
+    self.labelVolumeObserverTags = {}
+    if self.headerPrefetcher:
+      self.headerPrefetcher.shutdown()
+      self.headerPrefetcher = None
+    if self.persistentHeaderCache is not None:
+      self.persistentHeaderCache.close()
+
+  def updateSliceViewFromGUI(self):
+    if self.eventCapture:
+      self.eventCapture.call('updateSliceViewFromGUI', dict, self.applySliceViewSettings)
+    else:
+      self.applySliceViewSettings()
+
+  def applySliceViewSettings(self):
+    #print 'update sliceview from gui'
+
+    # Create corner annotations if have not created already
+    if self.dicomAnnotationsCheckBox.checked and len(self.sliceCornerAnnotations.items()) == 0:
+      self.createCornerAnnotations()
+      # the cursor is observed again if it was while annotations were off
+      self.onPixelReadoutClicked()
+      # volumes added while annotations were off were not read ahead
+      self.prefetchSceneVolumes()
+
+    if self.timesFontRadioButton.checked:
+      fontFamily = 'Times'
+    else:
+      fontFamily = 'Arial'
+
+    fontSize = self.fontSizeSpinBox.value
+    self.fontFamily = fontFamily
+    self.fontSize = fontSize
+
+    for sliceViewName in self.sliceViewNames:
+      cornerAnnotation = self.sliceCornerAnnotations[sliceViewName]
+      cornerAnnotation.SetMaximumFontSize(fontSize)
+      cornerAnnotation.SetMinimumFontSize(fontSize)
+      textProperty = cornerAnnotation.GetTextProperty()
+      if fontFamily == 'Times':
+        textProperty.SetFontFamilyToTimes()
+      else:
+        textProperty.SetFontFamilyToArial()
+
+    if self.cornerActivationCheckbox[0].checked:
+      self.topLeftAnnotationDisplay = True
+    else:
+      self.topLeftAnnotationDisplay = False
+
+    if self.cornerActivationCheckbox[1].checked:
+      self.topRightAnnotationDisplay = True
+    else:
+      self.topRightAnnotationDisplay = False
+
+    if self.cornerActivationCheckbox[2].checked:
+      self.bottomLeftAnnotationDisplay = True
+    else:
+      self.bottomLeftAnnotationDisplay = False
+
+    if self.cornerActivationCheckbox[3].checked:
+      self.bottomRightAnnotationDisplay = True
+    else:
+      self.bottomRightAnnotationDisplay = False
+
+    self.labelStatisticsDisplay = self.labelStatisticsCheckBox.checked
+
+    self.setAnnotationTags(self.cornerTemplates.headerTags(self.enabledCorners()))
+
+    if self.dicomAnnotationsCheckBox.checked:
+      self.cornerActivationsGroupBox.enabled = True
+      self.fontPropertiesGroupBox.enabled = True
+
+      for sliceViewName in self.sliceViewNames:
+        sliceWidget = self.layoutManager.sliceWidget(sliceViewName)
+        sl = sliceWidget.sliceLogic()
+        #bl =sl.GetBackgroundLayer()
+        fingerprint = self.annotationFingerprint(sl)
+        self.annotationFingerprints[sliceViewName] = fingerprint
+        self.foo2(sl, fingerprint)
+    else:
+      self.cornerActivationsGroupBox.enabled = False
+      self.fontPropertiesGroupBox.enabled = False
+      self.annotationFingerprints = {}
+
+      for sliceViewName in self.sliceViewNames:
+        self.setCornerTexts(sliceViewName, ['']*4)
+
+      # slice and cursor events are not observed until annotations are
+      # turned on again
+      self.observers.removeGroup('sliceLogic')
+      self.observers.removeGroup('crosshair')
+      self.pixelReadoutTimer.stop()
+      self.cursorPosition = None
+      self.pixelReadouts = {}
+      self.baseCornerTexts = {}
+      self.sliceViewNames = set()
+      self.sliceLogicObserverTag = {}
+      self.sliceLogics = {}
+      self.sliceCornerAnnotations = {}
+
+  def createCornerAnnotations(self):
+
+    #print 'create corner annotations'
+    self.observers.removeGroup('sliceLogic')
+    self.sliceViewNames = set()
+    self.sliceWidgets = {}
+    self.sliceViews = {}
+    self.sliceLogics = {}
+    self.blNodeObserverTag = {}
+    self.sliceLogicObserverTag = {}
+    self.sliceCornerAnnotations = {}
+    self.annotationFingerprints = {}
+    self.lastCornerTexts = {}
+
+    sliceViewNames = self.layoutManager.sliceViewNames()
+
+    for sliceViewName in sliceViewNames:
+      self.sliceViewNames.add(sliceViewName)
+    for sliceViewName in self.sliceViewNames:
+      self.addObserver(sliceViewName)
+
+  def addObserver(self, sliceViewName):
+    sliceWidget = self.layoutManager.sliceWidget(sliceViewName)
+    self.sliceWidgets[sliceViewName] = sliceWidget
+    sliceView = sliceWidget.sliceView()
+    self.sliceViews[sliceViewName] = sliceView
+    self.sliceCornerAnnotations[sliceViewName] = sliceView.cornerAnnotation()
+    sliceLogic = sliceWidget.sliceLogic()
+    self.sliceLogics[sliceViewName] = sliceLogic
+
+    self.sliceLogicObserverTag[sliceViewName] = self.observers.addObserver('sliceLogic', sliceLogic,
+                                              vtk.vtkCommand.ModifiedEvent, self.updateCornerAnnotations)
+
+  def removeObserver(self, sliceViewName):
+    """Stop observing a slice view and drop everything kept for it."""
+    self.sliceViewNames.discard(sliceViewName)
+    sliceLogic = self.sliceLogics.pop(sliceViewName, None)
+    tag = self.sliceLogicObserverTag.pop(sliceViewName, None)
+    if sliceLogic:
+      self.observers.removeObserver(sliceLogic, tag)
+    for views in (self.sliceWidgets, self.sliceViews, self.sliceCornerAnnotations,
+        self.annotationFingerprints, self.lastCornerTexts, self.waitingViews,
+        self.baseCornerTexts, self.pixelReadouts):
+      views.pop(sliceViewName, None)
+    self.dirtyViews.discard(sliceViewName)
+    self.deferredViews.discard(sliceViewName)
+
+  def scheduleSliceViewsUpdate(self):
+    # slice widgets are created and destroyed after their slice nodes
+    # and layout change signals, so look at them on the next event loop
+    # iteration
+    if not self.sliceViewUpdateScheduled:
+      self.sliceViewUpdateScheduled = True
+      qt.QTimer.singleShot(0, self.updateSliceViews)
+
+  def updateSliceViews(self):
+    """Observe the slice views that were created and release the ones
+    that were destroyed since the last call."""
+    self.sliceViewUpdateScheduled = False
+    if not self.dicomAnnotationsCheckBox.checked or not self.sliceCornerAnnotations:
+      # views are picked up when annotations are turned on
+      return
+    sliceViewNames = set([sliceViewName for sliceViewName in self.layoutManager.sliceViewNames()
+      if self.layoutManager.sliceWidget(sliceViewName)])
+    for sliceViewName in self.sliceViewNames - sliceViewNames:
+      self.removeObserver(sliceViewName)
+    addedViewNames = sliceViewNames - self.sliceViewNames
+    for sliceViewName in addedViewNames:
+      self.sliceViewNames.add(sliceViewName)
+      self.addObserver(sliceViewName)
+    if addedViewNames:
+      self.updateSliceViewFromGUI()
+
+  def onSceneBatchStarted(self, caller, event):
+    self.sceneBatchDepth += 1
+
+  def onSceneBatchEnded(self, caller, event):
+    # imports are also batch processed, so batches can be nested
+    self.sceneBatchDepth = max(0, self.sceneBatchDepth - 1)
+    if self.sceneBatchDepth:
+      return
+    deferredViews, self.deferredViews = self.deferredViews, set()
+    for sliceViewName in deferredViews:
+      sliceLogic = self.sliceLogics.get(sliceViewName)
+      if sliceLogic:
+        self.updateSliceLogicAnnotations(sliceLogic)
+
+  def onLayoutChanged(self, layout):
+    self.scheduleSliceViewsUpdate()
+
+  def updateCornerAnnotations(self,caller,event):
+    startTime = self.performanceCounters.start()
+    if self.eventCapture:
+      self.eventCapture.call('updateCornerAnnotations', lambda: self.eventDetails(caller),
+        self.updateSliceLogicAnnotations, caller)
+    else:
+      self.updateSliceLogicAnnotations(caller)
+    self.performanceCounters.stop('Observer dispatch', startTime)
+
+  def updateSliceLogicAnnotations(self, caller):
+    sliceViewName = caller.GetSliceNode().GetLayoutName()
+    if self.sceneBatchDepth:
+      self.deferredViews.add(sliceViewName)
+      return
+    if self.cursorPosition and self.cursorPosition[0] == sliceViewName:
+      # the slice moved under the cursor
+      if not self.pixelReadoutTimer.isActive():
+        self.pixelReadoutTimer.start()
+    if self.asynchronousUpdates:
+      self.markViewsDirty([sliceViewName])
+      return
+
+    # Slice offset, pan and zoom changes also modify the slice logic but
+    # cannot change the annotation text
+    fingerprint = self.annotationFingerprint(caller)
+    if self.annotationFingerprints.get(sliceViewName) == fingerprint:
+      return
+    self.annotationFingerprints[sliceViewName] = fingerprint
+
+    self.foo2(caller, fingerprint)
+
+  def onAsynchronousUpdatesClicked(self):
+    self.asynchronousUpdates = self.asynchronousUpdatesCheckBox.checked
+
+  def markViewsDirty(self, sliceViewNames):
+    """Queue the views for an update on the next event loop iteration.
+    Any number of events before then result in a single update per view.
+    """
+    self.dirtyViews.update(sliceViewNames)
+    if not self.dirtyViewsScheduled:
+      self.dirtyViewsScheduled = True
+      qt.QTimer.singleShot(0, self.processDirtyViews)
+
+  def processDirtyViews(self):
+    self.dirtyViewsScheduled = False
+    dirtyViews, self.dirtyViews = self.dirtyViews, set()
+    for sliceViewName in dirtyViews:
+      sliceWidget = self.sliceWidgets.get(sliceViewName)
+      if not sliceWidget:
+        continue
+      sliceLogic = sliceWidget.sliceLogic()
+      fingerprint = self.annotationFingerprint(sliceLogic)
+      if self.annotationFingerprints.get(sliceViewName) == fingerprint:
+        self.waitingViews.pop(sliceViewName, None)
+        continue
+      if fingerprint not in self.sharedCornerTexts and self.headerPrefetcher:
+        missingUids = [uid for uid in self.requiredInstanceUIDs(sliceLogic)
+          if uid not in self.headerCache]
+        if missingUids:
+          # the view is updated when the prefetcher delivers the headers
+          if self.waitingViews.get(sliceViewName) != missingUids:
+            # headers requested for an earlier state of the view are no longer needed
+            self.headerPrefetcher.cancel(sliceViewName)
+            self.headerPrefetcher.submit(sliceViewName, missingUids)
+            self.waitingViews[sliceViewName] = missingUids
+            self.prefetchTimer.start()
+          continue
+      self.waitingViews.pop(sliceViewName, None)
+      self.annotationFingerprints[sliceViewName] = fingerprint
+      self.foo2(sliceLogic, fingerprint)
+
+  def requiredInstanceUIDs(self, sliceLogic):
+    """Return the UIDs of the instances whose headers are needed for the
+    corner texts of the slice view.
+    """
+    self.observeDICOMDatabase()
+    uids = []
+    for layer in (sliceLogic.GetBackgroundLayer(), sliceLogic.GetForegroundLayer()):
+      volumeNode = layer.GetVolumeNode()
+      if not volumeNode:
+        continue
+      uid = self.instanceUIDs(volumeNode).first()
+      if uid:
+        uids.append(uid)
+        if self.bottomRightAnnotationDisplay:
+          instanceUid = self.sliceInstanceUID(sliceLogic, volumeNode)
+          if instanceUid and instanceUid != uid:
+            uids.append(instanceUid)
+    return uids
+
+  def annotationFingerprint(self, sliceLogic):
+    """Return a tuple of all the inputs that the annotation text of the
+    slice view depends on, so that text is only rebuilt when it changes.
+    """
+    sliceCompositeNode = sliceLogic.GetSliceCompositeNode()
+    sliceViewName = sliceLogic.GetSliceNode().GetLayoutName()
+    fingerprint = []
+    for layer in (sliceLogic.GetBackgroundLayer(), sliceLogic.GetForegroundLayer(),
+        sliceLogic.GetLabelLayer()):
+      volumeNode = layer.GetVolumeNode()
+      if volumeNode:
+        fingerprint += [volumeNode.GetID(), volumeNode.GetName()]
+      else:
+        fingerprint += [None, None]
+    # opacities are displayed with one decimal
+    fingerprint += ["%.1f"%sliceCompositeNode.GetForegroundOpacity(),
+      "%.1f"%sliceCompositeNode.GetLabelOpacity()]
+    fingerprint += [self.topLeftAnnotationDisplay, self.topRightAnnotationDisplay,
+      self.bottomLeftAnnotationDisplay, self.bottomRightAnnotationDisplay]
+    fingerprint += [self.fontFamily, self.fontSize]
+    fingerprint.append(self.sliceWidgets[sliceViewName].width > self.topRightWidthThreshold)
+    # label statistics follow the displayed label slice and label edits
+    labelVolume = sliceLogic.GetLabelLayer().GetVolumeNode()
+    if labelVolume and self.labelStatisticsDisplay and self.bottomLeftAnnotationDisplay:
+      fingerprint.append(self.labelSlice(sliceLogic, labelVolume))
+    # instance level values follow the displayed slice
+    if self.bottomRightAnnotationDisplay:
+      for layer in (sliceLogic.GetBackgroundLayer(), sliceLogic.GetForegroundLayer()):
+        volumeNode = layer.GetVolumeNode()
+        fingerprint.append(self.sliceInstanceUID(sliceLogic, volumeNode) if volumeNode else None)
+    return tuple(fingerprint)
+
+  def labelSlice(self, sliceLogic, labelVolume):
+    """Return the (modification time, IJK axis, index) of the label
+    volume slice shown in the view, or None if the view is oblique to it.
+    """
+    imageData = labelVolume.GetImageData()
+    if not imageData:
+      return None
+    rasToIJK = vtk.vtkMatrix4x4()
+    labelVolume.GetRASToIJKMatrix(rasToIJK)
+    location = sliceAxis(rasToIJK, sliceLogic.GetSliceNode().GetSliceToRAS(), imageData.GetDimensions())
+    if location is None:
+      return None
+    scalars = imageData.GetPointData().GetScalars()
+    modifiedTime = max(imageData.GetMTime(), scalars.GetMTime() if scalars else 0)
+    return (modifiedTime,) + location
+
+  def labelSliceStatistics(self, sliceLogic, labelVolume):
+    if not (self.labelStatisticsDisplay and self.bottomLeftAnnotationDisplay):
+      return None
+    labelSlice = self.labelSlice(sliceLogic, labelVolume)
+    if labelSlice is None:
+      return None
+    nodeID = labelVolume.GetID()
+    if nodeID not in self.labelVolumeObserverTags:
+      event = getattr(slicer.vtkMRMLVolumeNode, 'ImageDataModifiedEvent', vtk.vtkCommand.ModifiedEvent)
+      self.labelVolumeObserverTags[nodeID] = (labelVolume, self.observers.addObserver('labels',
+        labelVolume, event, self.onLabelVolumeModified))
+    modifiedTime, axis, index = labelSlice
+    startTime = self.performanceCounters.start()
+    statistics = self.labelStatistics.sliceStatistics(nodeID, modifiedTime,
+      labelVolume.GetImageData(), labelVolume.GetSpacing(), axis, index)
+    self.performanceCounters.stop('Label statistics', startTime)
+    return statistics
+
+  def onLabelVolumeModified(self, caller, event):
+    # painting changes the voxels without modifying the slice logic. The
+    # event does not tell which slices were edited, and telling it from
+    # the voxels costs as much as counting them, so all the slices of the
+    # volume are dropped and the displayed ones counted again
+    self.labelStatistics.discard(caller.GetID())
+    for sliceLogic in list(self.sliceLogics.values()):
+      if sliceLogic.GetLabelLayer().GetVolumeNode() is caller:
+        self.updateSliceLogicAnnotations(sliceLogic)
+
+  def removeLabelVolumeObserver(self, nodeID):
+    self.labelStatistics.discard(nodeID)
+    if nodeID not in self.labelVolumeObserverTags:
+      return
+    labelVolume, tag = self.labelVolumeObserverTags.pop(nodeID)
+    self.observers.removeObserver(labelVolume, tag)
+
+  def sliceLogicModifiedEvent(self, caller, event):
+    self.updateLayersAnnotation(caller)
+
+  def makeAnnotationText(self, sliceLogic):
+
+    backgroundLayer = sliceLogic.GetBackgroundLayer()
+    foregroundLayer = sliceLogic.GetForegroundLayer()
+
+    sliceNode = backgroundLayer.GetSliceNode()
+    sliceViewName = sliceNode.GetLayoutName()
+    self.currentSliceViewName = sliceNode.GetLayoutName()
+
+    backgroundVolume = backgroundLayer.GetVolumeNode()
+
+    backgroundVolumeNode = backgroundLayer.GetVolumeNode()
+    if backgroundVolumeNode:
+      self.foo2(sliceLogic,backgroundVolumeNode,'background')
+    else:
+      self.backgroundVolumeName = 'None'
+      self.backgroundDicomDic = {}
+      self.topLeftLines =  ['']*7
+      self.topRightLines =  ['']*5
+
+    foregroundVolumeNode = foregroundLayer.GetVolumeNode()
+    if foregroundVolumeNode:
+      self.foo2(sliceLogic,foregroundVolumeNode,'foreground')
+    else:
+      self.foregroundVolumeName = 'None'
+      self.foregroundDicomDic = {}
+      self.topLeftLines =  ['']*7
+      self.topRightLines =  ['']*5
+
+    labelLayer = sliceLogic.GetLabelLayer()
+    labelVolumeNode = labelLayer.GetVolumeNode()
+    if labelVolumeNode:
+      self.foo2(sliceLogic,labelVolumeNode,'label')
+    else:
+      self.labelVolumeName = 'None'
+
+  def foo2(self, sliceLogic, fingerprint=None):
+    """Display the corner texts of the slice view. Texts are computed once
+    per distinct fingerprint and reused by all the views that have it.
+    """
+    if fingerprint is None:
+      fingerprint = self.annotationFingerprint(sliceLogic)
+    texts = self.sharedCornerTexts.get(fingerprint)
+    self.performanceCounters.countLookup('Corner texts', texts is not None)
+    if texts is None:
+      startTime = self.performanceCounters.start()
+      texts = self.makeCornerTexts(sliceLogic)
+      self.performanceCounters.stop('Text formatting', startTime)
+      self.sharedCornerTexts[fingerprint] = texts
+      if len(self.sharedCornerTexts) > self.sharedCornerTextsLimit:
+        self.sharedCornerTexts.popitem(last=False)
+    sliceViewName = sliceLogic.GetSliceNode().GetLayoutName()
+    self.baseCornerTexts[sliceViewName] = texts
+    readout = self.pixelReadouts.get(sliceViewName)
+    if readout and self.bottomRightAnnotationDisplay:
+      texts = [texts[0], texts[1] + readout, texts[2], texts[3]]
+    self.setCornerTexts(sliceViewName, texts)
+
+  def makeCornerTexts(self, sliceLogic):
+    sliceCompositeNode = sliceLogic.GetSliceCompositeNode()
+    background = self.annotationLayer(sliceLogic, sliceLogic.GetBackgroundLayer().GetVolumeNode())
+    foreground = self.annotationLayer(sliceLogic, sliceLogic.GetForegroundLayer().GetVolumeNode(),
+      sliceCompositeNode.GetForegroundOpacity())
+    labelVolume = sliceLogic.GetLabelLayer().GetVolumeNode()
+    label = None
+    if labelVolume:
+      label = AnnotationLayer(labelVolume.GetName(), opacity=sliceCompositeNode.GetLabelOpacity(),
+        statistics=self.labelSliceStatistics(sliceLogic, labelVolume))
+    sliceViewName = sliceLogic.GetSliceNode().GetLayoutName()
+    return self.annotationEngine.cornerTexts(background, foreground, label,
+      topLeft=self.topLeftAnnotationDisplay, topRight=self.topRightAnnotationDisplay,
+      bottomLeft=self.bottomLeftAnnotationDisplay, bottomRight=self.bottomRightAnnotationDisplay,
+      wideView=self.sliceWidgets[sliceViewName].width > self.topRightWidthThreshold)
+
+  def annotationLayer(self, sliceLogic, volumeNode, opacity=None):
+    """Describe a slice layer for the annotation engine."""
+    if not volumeNode:
+      return None
+    uid = self.instanceUIDs(volumeNode).first()
+    instanceUid = None
+    if uid and self.bottomRightAnnotationDisplay:
+      instanceUid = self.sliceInstanceUID(sliceLogic, volumeNode)
+    return AnnotationLayer(volumeNode.GetName(), uid, instanceUid, opacity)
+
+  def setCornerTexts(self, sliceViewName, texts):
+    """Push the four corner texts of a slice view. Only corners whose text
+    differs from what was last pushed are set, and the view is rendered
+    only if at least one of them changed.
+    """
+    changed = False
+    for i, text in enumerate(texts):
+      if self.pushCornerText(sliceViewName, i, text):
+        changed = True
+    if changed:
+      self.scheduleRender(sliceViewName)
+
+  def setCornerText(self, sliceViewName, corner, text):
+    """Push the text of a single corner, rendering the view if it
+    changed."""
+    if self.pushCornerText(sliceViewName, corner, text):
+      self.scheduleRender(sliceViewName)
+
+  def pushCornerText(self, sliceViewName, corner, text):
+    if sliceViewName not in self.sliceCornerAnnotations:
+      # the view is no longer annotated
+      return False
+    lastTexts = self.lastCornerTexts.setdefault(sliceViewName, [None]*4)
+    if text == lastTexts[corner]:
+      return False
+    startTime = self.performanceCounters.start()
+    self.sliceCornerAnnotations[sliceViewName].SetText(corner, text)
+    self.performanceCounters.stop('SetText', startTime)
+    lastTexts[corner] = text
+    return True
+
+  def scheduleRender(self, sliceViewName):
+    startTime = self.performanceCounters.start()
+    self.sliceViews[sliceViewName].scheduleRender()
+    self.performanceCounters.stop('Render request', startTime)
+
+  def displayFramePeriod(self):
+    """Milliseconds between two frames of the screen."""
+    try:
+      refreshRate = qt.QGuiApplication.primaryScreen().refreshRate
+    except AttributeError:
+      # Qt 4 does not report it
+      refreshRate = 0
+    return int(1000.0 / (refreshRate or 60.0))
+
+  def onPixelReadoutClicked(self):
+    self.observers.removeGroup('crosshair')
+    self.cursorPosition = None
+    if self.pixelReadoutCheckBox.checked:
+      crosshairNode = slicer.mrmlScene.GetFirstNodeByClass('vtkMRMLCrosshairNode')
+      if crosshairNode:
+        event = getattr(slicer.vtkMRMLCrosshairNode, 'CursorPositionModifiedEvent',
+          vtk.vtkCommand.ModifiedEvent)
+        self.observers.addObserver('crosshair', crosshairNode, event, self.onCursorPositionModified)
+    self.updatePixelReadout()
+
+  def onCursorPositionModified(self, caller, event):
+    # mouse moves only record the position, the readout is updated once
+    # per frame
+    xyz = [0.0, 0.0, 0.0]
+    sliceNode = caller.GetCursorPositionXYZ(xyz)
+    self.cursorPosition = (sliceNode.GetLayoutName(), xyz) if sliceNode else None
+    if not self.pixelReadoutTimer.isActive():
+      self.pixelReadoutTimer.start()
+
+  def updatePixelReadout(self):
+    """Update the readout of the view under the cursor and remove it from
+    the view the cursor left. Only the bottom right corner is pushed."""
+    readouts = {}
+    if self.cursorPosition and self.bottomRightAnnotationDisplay:
+      sliceViewName, xyz = self.cursorPosition
+      sliceLogic = self.sliceLogics.get(sliceViewName)
+      if sliceLogic:
+        readouts[sliceViewName] = self.pixelReadoutText(sliceLogic, xyz)
+    for sliceViewName in set(self.pixelReadouts.keys()) | set(readouts.keys()):
+      readout = readouts.get(sliceViewName, '')
+      if self.pixelReadouts.get(sliceViewName, '') == readout:
+        continue
+      if readout:
+        self.pixelReadouts[sliceViewName] = readout
+      else:
+        del self.pixelReadouts[sliceViewName]
+      texts = self.baseCornerTexts.get(sliceViewName)
+      if texts is not None:
+        self.setCornerText(sliceViewName, 1, texts[1] + readout)
+
+  def pixelReadoutText(self, sliceLogic, xyz):
+    """Return the value lines of the background and foreground voxels at
+    the xyz position of the slice view, and the window/level of the
+    background."""
+    ras = sliceLogic.GetSliceNode().GetXYToRAS().MultiplyPoint(tuple(xyz) + (1.0,))[:3]
+    lines = []
+    for prefix, layer in (('B', sliceLogic.GetBackgroundLayer()), ('F', sliceLogic.GetForegroundLayer())):
+      volumeNode = layer.GetVolumeNode()
+      if not volumeNode:
+        continue
+      rasToIJK = vtk.vtkMatrix4x4()
+      volumeNode.GetRASToIJKMatrix(rasToIJK)
+      value = self.pixelReadout.voxelValue(volumeNode.GetImageData(), voxelIndex(rasToIJK, ras))
+      if value is not None:
+        lines.append('%s: %s' % (prefix, formatVoxelValue(value)))
+    backgroundVolume = sliceLogic.GetBackgroundLayer().GetVolumeNode()
+    displayNode = backgroundVolume.GetDisplayNode() if backgroundVolume else None
+    if displayNode and hasattr(displayNode, 'GetWindow'):
+      lines.append('W/L: %s/%s' % (formatVoxelValue(displayNode.GetWindow()),
+        formatVoxelValue(displayNode.GetLevel())))
+    return ''.join([line + '\n' for line in lines])
+
+  def extractDICOMValues(self,uid):
+    startTime = self.performanceCounters.start()
+    self.observeDICOMDatabase()
+    p = self.headerCache.get(uid)
+    self.performanceCounters.countLookup('Header values', p is not None)
+    if p is None:
+      loadStartTime = self.performanceCounters.start()
+      p = self.loadDICOMValues(uid)
+      self.performanceCounters.stop('Header load', loadStartTime)
+      self.headerCache.put(uid, p)
+    self.performanceCounters.stop('Tag extraction', startTime)
+    return p
+
+  def loadDICOMValues(self,uid):
+    # all the tags of the templates are read in one pass, so the cached
+    # entry stays valid when the bottom right corner is turned on later
+    tags, modalityTags = self.annotationTags
+    if self.persistentHeaderCache is None:
+      return self.headerReader.readValues(uid, tags, modalityTags)
+    filePath = self.observedDICOMDatabase.fileForInstance(uid)
+    values = self.persistentHeaderCache.get(uid, filePath)
+    if values is None or not hasAllValues(values, tags, modalityTags):
+      values = self.headerReader.readValues(uid, tags, modalityTags)
+      self.persistentHeaderCache.put(uid, filePath, values, values.get('Series Instance UID'))
+    return values
+
+  def restorePersistentValues(self, uid, filePath):
+    """Put the values of uid stored in the persistent cache into the
+    header cache. Returns True if they were found."""
+    if self.persistentHeaderCache is None:
+      return False
+    values = self.persistentHeaderCache.get(uid, filePath)
+    if values is None or not hasAllValues(values, *self.annotationTags):
+      # stored for other templates
+      return False
+    self.headerCache.put(uid, values)
+    if self.waitingViews:
+      self.markViewsDirty(self.waitingViews.keys())
+    return True
+
+  def observeDICOMDatabase(self):
+    """Connect to the change signals of the current DICOM database so
+    that cached header values are dropped when its content changes.
+    """
+    database = slicer.dicomDatabase
+    if database is self.observedDICOMDatabase:
+      return
+    self.observers.removeGroup('database')
+    self.headerCache.clear()
+    self.observedDICOMDatabase = database
+    self.headerReader = HeaderReader(database)
+    if database and not canReadFiles():
+      # tags of instances indexed from now on are cached by the database,
+      # which is only read when the files cannot be parsed
+      self.headerReader.registerTagsToPrecache(*self.annotationTags)
+    if self.headerPrefetcher:
+      self.headerPrefetcher.shutdown()
+    self.headerPrefetcher = None
+    if database:
+      tags, modalityTags = self.annotationTags
+      self.headerPrefetcher = HeaderPrefetcher(database.fileForInstance,
+        restoreValues=self.restorePersistentValues, tags=tags, modalityTags=modalityTags)
+    if database:
+      self.observers.connect('database', database, 'databaseChanged()', self.onDICOMDatabaseChanged)
+      self.observers.connect('database', database, 'instanceAdded(QString)', self.onDICOMInstanceAdded)
+
+  @vtk.calldata_type(vtk.VTK_OBJECT)
+  def onNodeAdded(self, caller, event, calldata):
+    node = calldata
+    if node.IsA('vtkMRMLSliceNode'):
+      self.scheduleSliceViewsUpdate()
+      return
+    if not node.IsA('vtkMRMLVolumeNode') or not self.dicomAnnotationsCheckBox.checked:
+      return
+    # the DICOM plugins set the instance UIDs attribute right after the
+    # node is added, so look at it on the next event loop iteration
+    self.prefetchCandidates.append(node.GetID())
+    qt.QTimer.singleShot(0, self.startPrefetch)
+
+  def prefetchSceneVolumes(self):
+    for index in xrange(slicer.mrmlScene.GetNumberOfNodesByClass('vtkMRMLVolumeNode')):
+      self.prefetchCandidates.append(slicer.mrmlScene.GetNthNodeByClass(index, 'vtkMRMLVolumeNode').GetID())
+    if self.prefetchCandidates:
+      qt.QTimer.singleShot(0, self.startPrefetch)
+
+  @vtk.calldata_type(vtk.VTK_OBJECT)
+  def onNodeRemoved(self, caller, event, calldata):
+    if calldata.IsA('vtkMRMLSliceNode'):
+      self.scheduleSliceViewsUpdate()
+      return
+    if self.headerPrefetcher:
+      self.headerPrefetcher.cancel(calldata.GetID())
+    self.removeInstanceUIDIndex(calldata.GetID())
+    self.removeLabelVolumeObserver(calldata.GetID())
+
+  def instanceUIDs(self, volumeNode):
+    """Return the InstanceUIDIndex of the volume node. The attribute is
+    split on first use and again only after the node is modified.
+    """
+    nodeID = volumeNode.GetID()
+    if nodeID in self.instanceUIDIndexes:
+      return self.instanceUIDIndexes[nodeID][0]
+    startTime = self.performanceCounters.start()
+    index = InstanceUIDIndex(volumeNode.GetAttribute('DICOM.instanceUIDs'))
+    self.performanceCounters.stop('UID resolution', startTime)
+    tag = self.observers.addObserver('volumes', volumeNode,
+      vtk.vtkCommand.ModifiedEvent, self.onIndexedVolumeModified)
+    self.instanceUIDIndexes[nodeID] = (index, volumeNode, tag)
+    return index
+
+  def slicePositions(self, volumeNode):
+    """Return the SlicePositionIndex of the volume node, or None if its
+    slices cannot be mapped one to one to its instances.
+    """
+    nodeID = volumeNode.GetID()
+    if nodeID in self.slicePositionIndexes:
+      return self.slicePositionIndexes[nodeID]
+    uids = self.instanceUIDs(volumeNode)
+    imageData = volumeNode.GetImageData()
+    index = None
+    if imageData and len(uids):
+      ijkToRAS = vtk.vtkMatrix4x4()
+      volumeNode.GetIJKToRASMatrix(ijkToRAS)
+      rows = [[ijkToRAS.GetElement(row, column) for column in range(4)] for row in range(4)]
+      index = SlicePositionIndex.fromGeometry(rows, imageData.GetDimensions()[2], uids)
+    # invalidated together with the instance UID index
+    self.slicePositionIndexes[nodeID] = index
+    return index
+
+  def sliceInstanceUID(self, sliceLogic, volumeNode):
+    """Return the UID of the instance displayed in the slice view, or None
+    if the view is not aligned with the slices of the volume.
+    """
+    startTime = self.performanceCounters.start()
+    uid = None
+    index = self.slicePositions(volumeNode)
+    if index:
+      sliceToRAS = sliceLogic.GetSliceNode().GetSliceToRAS()
+      normal = [sliceToRAS.GetElement(row, 2) for row in range(3)]
+      point = [sliceToRAS.GetElement(row, 3) for row in range(3)]
+      uid = index.uidAt(point, normal)
+    self.performanceCounters.stop('UID resolution', startTime)
+    return uid
+
+  def onIndexedVolumeModified(self, caller, event):
+    # attribute and geometry changes are reported through the node ModifiedEvent
+    self.removeInstanceUIDIndex(caller.GetID())
+    self.sharedCornerTexts.clear()
+    # the views showing the node may now show other instances, without
+    # their slice logic being modified
+    for sliceViewName, sliceLogic in list(self.sliceLogics.items()):
+      if (sliceLogic.GetBackgroundLayer().GetVolumeNode() is caller or
+          sliceLogic.GetForegroundLayer().GetVolumeNode() is caller):
+        self.annotationFingerprints.pop(sliceViewName, None)
+        self.updateSliceLogicAnnotations(sliceLogic)
+
+  def removeInstanceUIDIndex(self, nodeID):
+    self.slicePositionIndexes.pop(nodeID, None)
+    if nodeID not in self.instanceUIDIndexes:
+      return
+    index, volumeNode, tag = self.instanceUIDIndexes.pop(nodeID)
+    self.observers.removeObserver(volumeNode, tag)
+
+  def startPrefetch(self):
+    self.observeDICOMDatabase()
+    candidates, self.prefetchCandidates = self.prefetchCandidates, []
+    if not self.headerPrefetcher:
+      return
+    for nodeID in candidates:
+      volumeNode = slicer.mrmlScene.GetNodeByID(nodeID)
+      if not volumeNode:
+        continue
+      uids = self.instanceUIDs(volumeNode)
+      uids = [uid for uid in uids if uid not in self.headerCache]
+      if uids:
+        self.headerPrefetcher.submit(nodeID, uids)
+    if self.headerPrefetcher.isBusy():
+      self.prefetchTimer.start()
+
+  def onPrefetchTimeout(self):
+    if not self.headerPrefetcher:
+      self.prefetchTimer.stop()
+      return
+    results = self.headerPrefetcher.pump()
+    persistentEntries = []
+    for uid, filePath, values in results:
+      if values is None:
+        # the worker could not parse the file, or there is none, read it
+        # through the database while still ahead of display
+        if filePath and not canReadFiles():
+          # the tag cache may predate the annotation tags
+          self.headerReader.precacheInstance(uid, *self.annotationTags)
+        values = self.headerReader.readDatabaseValues(filePath, *self.annotationTags)
+      elif not hasAllValues(values, *self.annotationTags):
+        # read before a corner was enabled, the view waiting for it will
+        # not ask again
+        values = self.headerReader.readValues(uid, *self.annotationTags)
+      self.headerCache.put(uid, values)
+      persistentEntries.append((uid, filePath, values, values.get('Series Instance UID')))
+    if self.persistentHeaderCache is not None and persistentEntries:
+      self.persistentHeaderCache.putMany(persistentEntries)
+    if results and self.waitingViews:
+      self.markViewsDirty(self.waitingViews.keys())
+    if not self.headerPrefetcher.isBusy():
+      self.prefetchTimer.stop()
+
+  def onDICOMDatabaseChanged(self):
+    self.headerCache.clear()
+    self.annotationFingerprints = {}
+    self.sharedCornerTexts.clear()
+
+  def onDICOMInstanceAdded(self, uid):
+    # re-imported instances may come with a different header
+    self.headerCache.discard(uid)
+    self.annotationFingerprints = {}
+    self.sharedCornerTexts.clear()
+    if not canReadFiles():
+      self.schedulePrecache([uid])
+
+  def schedulePrecache(self, uids):
+    """Fill the database tag cache with the annotation tags of uids, so
+    that reading them at display time does not go back to the files.
+    Only useful when the files cannot be parsed."""
+    self.precacheCandidates.extend(uids)
+    if not self.precacheScheduled:
+      self.precacheScheduled = True
+      qt.QTimer.singleShot(0, self.precacheTags)
+
+  def precacheTags(self):
+    # instances are added in bursts during an import, cache them in
+    # batches to keep the application responsive
+    self.precacheScheduled = False
+    batch, self.precacheCandidates = self.precacheCandidates[:64], self.precacheCandidates[64:]
+    for uid in batch:
+      self.headerReader.precacheInstance(uid, *self.annotationTags)
+    if self.precacheCandidates:
+      self.precacheScheduled = True
+      qt.QTimer.singleShot(0, self.precacheTags)
+
+  def loadCornerTemplates(self, filePath):
+    """Use the templates of filePath, or the built-in templates if it is
+    empty or cannot be read."""
+    templates = CornerTemplates()
+    if filePath:
+      try:
+        templates = CornerTemplates.fromFile(filePath)
+      except Exception, e:
+        print('DICOMAnnotations: cannot read corner templates %s: %s' % (filePath, e))
+    self.cornerTemplates = templates
+    self.annotationEngine = AnnotationEngine(self.extractDICOMValues, templates)
+    self.setAnnotationTags(templates.headerTags(self.enabledCorners()))
+
+  def enabledCorners(self):
+    corners = []
+    if self.bottomLeftAnnotationDisplay:
+      corners.append('bottomLeft')
+    if self.bottomRightAnnotationDisplay:
+      corners.append('bottomRight')
+    if self.topLeftAnnotationDisplay:
+      corners.append('topLeft')
+    if self.topRightAnnotationDisplay:
+      corners.append('topRight')
+    return corners
+
+  def setAnnotationTags(self, annotationTags):
+    """Read the (tags, modalityTags) profile annotationTags from the
+    headers from now on. Cached values are kept if they were read with
+    all these tags, so that turning a corner off costs nothing and
+    turning it on reads the headers again only if it needs more tags.
+    """
+    if annotationTags == self.annotationTags:
+      return
+    if not profileContains(*(self.annotationTags + annotationTags)):
+      self.headerCache.clear()
+      self.annotationFingerprints = {}
+    self.sharedCornerTexts.clear()
+    self.annotationTags = annotationTags
+    tags, modalityTags = annotationTags
+    if self.headerPrefetcher:
+      self.headerPrefetcher.tags = tags
+      self.headerPrefetcher.modalityTags = modalityTags
+    if self.observedDICOMDatabase and not canReadFiles():
+      self.headerReader.registerTagsToPrecache(tags, modalityTags)
+
+  def onTemplatesPathChanged(self, filePath):
+    qt.QSettings().setValue('DICOMAnnotations/TemplatesFile', filePath)
+    self.loadCornerTemplates(filePath)
+    self.annotationFingerprints = {}
+    self.sharedCornerTexts.clear()
+    if self.dicomAnnotationsCheckBox.checked:
+      self.updateSliceViewFromGUI()
+
+  def persistentHeaderCachePath(self):
+    cacheDirectory = getattr(slicer.app, 'cachePath', slicer.app.temporaryPath)
+    if not os.path.isdir(cacheDirectory):
+      os.makedirs(cacheDirectory)
+    return os.path.join(cacheDirectory, 'DICOMAnnotationsHeaders.sqlite')
+
+  def onPersistentCacheClicked(self):
+    enabled = self.persistentCacheCheckBox.checked
+    qt.QSettings().setValue('DICOMAnnotations/PersistentHeaderCache', enabled)
+    self.clearPersistentCacheButton.enabled = enabled
+    if enabled and self.persistentHeaderCache is None:
+      self.persistentHeaderCache = PersistentHeaderCache(self.persistentHeaderCachePath())
+    elif not enabled and self.persistentHeaderCache is not None:
+      self.persistentHeaderCache.close()
+      self.persistentHeaderCache = None
+
+  def onClearPersistentCache(self):
+    if self.persistentHeaderCache is not None:
+      self.persistentHeaderCache.clear()
+
+  def onPerformanceCountersClicked(self):
+    self.performanceCounters.enabled = self.performanceCountersCheckBox.checked
+    if self.performanceCounters.enabled:
+      self.performanceTimer.start()
+    else:
+      self.performanceTimer.stop()
+    self.refreshPerformanceTable()
+
+  def onResetPerformanceCounters(self):
+    self.performanceCounters.reset()
+    self.headerCache.resetStatistics()
+    self.refreshPerformanceTable()
+
+  def performanceReport(self):
+    report = self.performanceCounters.asDict()
+    report['headerCache'] = self.headerCache.statistics()
+    report['liveObservers'] = self.observers.count()
+    return report
+
+  def refreshPerformanceTable(self):
+    rows = []
+    for stage, values in self.performanceReport()['stages'].items():
+      rows.append((stage, str(values['calls']), '%.2f' % values['totalMs'], '%.2f' % values['maximumMs']))
+    for cache in self.performanceCounters.caches():
+      lookups = self.performanceCounters.cacheHits.get(cache, 0) + self.performanceCounters.cacheMisses.get(cache, 0)
+      rows.append((cache + ' hit rate', str(lookups), '%.1f%%' % (100.0 * self.performanceCounters.hitRate(cache)), ''))
+    rows.append(('Live observers', str(self.observers.count()), '', ''))
+    self.performanceTable.setRowCount(len(rows))
+    for row, values in enumerate(rows):
+      for column, value in enumerate(values):
+        self.performanceTable.setItem(row, column, qt.QTableWidgetItem(value))
+
+  def onExportPerformanceCounters(self):
+    fileName = qt.QFileDialog.getSaveFileName(None, "Export Performance Counters",
+      os.path.join(slicer.app.temporaryPath, 'DICOMAnnotationsPerformance.json'), "JSON files (*.json)")
+    if fileName:
+      self.exportPerformanceCounters(fileName)
+
+  def exportPerformanceCounters(self, fileName):
+    with open(fileName, 'w') as reportFile:
+      json.dump(self.performanceReport(), reportFile, indent=2)
+
+  def startEventCapture(self, mode='profile', maximumEvents=None, maximumSeconds=None, samplingInterval=1):
+    """Capture updateCornerAnnotations and updateSliceViewFromGUI calls
+    to a file in the temporary directory, see EventCapture. The path of
+    the file is printed when the capture ends.
+    """
+    self.stopEventCapture()
+    self.eventCapture = EventCapture(slicer.app.temporaryPath, mode, maximumEvents,
+      maximumSeconds, samplingInterval, self.onEventCaptureFinished)
+    self.eventCapture.start()
+    if maximumSeconds and self.eventCaptureTimer:
+      self.eventCaptureTimer.start(int(1000 * maximumSeconds))
+    return self.eventCapture
+
+  def stopEventCapture(self):
+    """Stop the running capture and return the path of its file."""
+    if not self.eventCapture:
+      return None
+    return self.eventCapture.stop()
+
+  def onEventCaptureFinished(self, filePath):
+    self.eventCapture = None
+    if self.eventCaptureTimer:
+      self.eventCaptureTimer.stop()
+    print('DICOMAnnotations capture written to ' + filePath)
+    if hasattr(self, 'captureButton') and self.captureButton.checked:
+      self.captureButton.checked = False
+
+  def onCaptureToggled(self, checked):
+    if checked:
+      self.startEventCapture(self.captureModeComboBox.currentText.lower(), self.captureEventsSpinBox.value,
+        self.captureSecondsSpinBox.value, self.captureSamplingSpinBox.value)
+    else:
+      self.stopEventCapture()
+
+  def eventDetails(self, sliceLogic):
+    details = {'view': sliceLogic.GetSliceNode().GetLayoutName()}
+    for name, layer in (('background', sliceLogic.GetBackgroundLayer()),
+        ('foreground', sliceLogic.GetForegroundLayer()), ('label', sliceLogic.GetLabelLayer())):
+      volumeNode = layer.GetVolumeNode() if layer else None
+      details[name] = volumeNode.GetID() if volumeNode else None
+    return details
+
+  def onReload(self,moduleName="DICOMAnnotations"):
+    """Generic reload method for any scripted module.
+    ModuleWizard will subsitute correct default moduleName.
+    """
+    # detach from the scene and the slice views before the new module
+    # instance attaches its own observers
+    self.cleanup()
+    globals()[moduleName] = slicer.util.reloadScriptedModule(moduleName)
+
+  def onReloadAndTest(self,moduleName="DICOMAnnotations"):
+    try:
+      self.onReload()
+      evalString = 'globals()["%s"].%sTest()' % (moduleName, moduleName)
+      tester = eval(evalString)
+      tester.runTest()
+    except Exception, e:
+      import traceback
+      traceback.print_exc()
+      qt.QMessageBox.warning(slicer.util.mainWindow(),
+          "Reload and Test", 'Exception!\n\n' + str(e) + "\n\nSee Python Console for Stack Trace")
+
+#
+# DICOMAnnotationsLogic
+#
+
+class DICOMAnnotationsLogic:
+  """This class should implement all the actual
+  computation done by your module.  The interface
+  should be such that other python code can import
+  this class and make use of the functionality without
+  requiring an instance of the Widget
+  """
+  def __init__(self):
+    pass
+
+  def hasImageData(self,volumeNode):
+    """This is a dummy logic method that
+    returns true if the passed in volume
+    node has valid image data
+    """
+    if not volumeNode:
+      print('no volume node')
+      return False
+    if volumeNode.GetImageData() == None:
+      print('no image data')
+      return False
+    return True
+
+  def exportAnnotations(self, reportPath, folderPath=None, templatesFile=None):
+    """Write the corner annotations of every series of the DICOM
+    database, or of the DICOM files under folderPath, to reportPath (CSV
+    if it ends with .csv, JSON lines otherwise). No view is needed, so
+    this can run from Slicer --no-main-window --python-script. The
+    templates default to the ones chosen in the module panel. Returns
+    the number of series written.
+
+    Headers are read in the Slicer process: a worker process started
+    from Slicer would launch Slicer again. Run BatchExport from a plain
+    Python interpreter to read them with several processes.
+    """
+    if templatesFile is None:
+      templatesFile = qt.QSettings().value('DICOMAnnotations/TemplatesFile')
+    templates = None
+    if templatesFile:
+      templates = CornerTemplates.fromFile(templatesFile)
+    export = BatchExport(templates)
+    if folderPath:
+      return export.exportFolder(folderPath, reportPath)
+    return export.exportDatabase(slicer.dicomDatabase, reportPath)
+
+  def delayDisplay(self,message,msec=1000):
+    #
+    # logic version of delay display
+    #
+    print(message)
+    self.info = qt.QDialog()
+    self.infoLayout = qt.QVBoxLayout()
+    self.info.setLayout(self.infoLayout)
+    self.label = qt.QLabel(message,self.info)
+    self.infoLayout.addWidget(self.label)
+    qt.QTimer.singleShot(msec, self.info.close)
+    self.info.exec_()
+
+
+class DICOMAnnotationsTest(unittest.TestCase):
+  """
+  This is the test case for your scripted module.
+  """
+
+  def delayDisplay(self,message,msec=1000):
+    """This utility method displays a small dialog and waits.
+    This does two things: 1) it lets the event loop catch up
+    to the state of the test so that rendering and widget updates
+    have all taken place before the test continues and 2) it
+    shows the user/developer/tester the state of the test
+    so that we'll know when it breaks.
+    """
+    print(message)
+    self.info = qt.QDialog()
+    self.infoLayout = qt.QVBoxLayout()
+    self.info.setLayout(self.infoLayout)
+    self.label = qt.QLabel(message,self.info)
+    self.infoLayout.addWidget(self.label)
+    qt.QTimer.singleShot(msec, self.info.close)
+    self.info.exec_()
+
+  def setUp(self):
+    """ Do whatever is needed to reset the state - typically a scene clear will be enough.
+    """
+    slicer.mrmlScene.Clear(0)
+
+  def runTest(self):
+    """Run as few or as many tests as needed here.
+    """
+    self.setUp()
+    self.test_DICOMAnnotations1()
+    self.test_HeaderCache()
+    self.test_AnnotationEngine()
+    self.test_PerformanceCounters()
+    self.test_SharedCornerTexts()
+    self.test_ObserverRegistry()
+    self.test_PersistentHeaderCache()
+    self.test_CornerTemplates()
+    self.test_ModalityProfiles()
+    self.test_LayerComparison()
+    self.test_PixelReadout()
+    self.test_LabelStatistics()
+    self.test_LabelCounts()
+    self.test_SlicePositionIndex()
+    self.test_BatchExport()
+    self.test_Stress()
+    self.test_CursorReadout()
+    self.test_AsynchronousUpdates()
+    self.test_InstanceUIDsChange()
+    self.test_HeaderReader()
+    self.test_SliceViewDiscovery()
+    self.test_SceneBatchProcessing()
+    self.test_LabelEdit()
+    self.test_EventCapture()
+    self.test_StandaloneWidget()
+
+  def test_DICOMAnnotations1(self):
+    """ Ideally you should have several levels of tests.  At the lowest level
+    tests sould exercise the functionality of the logic with different inputs
+    (both valid and invalid).  At higher levels your tests should emulate the
+    way the user would interact with your code and confirm that it still works
+    the way you intended.
+    One of the most important features of the tests is that it should alert other
+    developers when their changes will have an impact on the behavior of your
+    module.  For example, if a developer removes a feature that you depend on,
+    your test should break so they know that the feature is needed.
+    """
+
+    self.delayDisplay("Starting the test")
+    #
+    # first, get some data
+    #
+    import urllib
+    downloads = (
+        ('http://slicer.kitware.com/midas3/download?items=5767', 'FA.nrrd', slicer.util.loadVolume),
+        )
+
+    for url,name,loader in downloads:
+      filePath = slicer.app.temporaryPath + '/' + name
+      if not os.path.exists(filePath) or os.stat(filePath).st_size == 0:
+        print('Requesting download %s from %s...\n' % (name, url))
+        urllib.urlretrieve(url, filePath)
+      if loader:
+        print('Loading %s...\n' % (name,))
+        loader(filePath)
+    self.delayDisplay('Finished with download and loading\n')
+
+    volumeNode = slicer.util.getNode(pattern="FA")
+    logic = DICOMAnnotationsLogic()
+    self.assertTrue( logic.hasImageData(volumeNode) )
+    self.delayDisplay('Test passed!')
+
+  def test_HeaderCache(self):
+    """ The least recently used entries are evicted to stay within the
+    entry and byte limits, and the cache of the module is cleared when
+    the DICOM database changes.
+    """
+    self.delayDisplay("Starting the header cache test")
+    cache = HeaderCache(maximumEntries=3)
+    for uid in ('1', '2', '3'):
+      cache.put(uid, {'Patient Name': 'Doe^John', 'Instance Number': int(uid)})
+    self.assertEqual(cache.get('1')['Instance Number'], 1)
+    self.assertEqual(cache.get('4'), None)
+    cache.put('4', {'Patient Name': 'Doe^John'})
+    # '2' was used least recently
+    self.assertFalse('2' in cache)
+    self.assertEqual(list(cache.entries.keys()), ['3', '1', '4'])
+    statistics = cache.statistics()
+    self.assertEqual((statistics['entries'], statistics['hits'], statistics['misses'],
+      statistics['evictions']), (3, 1, 1, 1))
+    self.assertEqual(statistics['hitRate'], 0.5)
+    cache.discard('1')
+    self.assertEqual(cache.evictions, 1)
+    self.assertEqual(cache.currentBytes, sum(cache.entrySizes.values()))
+    cache.resetStatistics()
+    self.assertEqual(cache.hitRate(), 0.0)
+    cache.clear()
+    self.assertEqual((len(cache), cache.currentBytes), (0, 0))
+
+    values = {'Patient Name': 'Doe^John'}
+    size = cache.estimateSize('1', values)
+    cache = HeaderCache(maximumBytes=2 * size)
+    for uid in ('1', '2', '3'):
+      cache.put(uid, values)
+    self.assertEqual(list(cache.entries.keys()), ['2', '3'])
+    self.assertTrue(cache.currentBytes <= 2 * size)
+    # an entry larger than the cache is not stored
+    cache.put('4', dict(('Tag %d' % index, index) for index in xrange(100)))
+    self.assertEqual(list(cache.entries.keys()), ['2', '3'])
+
+    self.runWithStandIns(self.runHeaderCacheInvalidation)
+    self.delayDisplay('Test passed!')
+
+  def runHeaderCacheInvalidation(self, standIn, slicer):
+    widget, volumes = self.createStandInScene(standIn, slicer, ['Red'])
+    try:
+      slicer.app.layoutManager().sliceWidget('Red').sliceLogic().setLayers(volumes[0])
+      standIn.EventLoop.processEvents()
+      uid = volumes[0].GetAttribute('DICOM.instanceUIDs').split()[0]
+      self.assertTrue(uid in widget.headerCache)
+      # re-imported instances are read again
+      slicer.dicomDatabase.emit('instanceAdded(QString)', uid)
+      self.assertFalse(uid in widget.headerCache)
+      self.assertTrue(len(widget.headerCache) > 0)
+      slicer.dicomDatabase.emit('databaseChanged()')
+      self.assertEqual(len(widget.headerCache), 0)
+    finally:
+      widget.cleanup()
+
+  def test_PerformanceCounters(self):
+    """ Stages and cache lookups are only counted while enabled, and the
+    counters of the module are exported as JSON.
+    """
+    self.delayDisplay("Starting the performance counters test")
+    counters = PerformanceCounters()
+    self.assertEqual(counters.start(), None)
+    counters.stop('SetText', counters.start())
+    counters.countLookup('Header values', True)
+    self.assertEqual(counters.counts['SetText'], 0)
+    self.assertEqual(counters.caches(), [])
+
+    counters.enabled = True
+    for hit in (True, True, False, True):
+      counters.stop('SetText', counters.start())
+      counters.countLookup('Header values', hit)
+    report = counters.asDict()
+    self.assertEqual(report['stages']['SetText']['calls'], 4)
+    self.assertTrue(report['stages']['SetText']['totalMs'] >= report['stages']['SetText']['maximumMs'])
+    self.assertEqual(report['caches']['Header values']['hits'], 3)
+    self.assertEqual(report['caches']['Header values']['misses'], 1)
+    self.assertEqual(report['caches']['Header values']['hitRate'], 0.75)
+    counters.reset()
+    self.assertEqual(counters.counts['SetText'], 0)
+    self.assertEqual(counters.hitRate('Header values'), 0.0)
+
+    self.runWithStandIns(self.runPerformanceCountersExport)
+    self.delayDisplay('Test passed!')
+
+  def runPerformanceCountersExport(self, standIn, slicer):
+    widget, volumes = self.createStandInScene(standIn, slicer, ['Red'])
+    fileName = os.path.join(slicer.app.temporaryPath, 'DICOMAnnotationsPerformanceTest.json')
+    try:
+      widget.performanceCountersCheckBox.checked = True
+      widget.onPerformanceCountersClicked()
+      slicer.app.layoutManager().sliceWidget('Red').sliceLogic().setLayers(volumes[0])
+      standIn.EventLoop.processEvents()
+      widget.exportPerformanceCounters(fileName)
+      with open(fileName) as reportFile:
+        report = json.load(reportFile)
+      self.assertTrue(report['stages']['SetText']['calls'] > 0)
+      self.assertTrue('Corner texts' in report['caches'])
+      self.assertEqual(report['headerCache']['entries'], len(widget.headerCache))
+      self.assertEqual(report['liveObservers'], widget.observers.count())
+
+      widget.onResetPerformanceCounters()
+      widget.exportPerformanceCounters(fileName)
+      with open(fileName) as reportFile:
+        report = json.load(reportFile)
+      self.assertEqual(report['stages']['SetText']['calls'], 0)
+      self.assertEqual(report['caches'], {})
+      self.assertEqual(report['headerCache']['hits'], 0)
+    finally:
+      widget.cleanup()
+      if os.path.exists(fileName):
+        os.remove(fileName)
+
+  def test_SharedCornerTexts(self):
+    """ Views showing the same layers share their corner texts, which are
+    dropped when the templates, the tags or the DICOM database change.
+    """
+    self.delayDisplay("Starting the shared corner texts test")
+    self.runWithStandIns(self.runSharedCornerTexts)
+    self.delayDisplay('Test passed!')
+
+  def runSharedCornerTexts(self, standIn, slicer):
+    widget, volumes = self.createStandInScene(standIn, slicer, ['Red', 'Yellow'])
+    calls = []
+    makeCornerTexts = widget.makeCornerTexts
+    def countingMakeCornerTexts(sliceLogic):
+      calls.append(sliceLogic.GetSliceNode().GetLayoutName())
+      return makeCornerTexts(sliceLogic)
+    widget.makeCornerTexts = countingMakeCornerTexts
+    try:
+      for viewName in ('Red', 'Yellow'):
+        slicer.app.layoutManager().sliceWidget(viewName).sliceLogic().setLayers(volumes[1])
+      standIn.EventLoop.processEvents()
+      self.assertEqual(len(calls), 1)
+      self.assertEqual(widget.baseCornerTexts['Red'], widget.baseCornerTexts['Yellow'])
+
+      # the views are redrawn with the new templates
+      widget.onTemplatesPathChanged('')
+      standIn.EventLoop.processEvents()
+      self.assertEqual(len(calls), 2)
+
+      for invalidate in (lambda: widget.setAnnotationTags(widget.cornerTemplates.headerTags(['topLeft'])),
+          lambda: slicer.dicomDatabase.emit('databaseChanged()')):
+        self.assertEqual(len(widget.sharedCornerTexts), 1)
+        invalidate()
+        self.assertEqual(len(widget.sharedCornerTexts), 0)
+        widget.updateSliceViewFromGUI()
+        standIn.EventLoop.processEvents()
+      self.assertEqual(len(calls), 4)
+    finally:
+      widget.cleanup()
+
+  def test_AnnotationEngine(self):
+    """ Format corner texts from plain tag dictionaries, without a DICOM
+    database or slice views.
+    """
+    self.delayDisplay("Starting the annotation engine test")
+    patient = {'Patient Name': 'Doe^John', 'Patient ID': '1234',
+      'Patient Birth Date': '19700101', 'Patient Age': '044Y', 'Patient Sex': 'M',
+      'Study Date': '20140102', 'Study Time': '134500', 'Modality': 'MR',
+      'Institution Name': 'General Hospital', 'Referring Physician Name': 'House^Gregory',
+      'Manufacturer': 'ACME', 'Model': 'Scanner 3000', 'Patient Position': 'HFS',
+      'Repetition Time': 2000.0, 'Echo Time': 80.5, 'Flip Angle': 'Unknown'}
+    values = {
+      '1.1': dict(patient, **{'Series Description': 'T2'}),
+      '2.1': dict(patient, **{'Series Description': 'DWI', 'Study Date': '20140103', 'Patient Age': '045Y'}),
+      }
+    engine = AnnotationEngine(values.get)
+
+    texts = engine.cornerTexts(AnnotationLayer('T2', '1.1'))
+    self.assertEqual(texts[0], 'B: T2\n')
+    self.assertEqual(texts[1], 'TR 2000\nTE 80.5\n')
+    self.assertEqual(texts[2], 'Doe, John\nID: 1234\n01/01/1970, 044Y, M\n01/02/2014\n1:45:00 PM\nT2\n')
+    self.assertEqual(texts[3], 'General Hospital\nHouse, Gregory\nACME\nScanner 3000\nHFS\n')
+
+    texts = engine.cornerTexts(AnnotationLayer('T2', '1.1'), AnnotationLayer('DWI', '2.1', opacity=0.5),
+      AnnotationLayer('label', opacity=1.0), wideView=False)
+    self.assertEqual(texts[0], 'L: label (1.0)\nF: DWI (0.5)\nB: T2\n')
+    self.assertTrue('B: 01/02/2014\nF: 01/03/2014\n' in texts[2])
+    # the patient line of the background, although the age differs
+    self.assertTrue(texts[2].startswith('Doe, John\nID: 1234\n01/01/1970, 044Y, M\n'))
+    self.assertEqual(texts[3], '')
+    self.delayDisplay('Test passed!')
+
+  def test_CornerTemplates(self):
+    """ Corners follow the templates of the series modality, and only the
+    tags the templates use are read.
+    """
+    self.delayDisplay("Starting the corner templates test")
+    templates = CornerTemplates({
+      'default': {'topLeft': ['{PatientName} ({PatientSex})', 'Series {0020,0011}'],
+        'topRight': [], 'bottomRight': []},
+      'CT': {'bottomRight': ['100%: {SliceLocation}']},
+      })
+    tags, modalityTags = templates.headerTags()
+    names = [name for tag, name, vr in tags]
+    self.assertTrue('Patient Sex' in names and '0020,0011' in names)
+    self.assertFalse('Institution Name' in names)
+    self.assertEqual(modalityTags['CT'], (("0020,1041", "Slice Location", "DS"),))
+    values = {
+      '1.1': {'Patient Name': 'Doe^John', 'Patient Sex': 'M', 'Modality': 'CT', '0020,0011': '3'},
+      '1.2': {'Slice Location': -12.5, '0020,0011': '3'},
+      }
+    engine = AnnotationEngine(values.get, templates)
+    texts = engine.cornerTexts(AnnotationLayer('CT', '1.1', '1.2'))
+    self.assertEqual(texts, ['B: CT\n', '100%: -12.5\n', 'Doe, John (M)\nSeries 3\n', ''])
+    texts = engine.cornerTexts(AnnotationLayer('CT', '1.1'), topLeft=False)
+    self.assertEqual(texts, ['B: CT\n', '', '', ''])
+
+    # a corner can be a string of lines, and placeholders are checked
+    stringTemplates = CornerTemplates({'default': {'topLeft': '{PatientName}\nSex {PatientSex}'}})
+    self.assertEqual(AnnotationEngine(values.get, stringTemplates).cornerTexts(AnnotationLayer('CT', '1.1'))[2], 'Doe, John\nSex M\n')
+    for line in ('{PatientName', 'PatientName}', '{PatientNam}'):
+      self.assertRaises(ValueError, CornerTemplates, {'default': {'topLeft': [line]}})
+
+    # non-ASCII values, as unicode and as UTF-8 encoded bytes
+    values['1.1'].update({'Patient Name': u'M\xfcller^J\xfcrgen', '0020,0011': 'S\xc3\xa9rie'})
+    texts = engine.cornerTexts(AnnotationLayer('CT', '1.1'))
+    self.assertEqual(texts[2], u'M\xfcller, J\xfcrgen (M)\nSeries S\xe9rie\n')
+    texts = AnnotationEngine({'2.1': {'Institution Name': u'H\xf4pital'}}.get).cornerTexts(
+      AnnotationLayer('CT', '2.1'))
+    self.assertTrue(texts[3].startswith(u'H\xf4pital\n'))
+    self.delayDisplay('Test passed!')
+
+  def test_ModalityProfiles(self):
+    """ The bottom right corner shows the values of the modality profile,
+    and its tags are not read while the corner is off.
+    """
+    self.delayDisplay("Starting the modality profiles test")
+    templates = CornerTemplates()
+    tags, modalityTags = templates.headerTags()
+    self.assertTrue(("0018,0060", "KVP", "DS") in modalityTags['CT'])
+    self.assertTrue(("0054,1001", "Units", "CS") in modalityTags['PT'])
+    tags, modalityTags = templates.headerTags(['bottomLeft', 'topLeft', 'topRight'])
+    self.assertFalse('CT' in modalityTags)
+    self.assertFalse('Instance Number' in [name for tag, name, vr in tags])
+    values = {
+      '1.1': {'Modality': 'CT', 'KVP': 120.0, 'X-Ray Tube Current': 200, 'Exposure': 'Unknown'},
+      '1.2': {'Instance Number': 7, 'KVP': 120.0, 'X-Ray Tube Current': 250, 'Exposure': 'Unknown'},
+      }
+    engine = AnnotationEngine(values.get, templates)
+    texts = engine.cornerTexts(AnnotationLayer('CT', '1.1', '1.2'))
+    self.assertEqual(texts[1], 'Im: 7\n120 kVp\n250 mA\n')
+    self.delayDisplay('Test passed!')
+
+  def test_LayerComparison(self):
+    """ Layers are compared once per pair of series, by normalized
+    patient keys, and again only when their header values are reloaded.
+    """
+    self.delayDisplay("Starting the layer comparison test")
+    background = {'Patient Name': 'Doe^John', 'Patient ID': '1234', 'Patient Birth Date': '19700101',
+      'Study Instance UID': '1', 'Series Instance UID': '1.1', 'Study Date': '20140102',
+      'Study Time': '134500', 'Series Description': 'T2'}
+    foreground = dict(background, **{'Patient Name': 'DOE^JOHN^^', 'Series Instance UID': '1.2',
+      'Study Date': '20140103', 'Series Description': 'DWI'})
+    self.assertEqual(SeriesIdentity(background).patientKey, SeriesIdentity(foreground).patientKey)
+    self.assertEqual(SeriesIdentity(background).texts['StudyDate'], '01/02/2014')
+
+    comparison = LayerComparison()
+    fields = ['PatientName', 'StudyDate', 'StudyTime', 'SeriesDescription', 'BackgroundName']
+    values = comparison.layerValues('1.1', background, '1.2', foreground, fields)
+    # same patient and study: the name and study date of the background
+    # are shown once
+    self.assertEqual(values, {'PatientName': 'Doe, John', 'StudyDate': '01/02/2014', 'StudyTime': '1:45:00 PM',
+      'BackgroundSeriesDescription': 'T2', 'ForegroundSeriesDescription': 'DWI'})
+    self.assertTrue(comparison.layerValues('1.1', background, '1.2', foreground, fields) is values)
+
+    otherPatient = dict(foreground, **{'Patient ID': '5678'})
+    self.assertEqual(comparison.layerValues('1.1', background, '1.2', otherPatient, fields), {})
+    otherStudy = dict(foreground, **{'Study Instance UID': '2'})
+    values = comparison.layerValues('1.1', background, '1.2', otherStudy, fields)
+    self.assertEqual(values['BackgroundStudyDate'], '01/02/2014')
+    self.assertEqual(values['ForegroundStudyDate'], '01/03/2014')
+    self.delayDisplay('Test passed!')
+
+  def test_PixelReadout(self):
+    """ Voxel values are read from the image data, and positions outside
+    of it have no value.
+    """
+    self.delayDisplay("Starting the pixel readout test")
+    imageData = vtk.vtkImageData()
+    imageData.SetDimensions(4, 3, 2)
+    imageData.AllocateScalars(vtk.VTK_SHORT, 1)
+    imageData.GetPointData().GetScalars().FillComponent(0, 0)
+    imageData.SetScalarComponentFromDouble(1, 2, 1, 0, -120)
+    readout = PixelReadout()
+    self.assertEqual(readout.voxelValue(imageData, (1, 2, 1)), -120)
+    self.assertEqual(readout.voxelValue(imageData, (4, 0, 0)), None)
+    rasToIJK = vtk.vtkMatrix4x4()
+    rasToIJK.SetElement(0, 0, 0.5)
+    self.assertEqual(voxelIndex(rasToIJK, (2.9, 2.0, 1.0)), (1, 2, 1))
+    self.assertEqual(formatVoxelValue(readout.voxelValue(imageData, (1, 2, 1))), '-120')
+    self.assertEqual(formatVoxelValue([0.5, 2.0]), '0.5,2')
+    self.delayDisplay('Test passed!')
+
+  def test_LabelStatistics(self):
+    """ Labels of the displayed slice are counted once per slice and
+    counted again after the label volume is modified.
+    """
+    self.delayDisplay("Starting the label statistics test")
+    imageData = vtk.vtkImageData()
+    imageData.SetDimensions(4, 3, 2)
+    imageData.AllocateScalars(vtk.VTK_SHORT, 1)
+    imageData.GetPointData().GetScalars().FillComponent(0, 0)
+    for i in range(3):
+      imageData.SetScalarComponentFromDouble(i, 0, 1, 0, 2)
+    imageData.SetScalarComponentFromDouble(3, 2, 1, 0, 5)
+    sliceToRAS = vtk.vtkMatrix4x4()
+    sliceToRAS.SetElement(2, 3, 1.0)
+    self.assertEqual(sliceAxis(vtk.vtkMatrix4x4(), sliceToRAS, (4, 3, 2)), (2, 1))
+    statistics = LabelStatistics(PixelReadout().arrayView)
+    sliceStatistics = statistics.sliceStatistics('label', 1, imageData, (0.5, 1.0, 2.0), 2, 1)
+    if sliceStatistics is None:
+      self.delayDisplay('NumPy is not available, skipped')
+      return
+    self.assertEqual(sliceStatistics.counts, {2: 3, 5: 1})
+    self.assertEqual(sliceStatistics.segmentCount(), 2)
+    self.assertEqual(sliceStatistics.area, 2.0)
+    self.assertTrue(statistics.sliceStatistics('label', 1, imageData, (0.5, 1.0, 2.0), 2, 1) is sliceStatistics)
+    self.assertEqual(statistics.sliceStatistics('label', 1, imageData, (0.5, 1.0, 2.0), 2, 0).counts, {})
+    imageData.SetScalarComponentFromDouble(0, 1, 1, 0, 2)
+    sliceStatistics = statistics.sliceStatistics('label', 2, imageData, (0.5, 1.0, 2.0), 2, 1)
+    self.assertEqual(sliceStatistics.counts, {2: 4, 5: 1})
+    engine = AnnotationEngine({}.get)
+    texts = engine.cornerTexts(AnnotationLayer('T2'), label=AnnotationLayer('label', opacity=1.0,
+      statistics=sliceStatistics))
+    self.assertEqual(texts[0], 'L: label (1.0)\nSegments: 2, 2.5 mm2\n2: 4, 5: 1\nB: T2\n')
+    self.delayDisplay('Test passed!')
+
+  def test_LabelCounts(self):
+    """ Labels are counted whatever their type and however large their
+    values.
+    """
+    self.delayDisplay("Starting the label counts test")
+    try:
+      import numpy
+    except ImportError:
+      self.delayDisplay('NumPy is not available, skipped')
+      return
+    labels = numpy.zeros((3, 4), dtype=numpy.uint64)
+    labels[0, :3] = 2
+    labels[2, 1] = 2 ** 40
+    self.assertEqual(labelCounts(labels), {2: 3, 2 ** 40: 1})
+    # sparse large labels are not counted with a counter per value
+    labels = numpy.zeros((3, 4), dtype=numpy.int32)
+    labels[1, :2] = 2 ** 31 - 1
+    labels[2, 3] = 7
+    self.assertEqual(labelCounts(labels), {2 ** 31 - 1: 2, 7: 1})
+    labels = numpy.array([[0, 1, -1], [1, 5, 0]], dtype=numpy.int16)
+    self.assertEqual(labelCounts(labels), {1: 2, -1: 1, 5: 1})
+    self.assertEqual(labelCounts(numpy.zeros((0, 4), dtype=numpy.uint8)), {})
+    self.delayDisplay('Test passed!')
+
+  def test_SlicePositionIndex(self):
+    """ The instance shown in a slice view is the slice within half a
+    spacing of the view plane, whatever the order and direction of the
+    slices, and none is shown in oblique views or outside the volume.
+    """
+    self.delayDisplay("Starting the slice position index test")
+    uids = ['1', '2', '3', '4']
+    ijkToRAS = [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0], [0.0, 0.0, 2.5, 10.0]]
+    index = SlicePositionIndex.fromGeometry(ijkToRAS, 4, uids)
+    normal = (0.0, 0.0, 1.0)
+    self.assertEqual(index.uidAt((0.0, 0.0, 12.5), normal), '2')
+    self.assertEqual(index.uidAt((5.0, -3.0, 13.7), normal), '2')
+    self.assertEqual(index.uidAt((0.0, 0.0, 13.8), normal), '3')
+    # half a spacing outside the first and last slices
+    self.assertEqual(index.uidAt((0.0, 0.0, 8.8), normal), '1')
+    self.assertEqual(index.uidAt((0.0, 0.0, 8.7), normal), None)
+    self.assertEqual(index.uidAt((0.0, 0.0, 18.8), normal), None)
+    # views looking the other way
+    self.assertEqual(index.uidAt((0.0, 0.0, 15.0), (0.0, 0.0, -2.0)), '3')
+    # slightly tilted views still show a slice, oblique views none
+    self.assertEqual(index.uidAt((0.0, 0.0, 12.5), (0.0, 0.1, 1.0)), '2')
+    self.assertEqual(index.uidAt((0.0, 0.0, 12.5), (0.0, 0.2, 1.0)), None)
+    self.assertEqual(index.uidAt((0.0, 0.0, 12.5), (0.0, 0.0, 0.0)), None)
+
+    # slices stored from head to feet
+    ijkToRAS[2][2] = -2.5
+    index = SlicePositionIndex.fromGeometry(ijkToRAS, 4, uids)
+    self.assertEqual(index.uidAt((0.0, 0.0, 5.0), normal), '3')
+    self.assertEqual(index.uidAt((0.0, 0.0, 10.0), normal), '1')
+    # unsorted positions
+    index = SlicePositionIndex((0.0, 0.0, 1.0), [15.0, 10.0, 12.5], ['3', '1', '2'])
+    self.assertEqual(index.uidAt((0.0, 0.0, 10.4), normal), '1')
+    self.assertEqual(index.uidAt((0.0, 0.0, 14.0), normal), '3')
+    # instances that are not one per slice cannot be indexed
+    self.assertEqual(SlicePositionIndex.fromGeometry(ijkToRAS, 3, uids), None)
+    self.delayDisplay('Test passed!')
+
+  def test_BatchExport(self):
+    """ Every series of a database gets a report row with its corner
+    texts, from the database values when the files cannot be parsed.
+    """
+    self.delayDisplay("Starting the batch export test")
+    class Database(object):
+      tags = {'0008,0060': 'MR', '0008,103e': 'T2', '0010,0010': 'Doe^John', '0018,0080': '2000'}
+      def patients(self):
+        return ['1']
+      def studiesForPatient(self, patient):
+        return ['1.1']
+      def seriesForStudy(self, study):
+        return ['1.1.1', '1.1.2']
+      def filesForSeries(self, series):
+        return ['/missing/%s.%d.dcm' % (series, i) for i in xrange(3)]
+      def instanceForFile(self, filePath):
+        return filePath[len('/missing/'):-len('.dcm')]
+      def cachedTag(self, uid, tag):
+        return ''
+      def loadFileHeader(self, filePath):
+        self.tags['0020,000e'] = filePath[len('/missing/'):-len('.0.dcm')]
+        # numbered in reverse order of the files
+        self.tags['0020,0013'] = str(3 - int(filePath[-len('0.dcm')]))
+      def headerValue(self, tag):
+        if tag not in self.tags:
+          return ''
+        return '(%s) LO [%s]' % (tag, self.tags[tag])
+    reportPath = os.path.join(slicer.app.temporaryPath, 'DICOMAnnotationsReport.jsonl')
+    export = BatchExport()
+    self.assertEqual(export.exportDatabase(Database(), reportPath), 2)
+    with open(reportPath) as reportFile:
+      rows = [json.loads(line) for line in reportFile]
+    self.assertEqual([row['SeriesInstanceUID'] for row in rows], ['1.1.1', '1.1.2'])
+    self.assertEqual(rows[0]['InstanceCount'], 3)
+    self.assertEqual(rows[0]['FilePath'], '/missing/1.1.1.2.dcm')
+    self.assertEqual(rows[0]['bottomLeft'], 'B: T2\n')
+    self.assertEqual(rows[0]['bottomRight'], 'TR 2000\nTE Unknown\n')
+    self.assertTrue(rows[0]['topLeft'].startswith('Doe, John\n'))
+    self.delayDisplay('Test passed!')
+
+  def test_ObserverRegistry(self):
+    """ Observers are added once, and none is left after removal.
+    """
+    self.delayDisplay("Starting the observer registry test")
+    calls = []
+    def onModified(caller, event):
+      calls.append(event)
+    observed = vtk.vtkObject()
+    observers = ObserverRegistry()
+    observers.addObserver('views', observed, vtk.vtkCommand.ModifiedEvent, onModified)
+    observers.addObserver('views', observed, vtk.vtkCommand.ModifiedEvent, onModified)
+    self.assertEqual(observers.count(), 1)
+    observed.Modified()
+    self.assertEqual(len(calls), 1)
+    timer = qt.QTimer()
+    observers.connect('timers', timer, 'timeout()', timer.stop)
+    self.assertEqual(observers.count('timers'), 1)
+    observers.removeGroup('views')
+    observed.Modified()
+    self.assertEqual(len(calls), 1)
+    observers.removeAll()
+    self.assertEqual(observers.count(), 0)
+    self.delayDisplay('Test passed!')
+
+  def test_PersistentHeaderCache(self):
+    """ Stored values are returned until the source file changes, and
+    the number of entries stays within the limit.
+    """
+    self.delayDisplay("Starting the persistent header cache test")
+    directory = os.path.join(slicer.app.temporaryPath, 'DICOMAnnotationsCacheTest')
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    filePaths = []
+    for i in xrange(4):
+      filePath = os.path.join(directory, '%d.dcm' % i)
+      with open(filePath, 'w') as instanceFile:
+        instanceFile.write('header')
+      filePaths.append(filePath)
+    cachePath = os.path.join(directory, 'headers.sqlite')
+    if os.path.exists(cachePath):
+      os.remove(cachePath)
+
+    cache = PersistentHeaderCache(cachePath, maximumEntries=3)
+    values = {'Patient Name': u'M\xfcller^Hans', 'Echo Time': 80.5, 'Instance Number': 1,
+      'Modality': 'MR'}
+    cache.put('1.1', filePaths[0], values, '1')
+    storedValues = PersistentHeaderCache(cachePath).get('1.1', filePaths[0])
+    self.assertEqual(storedValues, values)
+    # text is returned as unicode, as fresh reads from the database
+    self.assertEqual(type(storedValues['Modality']), type(u''))
+    texts = AnnotationEngine({'1.1': storedValues}.get).cornerTexts(AnnotationLayer('T2', '1.1'))
+    self.assertTrue(texts[2].startswith(u'M\xfcller, Hans\n'))
+    with open(filePaths[0], 'a') as instanceFile:
+      instanceFile.write('modified')
+    self.assertEqual(cache.get('1.1', filePaths[0]), None)
+
+    cache.putMany([('1.%d' % i, filePaths[i], values, '1') for i in xrange(4)])
+    self.assertEqual(len(cache), 3)
+    cache.clear()
+    self.assertEqual(len(cache), 0)
+    cache.close()
+    self.delayDisplay('Test passed!')
+
+  def test_Stress(self, viewCount=16, volumeCount=40, instanceCount=20, eventCount=400, seed=0):
+    """ Randomized layer swaps, opacity changes, scrolls and settings
+    changes in a large layout, run on the stand-ins of the slice views
+    and of the DICOM database in Testing/Python. Every event must stay
+    within the header reads, corner text changes and renders it can
+    require, so that work growing with the number of views, volumes or
+    tags fails the test.
+    """
+    self.delayDisplay("Starting the stress test")
+    eventTimes = self.runWithStandIns(self.runStress, viewCount, volumeCount, instanceCount,
+      eventCount, random.Random(seed))
+    self.delayDisplay('%d events in %d views with %d volumes: max %.1f ms, mean %.2f ms' % (
+      eventCount, viewCount, volumeCount, 1000 * max(eventTimes), 1000 * sum(eventTimes) / eventCount))
+    self.delayDisplay('Test passed!')
+
+  def runWithStandIns(self, function, *args):
+    """Return function(standIn, slicer, *args), called while the vtk, qt,
+    ctk and slicer modules this module uses are replaced by the stand-ins
+    of Testing/Python, standIn being the DICOMAnnotationsStandIn module.
+    The modules are restored when the function returns or fails.
+    """
+    testingPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Testing', 'Python')
+    if testingPath not in sys.path:
+      sys.path.append(testingPath)
+    try:
+      import DICOMAnnotationsStandIn
+    except ImportError:
+      self.fail('DICOMAnnotationsStandIn not found in %s' % testingPath)
+    moduleGlobals = globals()
+    standIns = DICOMAnnotationsStandIn.standInModules()
+    savedModules = dict((name, moduleGlobals[name]) for name in standIns)
+    moduleGlobals.update(standIns)
+    try:
+      return function(DICOMAnnotationsStandIn, standIns['slicer'], *args)
+    finally:
+      moduleGlobals.update(savedModules)
+
+  def runStress(self, standIn, slicer, viewCount, volumeCount, instanceCount, eventCount, rng):
+    layoutManager = slicer.app.layoutManager()
+    for index in xrange(viewCount):
+      layoutManager.addSliceView('Stress%d' % (index + 1))
+    volumes = []
+    for index in xrange(volumeCount):
+      # patients and studies shared by some of the volumes
+      uids = slicer.dicomDatabase.addSeries('1.2.826.0.2.%d' % (index + 1), instanceCount,
+        modality=('MR', 'CT', 'PT')[index % 3], patientID='%d' % (index % 4),
+        studyDate='201401%02d' % (index % 7 + 1), seriesDescription='Series %d' % (index + 1))
+      volumeNode = standIn.StandInVolumeNode('vtkMRMLScalarVolumeNodeStress%d' % (index + 1),
+        'Series %d' % (index + 1), uids)
+      slicer.mrmlScene.AddNode(volumeNode)
+      volumes.append(volumeNode)
+
+    widget = standIn.createWidget(sys.modules[__name__])
+    try:
+      reads = []
+      readValues = widget.headerReader.readValues
+      def countedReadValues(uid, *args):
+        reads.append(uid)
+        return readValues(uid, *args)
+      widget.headerReader.readValues = countedReadValues
+      sliceWidgets = [layoutManager.sliceWidget(name) for name in layoutManager.sliceViewNames()]
+      sliceLogics = [sliceWidget.sliceLogic() for sliceWidget in sliceWidgets]
+      for sliceLogic in sliceLogics:
+        sliceLogic.setLayers(rng.choice(volumes))
+      standIn.EventLoop.processEvents()
+
+      def counts():
+        return (len(reads),
+          sum([sliceWidget.sliceView().cornerAnnotation().setTextCalls for sliceWidget in sliceWidgets]),
+          sum([sliceWidget.sliceView().renders for sliceWidget in sliceWidgets]))
+
+      eventTimes = []
+      for event in xrange(eventCount):
+        action = rng.choice(('swap', 'swap', 'opacity', 'scroll', 'scroll', 'gui'))
+        before = counts()
+        startTime = time.time()
+        # at most (header reads, corner texts set, views rendered)
+        if action == 'swap':
+          # the first instances of both series and the displayed one
+          bounds = (3, 4, 1)
+          rng.choice(sliceLogics).setLayers(rng.choice(volumes), rng.choice(volumes + [None]),
+            foregroundOpacity=rng.random())
+        elif action == 'opacity':
+          # only the foreground opacity of the bottom left corner changes
+          bounds = (0, 1, 1)
+          compositeNode = rng.choice(sliceLogics).GetSliceCompositeNode()
+          compositeNode.foregroundOpacity = rng.random()
+          compositeNode.Modified()
+        elif action == 'scroll':
+          # one displayed instance per volume shown alone, and only the
+          # bottom right corners change
+          bounds = (len(set([sliceLogic.GetBackgroundLayer().GetVolumeNode() for sliceLogic in sliceLogics
+            if not sliceLogic.GetForegroundLayer().GetVolumeNode()])), viewCount, viewCount)
+          offset = rng.randrange(instanceCount) * volumes[0].GetSpacing()[2]
+          for sliceLogic in sliceLogics:
+            sliceLogic.GetSliceNode().SetSliceOffset(offset)
+        else:
+          # a font change leaves all the texts as they are
+          bounds = (0, 0, 0)
+          widget.fontSizeSpinBox.value = 10 + event % 10
+          widget.updateSliceViewFromGUI()
+        standIn.EventLoop.processEvents()
+        eventTimes.append(time.time() - startTime)
+        work = [after - before for after, before in zip(counts(), before)]
+        for name, done, bound in zip(('header reads', 'corner texts set', 'renders'), work, bounds):
+          self.assertTrue(done <= bound, 'event %d (%s): %d %s, at most %d expected' % (
+            event, action, done, name, bound))
+      # the header of an instance is read once
+      self.assertEqual(len(reads), len(set(reads)))
+      return eventTimes
+    finally:
+      widget.cleanup()
+
+  def createStandInScene(self, standIn, slicer, viewNames, seriesCount=2, instanceCount=10):
+    """Add slice views and DICOM volumes to the stand-in scene. Returns a
+    widget annotating the views and the volumes."""
+    layoutManager = slicer.app.layoutManager()
+    for viewName in viewNames:
+      layoutManager.addSliceView(viewName)
+    volumes = []
+    for index in xrange(seriesCount):
+      uids = slicer.dicomDatabase.addSeries('1.2.826.0.3.%d' % (index + 1), instanceCount,
+        seriesDescription='Series %d' % (index + 1))
+      volumes.append(slicer.mrmlScene.AddNode(standIn.StandInVolumeNode(
+        'vtkMRMLScalarVolumeNode%d' % (index + 1), 'Series %d' % (index + 1), uids)))
+    return standIn.createWidget(sys.modules[__name__]), volumes
+
+  def test_CursorReadout(self):
+    """ The values under the cursor are shown once per frame, and cursor
+    moves are ignored while the annotations are off.
+    """
+    self.delayDisplay("Starting the cursor readout test")
+    self.runWithStandIns(self.runCursorReadout)
+    self.delayDisplay('Test passed!')
+
+  def runCursorReadout(self, standIn, slicer):
+    widget, volumes = self.createStandInScene(standIn, slicer, ['Red'])
+    try:
+      sliceWidget = slicer.app.layoutManager().sliceWidget('Red')
+      sliceLogic = sliceWidget.sliceLogic()
+      sliceLogic.setLayers(volumes[0])
+      widget.pixelReadoutCheckBox.checked = True
+      widget.onPixelReadoutClicked()
+      standIn.EventLoop.processEvents()
+      crosshairNode = slicer.mrmlScene.GetFirstNodeByClass('vtkMRMLCrosshairNode')
+      annotation = sliceWidget.sliceView().cornerAnnotation()
+
+      def moveCursor():
+        setTextCalls, renders = annotation.setTextCalls, sliceWidget.sliceView().renders
+        for x in xrange(100):
+          crosshairNode.SetCursorPositionXYZ((x, 10, 0), sliceLogic.GetSliceNode())
+        standIn.EventLoop.processEvents()
+        return annotation.setTextCalls - setTextCalls, sliceWidget.sliceView().renders - renders
+
+      # the stand-in voxel values are i + j + k
+      self.assertEqual(moveCursor(), (1, 1))
+      self.assertTrue('B: 109\n' in annotation.GetText(1))
+
+      widget.dicomAnnotationsCheckBox.checked = False
+      widget.updateSliceViewFromGUI()
+      self.assertEqual(moveCursor(), (0, 0))
+      self.assertEqual(annotation.GetText(1), '')
+
+      widget.dicomAnnotationsCheckBox.checked = True
+      widget.updateSliceViewFromGUI()
+      moveCursor()
+      self.assertTrue('B: 109\n' in annotation.GetText(1))
+    finally:
+      widget.cleanup()
+
+  def test_AsynchronousUpdates(self):
+    """ Views waiting for the prefetcher are updated even when it cannot
+    read the headers they wait for.
+    """
+    self.delayDisplay("Starting the asynchronous updates test")
+    self.runWithStandIns(self.runAsynchronousUpdates)
+    self.delayDisplay('Test passed!')
+
+  def runAsynchronousUpdates(self, standIn, slicer):
+    widget, volumes = self.createStandInScene(standIn, slicer, ['Red'])
+    try:
+      widget.asynchronousUpdatesCheckBox.checked = True
+      widget.onAsynchronousUpdatesClicked()
+      sliceWidget = slicer.app.layoutManager().sliceWidget('Red')
+      annotation = sliceWidget.sliceView().cornerAnnotation()
+
+      # instances the database has no file for
+      missingVolume = slicer.mrmlScene.AddNode(standIn.StandInVolumeNode(
+        'vtkMRMLScalarVolumeNodeMissing', 'Missing', ['1.2.826.0.9.%d' % (index + 1) for index in xrange(10)]))
+      sliceWidget.sliceLogic().setLayers(missingVolume)
+      standIn.EventLoop.processEvents()
+      self.assertEqual(widget.waitingViews, {})
+      self.assertEqual(annotation.GetText(0), 'B: Missing\n')
+      self.assertTrue(annotation.GetText(2).startswith('Unknown\nID: Unknown\n'))
+
+      # headers read with fewer tags than the view now needs
+      widget.headerPrefetcher.tags = widget.headerPrefetcher.tags[:1]
+      sliceWidget.sliceLogic().setLayers(volumes[0])
+      standIn.EventLoop.processEvents()
+      self.assertEqual(widget.waitingViews, {})
+      self.assertTrue(annotation.GetText(2).startswith('Doe, John\nID: 1234\n'))
+    finally:
+      widget.cleanup()
+
+  def test_InstanceUIDsChange(self):
+    """ Views are updated when the instances of their volume change.
+    """
+    self.delayDisplay("Starting the instance UIDs change test")
+    self.runWithStandIns(self.runInstanceUIDsChange)
+    self.delayDisplay('Test passed!')
+
+  def runInstanceUIDsChange(self, standIn, slicer):
+    widget, volumes = self.createStandInScene(standIn, slicer, ['Red', 'Yellow'])
+    try:
+      layoutManager = slicer.app.layoutManager()
+      layoutManager.sliceWidget('Red').sliceLogic().setLayers(volumes[0])
+      layoutManager.sliceWidget('Yellow').sliceLogic().setLayers(volumes[1])
+      standIn.EventLoop.processEvents()
+      red = layoutManager.sliceWidget('Red').sliceView()
+      yellow = layoutManager.sliceWidget('Yellow').sliceView()
+      self.assertTrue(red.cornerAnnotation().GetText(2).startswith('Doe, John\n'))
+
+      uids = slicer.dicomDatabase.addSeries('1.2.826.0.3.9', 10, patientName='Roe^Jane')
+      renders = yellow.renders
+      volumes[0].SetAttribute('DICOM.instanceUIDs', ' '.join(uids))
+      standIn.EventLoop.processEvents()
+      self.assertTrue(red.cornerAnnotation().GetText(2).startswith('Roe, Jane\n'))
+      self.assertEqual(yellow.renders, renders)
+    finally:
+      widget.cleanup()
+
+  def test_HeaderReader(self):
+    """ Values read through the DICOM database load each header at most
+    once, and not at all for the tags the database caches. The tags of
+    imported instances and of the instances of loaded volumes are cached
+    ahead of display when the files cannot be parsed.
+    """
+    self.delayDisplay("Starting the header reader test")
+    self.runWithStandIns(self.runHeaderReader)
+    if not canReadFiles():
+      self.runWithStandIns(self.runTagPrecache)
+    self.delayDisplay('Test passed!')
+
+  def runHeaderReader(self, standIn, slicer):
+    database = slicer.dicomDatabase
+    reader = HeaderReader(database)
+    uids = database.addSeries('1.2.826.0.4.1', 3)
+    database.resetCounters()
+    values = reader.readDatabaseValues(database.fileForInstance(uids[0]))
+    self.assertEqual(database.headerLoads, 1)
+    self.assertEqual(values['Patient Name'], 'Doe^John')
+    self.assertEqual(values['Protocol Name'], 'Unknown')
+    self.assertEqual(values['Slice Location'], 0.0)
+
+    database.resetCounters()
+    values = reader.readDatabaseValues('')
+    self.assertEqual(database.headerLoads, 0)
+    self.assertEqual(values['Patient Name'], 'Unknown')
+
+    reader.registerTagsToPrecache()
+    uids = database.indexSeries('1.2.826.0.4.2', 3)
+    database.resetCounters()
+    values = reader.readValues(uids[1])
+    self.assertEqual(database.headerLoads, 0)
+    self.assertEqual(values['Instance Number'], 2)
+    self.assertEqual(values['Protocol Name'], 'Unknown')
+
+    # indexed before the tags were registered
+    uids = database.addSeries('1.2.826.0.4.3', 3)
+    database.resetCounters()
+    reader.precacheInstance(uids[0])
+    reader.precacheInstance(uids[0])
+    self.assertEqual(database.headerLoads, 1)
+    self.assertEqual(reader.readValues(uids[0])['Patient Name'], 'Doe^John')
+    self.assertEqual(database.headerLoads, 1)
+
+  def runTagPrecache(self, standIn, slicer):
+    widget, volumes = self.createStandInScene(standIn, slicer, ['Red'], seriesCount=0)
+    try:
+      database = slicer.dicomDatabase
+      reader = HeaderReader(database)
+      existingUids = database.addSeries('1.2.826.0.4.1', 10)
+      standIn.EventLoop.processEvents()
+      slicer.mrmlScene.AddNode(standIn.StandInVolumeNode('vtkMRMLScalarVolumeNode1', 'Series 1', existingUids))
+      standIn.EventLoop.processEvents()
+      importedUids = database.indexSeries('1.2.826.0.4.2', 10)
+      standIn.EventLoop.processEvents()
+      database.resetCounters()
+      for uid in existingUids + importedUids:
+        reader.readValues(uid, *widget.annotationTags)
+      self.assertEqual(database.headerLoads, 0)
+
+      # the headers of every slice were read ahead
+      reads = []
+      readValues = widget.headerReader.readValues
+      def countedReadValues(uid, *args):
+        reads.append(uid)
+        return readValues(uid, *args)
+      widget.headerReader.readValues = countedReadValues
+      sliceLogic = slicer.app.layoutManager().sliceWidget('Red').sliceLogic()
+      sliceLogic.setLayers(slicer.mrmlScene.GetNodeByID('vtkMRMLScalarVolumeNode1'))
+      for index in xrange(10):
+        sliceLogic.GetSliceNode().SetSliceOffset(index * 2.5)
+      standIn.EventLoop.processEvents()
+      self.assertEqual(reads, [])
+      self.assertEqual(database.headerLoads, 0)
+    finally:
+      widget.cleanup()
+
+  def test_SliceViewDiscovery(self):
+    """ Slice views added to the layout are annotated, and removed views
+    are no longer observed.
+    """
+    self.delayDisplay("Starting the slice view discovery test")
+    self.runWithStandIns(self.runSliceViewDiscovery)
+    self.delayDisplay('Test passed!')
+
+  def runSliceViewDiscovery(self, standIn, slicer):
+    widget, volumes = self.createStandInScene(standIn, slicer, ['Red'])
+    try:
+      layoutManager = slicer.app.layoutManager()
+      observerCount = widget.observers.count('sliceLogic')
+      green = layoutManager.addSliceView('Green')
+      standIn.EventLoop.processEvents()
+      self.assertEqual(widget.sliceViewNames, set(['Red', 'Green']))
+      self.assertEqual(widget.observers.count('sliceLogic'), observerCount + 1)
+      green.sliceLogic().setLayers(volumes[0])
+      standIn.EventLoop.processEvents()
+      self.assertEqual(green.sliceView().cornerAnnotation().GetText(0), 'B: Series 1\n')
+
+      red = layoutManager.removeSliceView('Red')
+      standIn.EventLoop.processEvents()
+      self.assertEqual(widget.sliceViewNames, set(['Green']))
+      self.assertEqual(widget.observers.count('sliceLogic'), observerCount)
+      self.assertFalse('Red' in widget.sliceCornerAnnotations)
+      setTextCalls = red.sliceView().cornerAnnotation().setTextCalls
+      red.sliceLogic().setLayers(volumes[1])
+      standIn.EventLoop.processEvents()
+      self.assertEqual(red.sliceView().cornerAnnotation().setTextCalls, setTextCalls)
+    finally:
+      widget.cleanup()
+
+  def test_SceneBatchProcessing(self):
+    """ Views are updated once at the end of a scene batch, however many
+    changes it makes.
+    """
+    self.delayDisplay("Starting the scene batch processing test")
+    self.runWithStandIns(self.runSceneBatchProcessing)
+    self.delayDisplay('Test passed!')
+
+  def runSceneBatchProcessing(self, standIn, slicer):
+    widget, volumes = self.createStandInScene(standIn, slicer, ['Red', 'Yellow', 'Green'])
+    try:
+      layoutManager = slicer.app.layoutManager()
+      sliceWidgets = [layoutManager.sliceWidget(name) for name in ('Red', 'Yellow', 'Green')]
+      renders = [sliceWidget.sliceView().renders for sliceWidget in sliceWidgets]
+      def newRenders():
+        return [sliceWidget.sliceView().renders - count for sliceWidget, count in zip(sliceWidgets, renders)]
+      scene = slicer.mrmlScene
+      # batches can be nested
+      scene.StartState(slicer.vtkMRMLScene.BatchProcessState)
+      scene.StartState(slicer.vtkMRMLScene.BatchProcessState)
+      for index in xrange(20):
+        for sliceWidget in sliceWidgets[:2]:
+          sliceWidget.sliceLogic().setLayers(volumes[index % 2])
+      scene.EndState(slicer.vtkMRMLScene.BatchProcessState)
+      standIn.EventLoop.processEvents()
+      self.assertEqual(newRenders(), [0, 0, 0])
+
+      scene.EndState(slicer.vtkMRMLScene.BatchProcessState)
+      standIn.EventLoop.processEvents()
+      self.assertEqual(newRenders(), [1, 1, 0])
+      for sliceWidget in sliceWidgets[:2]:
+        self.assertEqual(sliceWidget.sliceView().cornerAnnotation().GetText(0), 'B: Series 2\n')
+    finally:
+      widget.cleanup()
+
+  def test_LabelEdit(self):
+    """ Editing a label volume updates the statistics of the views that
+    show it, without rendering the views whose slice did not change.
+    """
+    self.delayDisplay("Starting the label edit test")
+    try:
+      import numpy
+    except ImportError:
+      self.delayDisplay('NumPy is not available, skipped')
+      return
+    self.runWithStandIns(self.runLabelEdit, numpy)
+    self.delayDisplay('Test passed!')
+
+  def runLabelEdit(self, standIn, slicer, numpy):
+    widget, volumes = self.createStandInScene(standIn, slicer, ['Red', 'Yellow'])
+    try:
+      layoutManager = slicer.app.layoutManager()
+      labelVolume = slicer.mrmlScene.AddNode(standIn.StandInVolumeNode('vtkMRMLLabelMapVolumeNode1',
+        'label', dimensions=(4, 3, 2), spacing=(1.0, 1.0, 2.5)))
+      labelVolume.GetImageData().scalars = standIn.StandInVTKObject()
+      # (k, j, i) voxels
+      labels = numpy.zeros((2, 3, 4), dtype=numpy.int16)
+      labels[0, 0, :] = 1
+      labels[1, 1, :2] = 2
+      # the stand-in image has no VTK array to view
+      widget.labelStatistics = LabelStatistics(lambda imageData: labels[..., numpy.newaxis])
+      red, yellow = [layoutManager.sliceWidget(name) for name in ('Red', 'Yellow')]
+      yellow.sliceLogic().GetSliceNode().SetSliceOffset(2.5)
+      for sliceWidget in (red, yellow):
+        sliceWidget.sliceLogic().setLayers(volumes[0], label=labelVolume, labelOpacity=1.0)
+      standIn.EventLoop.processEvents()
+      self.assertEqual(red.sliceView().cornerAnnotation().GetText(0),
+        'L: label (1.0)\nSegments: 1, 4.0 mm2\n1: 4\nB: Series 1\n')
+      self.assertEqual(yellow.sliceView().cornerAnnotation().GetText(0),
+        'L: label (1.0)\nSegments: 1, 2.0 mm2\n2: 2\nB: Series 1\n')
+
+      renders = red.sliceView().renders
+      labels[1, 2, 3] = 3
+      labelVolume.ModifyImageData()
+      standIn.EventLoop.processEvents()
+      self.assertEqual(yellow.sliceView().cornerAnnotation().GetText(0),
+        'L: label (1.0)\nSegments: 2, 3.0 mm2\n2: 2, 3: 1\nB: Series 1\n')
+      self.assertEqual(red.sliceView().renders, renders)
+    finally:
+      widget.cleanup()
+
+  def test_EventCapture(self):
+    """ Only the sampled events are traced, and the details of the other
+    events are not gathered.
+    """
+    self.delayDisplay("Starting the event capture test")
+    self.runWithStandIns(self.runEventCapture)
+    self.delayDisplay('Test passed!')
+
+  def runEventCapture(self, standIn, slicer):
+    widget, volumes = self.createStandInScene(standIn, slicer, ['Red'])
+    try:
+      sliceLogic = slicer.app.layoutManager().sliceWidget('Red').sliceLogic()
+      sliceLogic.setLayers(volumes[0])
+      details = []
+      eventDetails = widget.eventDetails
+      def countedEventDetails(sliceLogic):
+        details.append(sliceLogic)
+        return eventDetails(sliceLogic)
+      widget.eventDetails = countedEventDetails
+      widget.startEventCapture('trace', samplingInterval=10)
+      for index in xrange(100):
+        sliceLogic.GetSliceNode().SetSliceOffset(index * 2.5)
+      filePath = widget.stopEventCapture()
+      self.assertEqual(len(details), 10)
+      with open(filePath) as traceFile:
+        traceEvents = json.load(traceFile)['traceEvents']
+      os.remove(filePath)
+      self.assertEqual(len(traceEvents), 10)
+      self.assertEqual(traceEvents[0]['args']['background'], volumes[0].GetID())
+
+      # a time limited capture ends without events
+      widget.captureButton.checked = True
+      capture = widget.startEventCapture('trace', maximumSeconds=60)
+      standIn.EventLoop.processEvents()
+      self.assertEqual(widget.eventCapture, None)
+      self.assertFalse(widget.captureButton.checked)
+      os.remove(capture.filePath)
+    finally:
+      widget.cleanup()
+
+  def test_StandaloneWidget(self):
+    """ The widget can be created without a parent, which sets it up in
+    a widget of its own.
+    """
+    self.delayDisplay("Starting the standalone widget test")
+    self.runWithStandIns(self.runStandaloneWidget)
+    self.delayDisplay('Test passed!')
+
+  def runStandaloneWidget(self, standIn, slicer):
+    slicer.app.layoutManager().addSliceView('Red')
+    widget = DICOMAnnotationsWidget()
+    try:
+      self.assertTrue(widget.observers.count('scene') > 0)
+      widget.dicomAnnotationsCheckBox.checked = True
+      widget.updateSliceViewFromGUI()
+      self.assertEqual(widget.sliceViewNames, set(['Red']))
+    finally:
+      widget.cleanup()
@@ -0,0 +1,120 @@
+from .CornerTemplates import CornerTemplates, CORNERS, dicomField, formatFieldValue
+from .SeriesIdentity import LayerComparison
+
+#
+# AnnotationLayer
+#
+
+class AnnotationLayer(object):
+  """What the engine needs to know about a layer of a slice view: the
+  volume name, the UID of its first instance (None for non-DICOM
+  volumes), the UID of the displayed instance if known, the layer
+  opacity for foreground and label layers, and the SliceStatistics of
+  the displayed slice for label layers.
+  """
+
+  def __init__(self, name, uid=None, instanceUid=None, opacity=None, statistics=None):
+    self.name = name
+    self.uid = uid
+    self.instanceUid = instanceUid
+    self.opacity = opacity
+    self.statistics = statistics
+
+#
+# AnnotationEngine
+#
+
+class AnnotationEngine(object):
+  """Builds the four corner texts of a slice view from DICOM tag values.
+
+  The engine does not depend on slicer, qt or vtk. Tag values are
+  obtained by calling valuesForUid(uid), which returns the name -> value
+  dictionary of an instance, as read by HeaderReader. The engine does not
+  modify the returned dictionaries.
+
+  The texts are rendered by the CornerTemplates given, or by the default
+  templates. When two layers are shown, their values are compared once
+  per pair of series by a LayerComparison. Only the fields used by the
+  templates of the enabled corners are formatted, and the header values
+  of a layer are not looked up when no enabled corner uses them.
+
+  Texts are returned in vtkCornerAnnotation order: bottom left, bottom
+  right, top left, top right.
+  """
+
+  # labels listed with their voxel count
+  maximumLabelVoxels = 6
+
+  def __init__(self, valuesForUid, templates=None):
+    self.valuesForUid = valuesForUid
+    self.templates = templates or CornerTemplates()
+    self.layerComparison = LayerComparison()
+
+  def cornerTexts(self, background=None, foreground=None, label=None,
+      topLeft=True, topRight=True, bottomLeft=True, bottomRight=True, wideView=True):
+    """Return the four corner strings for the given AnnotationLayer
+    descriptors. wideView tells whether the view is wide enough for the
+    top right corner.
+
+    When both a background and a foreground are shown, DICOM values are
+    only displayed in the top left corner, and only if both layers come
+    from the same patient.
+    """
+    twoLayers = background is not None and foreground is not None
+    layer = background if background is not None else foreground
+    enabled = {'bottomLeft': bottomLeft, 'bottomRight': bottomRight and not twoLayers,
+      'topLeft': topLeft, 'topRight': topRight and wideView and not twoLayers}
+
+    values = {}
+    if background is not None:
+      values['BackgroundName'] = background.name
+    if foreground is not None:
+      values['ForegroundName'] = foreground.name
+      if twoLayers:
+        values['ForegroundOpacity'] = "%.1f"%foreground.opacity
+    if label is not None:
+      values['LabelName'] = label.name
+      values['LabelOpacity'] = "%.1f"%label.opacity
+      if label.statistics is not None and label.statistics.counts:
+        self.addLabelStatistics(values, label.statistics)
+
+    seriesValues = None
+    if layer is not None and layer.uid and (enabled['topLeft'] or enabled['topRight'] or enabled['bottomRight']):
+      seriesValues = self.valuesForUid(layer.uid)
+    renderers = self.templates.renderers(seriesValues.get('Modality') if seriesValues else None)
+
+    fields = set()
+    for corner in CORNERS:
+      if enabled[corner]:
+        fields.update(renderers[corner].fields)
+    if seriesValues is not None:
+      if twoLayers:
+        if foreground.uid:
+          values.update(self.layerComparison.layerValues(background.uid, seriesValues,
+            foreground.uid, self.valuesForUid(foreground.uid), fields))
+      else:
+        instanceValues = None
+        if layer.instanceUid:
+          instanceValues = self.valuesForUid(layer.instanceUid)
+        for field in fields:
+          if dicomField(field) == field:
+            self.addFieldValue(values, field, field, seriesValues, instanceValues)
+
+    return [renderers[corner].render(values) if enabled[corner] else '' for corner in CORNERS]
+
+  def addLabelStatistics(self, values, statistics):
+    values['LabelSegments'] = '%d' % statistics.segmentCount()
+    values['LabelArea'] = '%.1f' % statistics.area
+    labels = sorted(statistics.counts.keys())
+    labelVoxels = ['%d: %d' % (labelValue, statistics.counts[labelValue])
+      for labelValue in labels[:self.maximumLabelVoxels]]
+    if len(labels) > self.maximumLabelVoxels:
+      labelVoxels.append('...')
+    values['LabelVoxels'] = ', '.join(labelVoxels)
+
+  def addFieldValue(self, values, key, field, seriesValues, instanceValues):
+    """Format field from the header values and store it in values under
+    key, unless the field is left out."""
+    text = formatFieldValue(field, seriesValues, instanceValues)
+    if text is not None:
+      values[key] = text
@@ -0,0 +1,269 @@
+"""Headless export of the corner annotations of every series of a DICOM
+database or folder.
+
+Runs inside Slicer, through DICOMAnnotationsLogic.exportAnnotations, or
+with a plain Python interpreter from the module directory:
+
+  python -m DICOMAnnotationsLib.BatchExport <folder> <report.jsonl|report.csv>
+                                            [--templates file] [--processes N]
+"""
+import os
+import sys
+import csv
+import json
+import time
+import itertools
+import multiprocessing
+
+from .HeaderReader import HeaderReader, readHeaderFile, canReadFiles
+from .CornerTemplates import CornerTemplates, CORNERS
+from .AnnotationEngine import AnnotationEngine, AnnotationLayer
+
+# report columns, followed by the corner texts
+REPORT_FIELDS = ('SeriesInstanceUID', 'Modality', 'InstanceCount', 'FilePath')
+
+def windows(iterable, size):
+  """Split iterable into lists of at most size items, reading it lazily."""
+  iterator = iter(iterable)
+  while True:
+    window = list(itertools.islice(iterator, size))
+    if not window:
+      return
+    yield window
+
+def dicomFiles(folderPath):
+  """Yield the paths of the files under folderPath, in a stable order."""
+  for directory, directoryNames, fileNames in os.walk(folderPath):
+    directoryNames.sort()
+    for fileName in sorted(fileNames):
+      yield os.path.join(directory, fileName)
+
+def instanceOrder(filePath, values):
+  """Sort key of the instances of a series, the first one standing for
+  the series: by Instance Number, instances without a number last."""
+  instanceNumber = values.get('Instance Number')
+  if not isinstance(instanceNumber, int):
+    instanceNumber = sys.maxsize
+  return (instanceNumber, filePath)
+
+def databaseSeries(database):
+  """Yield (series instance UID, file paths) for every series of a
+  ctkDICOMDatabase, one series at a time."""
+  for patient in database.patients():
+    for study in database.studiesForPatient(patient):
+      for series in database.seriesForStudy(study):
+        filePaths = database.filesForSeries(series)
+        if filePaths:
+          yield series, filePaths
+
+#
+# Worker processes
+#
+
+# (tags, modalityTags) profile read by the worker process
+workerProfile = None
+
+def initializeWorker(tags, modalityTags):
+  global workerProfile
+  workerProfile = (tags, modalityTags)
+
+def readWorkerFile(request):
+  """Read the header of the file of a (key, filePath) request. Returns
+  (key, filePath, values), values being None if the file cannot be read."""
+  key, filePath = request
+  return key, filePath, readHeaderFile(filePath, *workerProfile)
+
+#
+# ReportWriter
+#
+
+class ReportWriter(object):
+  """Writes one row per series to a JSON lines file, or to a CSV file if
+  the path ends with .csv. Rows are written as they come, so that the
+  report of a large database is never held in memory.
+  """
+
+  def __init__(self, reportPath):
+    self.isCSV = reportPath.lower().endswith('.csv')
+    if self.isCSV and sys.version_info[0] < 3:
+      self.reportFile = open(reportPath, 'wb')
+    elif self.isCSV:
+      self.reportFile = open(reportPath, 'w', newline='')
+    else:
+      self.reportFile = open(reportPath, 'w')
+    self.fieldNames = REPORT_FIELDS + CORNERS
+    if self.isCSV:
+      self.csvWriter = csv.writer(self.reportFile)
+      self.csvWriter.writerow(self.fieldNames)
+
+  def write(self, row):
+    if not self.isCSV:
+      self.reportFile.write(json.dumps(row, sort_keys=True) + '\n')
+      return
+    cells = []
+    for name in self.fieldNames:
+      cell = row.get(name, '')
+      if sys.version_info[0] < 3 and isinstance(cell, unicode):
+        cell = cell.encode('utf-8')
+      cells.append(cell)
+    self.csvWriter.writerow(cells)
+
+  def close(self):
+    self.reportFile.close()
+
+#
+# BatchExport
+#
+
+class BatchExport(object):
+  """Computes the corner texts a slice view would show for every series,
+  without views, and writes them to a report.
+
+  Each series is annotated as the only layer of a wide view with all the
+  corners enabled, from the values of its instance with the lowest
+  Instance Number, whether it comes from a database or a folder, so the
+  instance level fields of the displayed slice are left out.
+
+  Headers are read in the calling process by default. With processes
+  set, they are read by a pool of that many workers (None for one per
+  core), which is only for a plain Python interpreter, as main() does:
+  a process started from Slicer runs Slicer again. Files are handed to
+  the pool windowSize at a time, so that memory use does not grow with
+  the number of instances. When pydicom cannot read a file of a database,
+  the values are taken from the database instead, in the calling
+  process, as HeaderReader does.
+  """
+
+  def __init__(self, templates=None, processes=0, chunkSize=16, windowSize=1024):
+    self.templates = templates or CornerTemplates()
+    self.processes = processes
+    self.chunkSize = chunkSize
+    self.windowSize = windowSize
+    self.tags, self.modalityTags = self.templates.headerTags()
+    self.engine = AnnotationEngine(self.seriesValues, self.templates)
+    self.values = {}
+    self.skippedFiles = 0
+
+  def seriesValues(self, uid):
+    return self.values[uid]
+
+  def exportDatabase(self, database, reportPath):
+    """Write the report of the series of a ctkDICOMDatabase. Returns the
+    number of series written."""
+    reader = HeaderReader(database)
+
+    def requests():
+      for series, filePaths in databaseSeries(database):
+        for filePath in filePaths:
+          yield (series, len(filePaths)), filePath
+
+    writer = ReportWriter(reportPath)
+    try:
+      count = 0
+      # [series, order, file path, values, instance count] of the first
+      # instance so far of the series being read, whose files come in a row
+      entry = None
+      for (series, instanceCount), filePath, values in self.readFiles(requests()):
+        if values is None:
+          values = reader.readDatabaseValues(filePath, self.tags, self.modalityTags)
+        if entry is not None and entry[0] != series:
+          writer.write(self.reportRow(entry[0], entry[2], entry[4], entry[3]))
+          count += 1
+          entry = None
+        order = instanceOrder(filePath, values)
+        if entry is None or order < entry[1]:
+          entry = [series, order, filePath, values, instanceCount]
+      if entry is not None:
+        writer.write(self.reportRow(entry[0], entry[2], entry[4], entry[3]))
+        count += 1
+    finally:
+      writer.close()
+    return count
+
+  def exportFolder(self, folderPath, reportPath):
+    """Write the report of the DICOM files found under folderPath, which
+    requires pydicom. Returns the number of series written."""
+    if not canReadFiles():
+      raise ValueError("Reading DICOM files without the DICOM database requires pydicom")
+    # series instance UID -> [(instance number, file path), file path, values, instance count]
+    series = {}
+    self.skippedFiles = 0
+    requests = ((None, filePath) for filePath in dicomFiles(folderPath))
+    for key, filePath, values in self.readFiles(requests):
+      if values is None:
+        self.skippedFiles += 1
+        continue
+      uid = values.get('Series Instance UID')
+      order = instanceOrder(filePath, values)
+      entry = series.get(uid)
+      if entry is None:
+        series[uid] = [order, filePath, values, 1]
+        continue
+      entry[3] += 1
+      if order < entry[0]:
+        entry[:3] = [order, filePath, values]
+
+    count = len(series)
+    writer = ReportWriter(reportPath)
+    try:
+      for uid in sorted(series.keys()):
+        order, filePath, values, instanceCount = series.pop(uid)
+        writer.write(self.reportRow(uid, filePath, instanceCount, values))
+    finally:
+      writer.close()
+    return count
+
+  def readFiles(self, requests):
+    """Read the headers of the (key, filePath) requests, yielding
+    (key, filePath, values) in the order of the requests."""
+    processes = self.processes
+    if not canReadFiles():
+      processes = 0
+    pool = None
+    if processes != 0:
+      pool = multiprocessing.Pool(processes, initializeWorker, (self.tags, self.modalityTags))
+    else:
+      initializeWorker(self.tags, self.modalityTags)
+    try:
+      for window in windows(requests, self.windowSize):
+        if pool is None:
+          results = [readWorkerFile(request) for request in window]
+        else:
+          results = pool.imap(readWorkerFile, window, self.chunkSize)
+        for result in results:
+          yield result
+    finally:
+      if pool is not None:
+        pool.terminate()
+        pool.join()
+
+  def reportRow(self, uid, filePath, instanceCount, values):
+    self.values = {uid: values}
+    texts = self.engine.cornerTexts(AnnotationLayer(values.get('Series Description'), uid))
+    row = {
+      'SeriesInstanceUID': uid,
+      'Modality': values.get('Modality'),
+      'InstanceCount': instanceCount,
+      'FilePath': filePath,
+      }
+    row.update(zip(CORNERS, texts))
+    return row
+
+def main(argv=None):
+  import argparse
+  parser = argparse.ArgumentParser(description="Write the DICOM corner annotations of every series found in a folder.")
+  parser.add_argument('folder', help="folder of DICOM files, searched recursively")
+  parser.add_argument('report', help="report file, CSV if it ends with .csv, JSON lines otherwise")
+  parser.add_argument('--templates', help="JSON or YAML corner templates file")
+  parser.add_argument('--processes', type=int, default=None,
+    help="number of reading processes, 0 to read in this process (default: one per core)")
+  args = parser.parse_args(argv)
+  templates = CornerTemplates.fromFile(args.templates) if args.templates else None
+  export = BatchExport(templates, args.processes)
+  startTime = time.time()
+  count = export.exportFolder(args.folder, args.report)
+  print('%d series written to %s in %.1f s, %d files skipped' % (count, args.report,
+    time.time() - startTime, export.skippedFiles))
+
+if __name__ == '__main__':
+  main()
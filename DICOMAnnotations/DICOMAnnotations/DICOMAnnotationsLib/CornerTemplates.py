@@ -0,0 +1,345 @@
+import re
+import json
+
+try:
+  import yaml
+except ImportError:
+  yaml = None
+
+from .HeaderReader import GENERIC_TAGS, UNKNOWN_VALUE, stringTypes
+
+try:
+  textType = unicode
+except NameError:
+  textType = str
+from .ModalityProfiles import (SERIES, INSTANCE, INSTANCE_OR_SERIES, PROFILES, PROFILE_FIELDS,
+  modalityTags)
+
+#
+# Value formatting
+#
+
+def formatDICOMDate(date):
+  return date[4:6] + '/' + date[6:]+ '/' + date[:4]
+
+def formatDICOMTime(time):
+  studyH = time[:2]
+  if int(studyH) > 12 :
+    studyH = str (int(studyH) - 12)
+    clockTime = ' PM'
+  else:
+    studyH = studyH
+    clockTime = ' AM'
+  studyM = time[2:4]
+  studyS = time[4:6]
+  return studyH + ':' + studyM  + ':' + studyS +clockTime
+
+def formatDICOMNumber(value):
+  # numeric values are read as float, display them without trailing zeros
+  if isinstance(value, float):
+    return ('%f' % value).rstrip('0').rstrip('.')
+  return '%s' % value
+
+def formatText(value):
+  # database and pydicom values can be unicode, and str() of a non-ASCII
+  # unicode value fails on Python 2
+  if isinstance(value, textType):
+    return value
+  if isinstance(value, bytes):
+    return value.decode('utf-8', 'replace')
+  return textType(value)
+
+def formatPersonName(name):
+  return name.replace('^',', ')
+
+# Formats fields can use
+FORMATTERS = {
+  'text': formatText,
+  'person': formatPersonName,
+  'date': formatDICOMDate,
+  'time': formatDICOMTime,
+  'number': formatDICOMNumber,
+  }
+
+#
+# Fields
+#
+
+# field name: (header value name, format, source, leave out unknown values)
+# Unknown values that are not left out are shown as they are, unformatted.
+# Modality specific fields are declared by the ModalityProfiles.
+FIELDS = {
+  'PatientName': ('Patient Name', 'person', SERIES, False),
+  'PatientID': ('Patient ID', 'text', SERIES, False),
+  'PatientBirthDate': ('Patient Birth Date', 'date', SERIES, False),
+  'PatientAge': ('Patient Age', 'text', SERIES, False),
+  'PatientSex': ('Patient Sex', 'text', SERIES, False),
+  'PatientComments': ('Patient Comments', 'text', SERIES, True),
+  'StudyDate': ('Study Date', 'date', SERIES, False),
+  'StudyTime': ('Study Time', 'time', SERIES, False),
+  'StudyDescription': ('Study Description', 'text', SERIES, False),
+  'StudyID': ('Study ID', 'text', SERIES, False),
+  'SeriesDescription': ('Series Description', 'text', SERIES, False),
+  'SeriesNumber': ('Series Number', 'number', SERIES, False),
+  'Modality': ('Modality', 'text', SERIES, False),
+  'ProtocolName': ('Protocol Name', 'text', SERIES, False),
+  'InstitutionName': ('Institution Name', 'text', SERIES, False),
+  'ReferringPhysicianName': ('Referring Physician Name', 'person', SERIES, False),
+  'Manufacturer': ('Manufacturer', 'text', SERIES, False),
+  'Model': ('Model', 'text', SERIES, False),
+  'PatientPosition': ('Patient Position', 'text', SERIES, False),
+  'InstanceNumber': ('Instance Number', 'number', INSTANCE, True),
+  'SliceLocation': ('Slice Location', 'number', INSTANCE, True),
+  'AcquisitionTime': ('Acquisition Time', 'time', INSTANCE, True),
+  'ImageComments': ('Image Comments', 'text', INSTANCE, True),
+  }
+
+# Fields describing the layers rather than the DICOM headers. The
+# LabelSegments, LabelArea and LabelVoxels statistics are of the
+# displayed label slice.
+LAYER_FIELDS = ('BackgroundName', 'ForegroundName', 'ForegroundOpacity', 'LabelName', 'LabelOpacity',
+  'LabelSegments', 'LabelArea', 'LabelVoxels')
+
+# Prefixes of the fields that are shown separately for the background and
+# the foreground when the two differ
+LAYER_PREFIXES = ('Background', 'Foreground')
+
+# Always read: needed to choose the template and to compare the layers
+REQUIRED_VALUES = ('Modality', 'Patient Name', 'Patient ID', 'Patient Birth Date', 'Study Instance UID',
+  'Series Instance UID')
+
+RAW_TAG = re.compile(r'^[0-9a-fA-F]{4},[0-9a-fA-F]{4}$')
+
+def fieldSpec(field):
+  """Return (header value name, formatter, source, leave out unknown
+  values) for field, from FIELDS or the modality profiles. A "gggg,eeee"
+  field is the raw value of that tag."""
+  spec = FIELDS.get(field) or PROFILE_FIELDS.get(field)
+  if spec:
+    name, formatName, source, omitUnknown = spec
+    return name, FORMATTERS[formatName], source, omitUnknown
+  if RAW_TAG.match(field):
+    return (field.lower(), formatText, INSTANCE_OR_SERIES, True)
+  return None
+
+def formatFieldValue(field, seriesValues, instanceValues=None):
+  """Return the text of field from the header values of the first
+  instance of the series and of the displayed instance, or None if the
+  field is left out."""
+  name, formatter, source, omitUnknown = fieldSpec(field)
+  if source == INSTANCE or (source == INSTANCE_OR_SERIES and instanceValues is not None):
+    if instanceValues is None:
+      return None
+    seriesValues = instanceValues
+  value = seriesValues.get(name, UNKNOWN_VALUE)
+  if value == UNKNOWN_VALUE:
+    return None if omitUnknown else UNKNOWN_VALUE
+  return formatter(value)
+
+def dicomField(field):
+  """Return the DICOM field a template field refers to, without its
+  Background/Foreground prefix, or None for layer and unknown fields."""
+  if field in LAYER_FIELDS:
+    return None
+  for prefix in LAYER_PREFIXES:
+    if field.startswith(prefix) and fieldSpec(field[len(prefix):]):
+      return field[len(prefix):]
+  return field if fieldSpec(field) else None
+
+#
+# Templates
+#
+
+CORNERS = ('bottomLeft', 'bottomRight', 'topLeft', 'topRight')
+
+# A corner template is a list of lines, or a string of lines separated by
+# newlines. A line is left out unless all the fields it uses have a value.
+# A line can also be a list of alternatives, of which the first one with
+# all its values is shown. The bottom right corner of the modalities with
+# a profile also shows the profile lines.
+DEFAULT_TEMPLATES = {
+  'default': {
+    'bottomLeft': [
+      'L: {LabelName} ({LabelOpacity})',
+      'Segments: {LabelSegments}, {LabelArea} mm2',
+      '{LabelVoxels}',
+      ['F: {ForegroundName} ({ForegroundOpacity})', 'F: {ForegroundName}'],
+      'B: {BackgroundName}',
+      ],
+    'bottomRight': [
+      'Im: {InstanceNumber}',
+      'Loc: {SliceLocation}',
+      'Acq: {AcquisitionTime}',
+      ],
+    'topLeft': [
+      '{PatientName}',
+      'ID: {PatientID}',
+      '{PatientBirthDate}, {PatientAge}, {PatientSex}',
+      '{StudyDate}',
+      'B: {BackgroundStudyDate}',
+      'F: {ForegroundStudyDate}',
+      '{StudyTime}',
+      'B: {BackgroundStudyTime}',
+      'F: {ForegroundStudyTime}',
+      '{SeriesDescription}',
+      'B: {BackgroundSeriesDescription}',
+      'F: {ForegroundSeriesDescription}',
+      ],
+    'topRight': [
+      '{InstitutionName}',
+      '{ReferringPhysicianName}',
+      '{Manufacturer}',
+      '{Model}',
+      '{PatientPosition}',
+      ],
+    },
+  }
+
+def defaultTemplates():
+  """Return DEFAULT_TEMPLATES with the bottom right corner of each
+  registered modality profile."""
+  templates = dict(DEFAULT_TEMPLATES)
+  for modality, profile in PROFILES.items():
+    templates[modality] = {
+      'bottomRight': DEFAULT_TEMPLATES['default']['bottomRight'] + profile.bottomRight}
+  return templates
+
+PLACEHOLDER = re.compile(r'\{([^{}]+)\}')
+
+def compileLine(template):
+  """Turn "ID: {PatientID}" into a %-format string and the list of the
+  fields filling its slots, ('ID: %s', ['PatientID']). Raises ValueError
+  for unbalanced braces and unknown fields."""
+  parts = PLACEHOLDER.split(template)
+  literals = parts[0::2]
+  fields = parts[1::2]
+  for literal in literals:
+    if '{' in literal or '}' in literal:
+      raise ValueError("Malformed placeholder in template line %r" % template)
+  for field in fields:
+    if field not in LAYER_FIELDS and dicomField(field) is None:
+      raise ValueError("Unknown field {%s} in template line %r" % (field, template))
+  return '%s'.join([literal.replace('%', '%%') for literal in literals]), fields
+
+#
+# CornerRenderer
+#
+
+class CornerRenderer(object):
+  """A corner template compiled into format strings with fixed slots.
+
+  fields lists every field the template uses, so the values to look up
+  are known before rendering.
+  """
+
+  def __init__(self, lines):
+    if isinstance(lines, stringTypes):
+      lines = lines.splitlines()
+    elif not isinstance(lines, list):
+      raise ValueError("A corner template is a list or a string, not %r" % (lines,))
+    self.lines = []
+    self.fields = set()
+    for line in lines:
+      alternatives = [line] if not isinstance(line, list) else line
+      compiled = [compileLine(alternative) for alternative in alternatives]
+      for formatString, fields in compiled:
+        self.fields.update(fields)
+      self.lines.append(compiled)
+
+  def render(self, values):
+    """Return the corner text for the field -> string dictionary values."""
+    text = ''
+    for alternatives in self.lines:
+      for formatString, fields in alternatives:
+        try:
+          text += formatString % tuple([values[field] for field in fields]) + '\n'
+          break
+        except KeyError:
+          continue
+    return text
+
+#
+# CornerTemplates
+#
+
+class CornerTemplates(object):
+  """The corner templates of every modality, compiled once.
+
+  templates maps a modality (or 'default') to a dictionary of corner
+  templates. Corners that a modality does not define use the 'default'
+  ones, and anything not given falls back to the default templates.
+  """
+
+  def __init__(self, templates=None):
+    merged = {}
+    for source in (defaultTemplates(), templates or {}):
+      for modality, corners in source.items():
+        merged.setdefault(modality, {}).update(corners)
+    defaultCorners = merged.pop('default')
+    self.defaultRenderers = dict((corner, CornerRenderer(defaultCorners.get(corner, [])))
+      for corner in CORNERS)
+    self.modalityRenderers = {}
+    for modality, corners in merged.items():
+      renderers = dict(self.defaultRenderers)
+      for corner, lines in corners.items():
+        if corner not in CORNERS:
+          raise ValueError("Unknown corner in %s templates: %s" % (modality, corner))
+        renderers[corner] = CornerRenderer(lines)
+      self.modalityRenderers[modality] = renderers
+
+  @classmethod
+  def fromFile(cls, filePath):
+    """Load templates from a JSON file, or from a YAML file if PyYAML is
+    installed."""
+    with open(filePath) as templateFile:
+      if filePath.lower().endswith(('.yaml', '.yml')):
+        if yaml is None:
+          raise ValueError("Reading %s requires PyYAML" % filePath)
+        templates = yaml.safe_load(templateFile)
+      else:
+        templates = json.load(templateFile)
+    if not isinstance(templates, dict):
+      raise ValueError("%s does not contain a dictionary of templates" % filePath)
+    return cls(templates)
+
+  def renderers(self, modality):
+    """Return the corner -> CornerRenderer dictionary for modality."""
+    return self.modalityRenderers.get(modality, self.defaultRenderers)
+
+  def headerTags(self, corners=CORNERS):
+    """Return the (tags, modalityTags) profile HeaderReader has to read
+    to fill corners with these templates: the tags used by the default
+    templates and REQUIRED_VALUES for every instance, and the tags that
+    only a modality uses for instances of that modality."""
+    knownTags = {}
+    for tag, name, vr in GENERIC_TAGS:
+      knownTags[name] = (tag, name, vr)
+    for tags in modalityTags().values():
+      for tag, name, vr in tags:
+        knownTags[name] = (tag, name, vr)
+
+    def tagsOf(renderers):
+      names = []
+      for corner in corners:
+        for field in renderers[corner].fields:
+          field = dicomField(field)
+          if field:
+            names.append(fieldSpec(field)[0])
+      return set(names)
+
+    def profile(names):
+      tags = []
+      for name in sorted(names):
+        if name in knownTags:
+          tags.append(knownTags[name])
+        elif RAW_TAG.match(name):
+          tags.append((name, name, 'LO'))
+      return tuple(tags)
+
+    genericNames = tagsOf(self.defaultRenderers) | set(REQUIRED_VALUES)
+    tagsByModality = {}
+    for modality, renderers in self.modalityRenderers.items():
+      names = tagsOf(renderers) - genericNames
+      if names:
+        tagsByModality[modality] = profile(names)
+    return profile(genericNames), tagsByModality
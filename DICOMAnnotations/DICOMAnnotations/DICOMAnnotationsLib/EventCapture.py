@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import threading
+import cProfile
+
+#
+# EventCapture
+#
+
+class EventCapture(object):
+  """Captures the annotation callbacks of a session to a file.
+
+  In 'profile' mode the sampled calls run under cProfile and the
+  accumulated statistics are written as a .prof file that can be read
+  with pstats or snakeviz. In 'trace' mode every sampled call becomes a
+  complete ("X") event in Chrome trace format, with the details passed
+  by the caller as arguments, for chrome://tracing or Perfetto.
+
+  Only every samplingInterval-th event is captured, so that the capture
+  can be left running in long sessions. The capture stops by itself
+  after maximumEvents captured events or maximumSeconds, whichever comes
+  first (None for no limit), and calls onFinished(filePath).
+  """
+
+  modes = ('profile', 'trace')
+
+  def __init__(self, outputDirectory, mode='profile', maximumEvents=None,
+      maximumSeconds=None, samplingInterval=1, onFinished=None):
+    if mode not in self.modes:
+      raise ValueError("Unknown capture mode: %s" % mode)
+    self.outputDirectory = outputDirectory
+    self.mode = mode
+    self.maximumEvents = maximumEvents
+    self.maximumSeconds = maximumSeconds
+    self.samplingInterval = max(1, samplingInterval)
+    self.onFinished = onFinished
+    self.active = False
+    self.filePath = None
+
+  def start(self):
+    self.eventCount = 0
+    self.capturedCount = 0
+    self.depth = 0
+    self.traceEvents = []
+    self.profiler = cProfile.Profile() if self.mode == 'profile' else None
+    self.startTime = time.time()
+    self.active = True
+
+  def stop(self):
+    """Write the capture file and return its path."""
+    if not self.active:
+      return self.filePath
+    self.active = False
+    extension = '.prof' if self.mode == 'profile' else '.json'
+    baseName = 'DICOMAnnotations-' + time.strftime('%Y%m%d-%H%M%S', time.localtime(self.startTime))
+    self.filePath = os.path.join(self.outputDirectory, baseName + extension)
+    suffix = 1
+    while os.path.exists(self.filePath):
+      suffix += 1
+      self.filePath = os.path.join(self.outputDirectory, '%s-%d%s' % (baseName, suffix, extension))
+    if self.profiler:
+      self.profiler.dump_stats(self.filePath)
+      self.profiler = None
+    else:
+      with open(self.filePath, 'w') as traceFile:
+        json.dump({'traceEvents': self.traceEvents, 'displayTimeUnit': 'ms'}, traceFile)
+      self.traceEvents = []
+    if self.onFinished:
+      self.onFinished(self.filePath)
+    return self.filePath
+
+  def call(self, name, details, function, *args):
+    """Call function(*args) and capture it if the event is sampled.
+    details is a function returning the dictionary stored with the trace
+    event, so that it is only built for captured events."""
+    if not self.active:
+      return function(*args)
+    if self.depth > 0:
+      # nested callbacks are part of the profile of the outer call
+      return self.traceCall(name, details, function, args) if not self.profiler else function(*args)
+    self.eventCount += 1
+    if (self.eventCount - 1) % self.samplingInterval:
+      return function(*args)
+    self.capturedCount += 1
+    self.depth += 1
+    try:
+      if self.profiler:
+        return self.profiler.runcall(function, *args)
+      return self.traceCall(name, details, function, args)
+    finally:
+      self.depth -= 1
+      if self.limitReached():
+        self.stop()
+
+  def traceCall(self, name, details, function, args):
+    startTime = time.time()
+    try:
+      return function(*args)
+    finally:
+      self.traceEvents.append({
+        'name': name,
+        'ph': 'X',
+        'ts': int(1e6 * (startTime - self.startTime)),
+        'dur': int(1e6 * (time.time() - startTime)),
+        'pid': os.getpid(),
+        'tid': threading.current_thread().ident,
+        'args': details(),
+        })
+
+  def limitReached(self):
+    if self.maximumEvents is not None and self.capturedCount >= self.maximumEvents:
+      return True
+    if self.maximumSeconds is not None and time.time() - self.startTime >= self.maximumSeconds:
+      return True
+    return False
@@ -0,0 +1,106 @@
+import sys
+from collections import OrderedDict
+
+#
+# HeaderCache
+#
+
+class HeaderCache(object):
+  """Bounded least-recently-used cache of the tag dictionaries extracted
+  from DICOM instance headers, keyed by SOPInstanceUID.
+
+  The cache is limited both by the number of entries and by an estimate
+  of the memory held by the cached dictionaries; whichever limit is
+  reached first causes the least recently used entries to be evicted.
+  """
+
+  # large enough for every instance of a few thousand slice series
+  defaultMaximumEntries = 32768
+  defaultMaximumBytes = 128 * 1024 * 1024
+
+  def __init__(self, maximumEntries=None, maximumBytes=None):
+    self.maximumEntries = maximumEntries or self.defaultMaximumEntries
+    self.maximumBytes = maximumBytes or self.defaultMaximumBytes
+    self.entries = OrderedDict()
+    self.entrySizes = {}
+    self.currentBytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def __len__(self):
+    return len(self.entries)
+
+  def __contains__(self, uid):
+    return uid in self.entries
+
+  def get(self, uid):
+    """Return the cached tag dictionary for uid, or None on a miss.
+    A hit marks the entry as the most recently used one.
+    """
+    try:
+      values = self.entries.pop(uid)
+    except KeyError:
+      self.misses += 1
+      return None
+    self.entries[uid] = values
+    self.hits += 1
+    return values
+
+  def put(self, uid, values):
+    """Store the tag dictionary for uid, evicting least recently used
+    entries as needed to stay within the entry and byte limits.
+    """
+    self.discard(uid)
+    size = self.estimateSize(uid, values)
+    if size > self.maximumBytes:
+      # would evict everything else and still not fit
+      return
+    self.entries[uid] = values
+    self.entrySizes[uid] = size
+    self.currentBytes += size
+    while len(self.entries) > self.maximumEntries or self.currentBytes > self.maximumBytes:
+      oldestUid = next(iter(self.entries))
+      self.discard(oldestUid)
+      self.evictions += 1
+
+  def discard(self, uid):
+    """Remove uid from the cache if present. Not counted as an eviction.
+    """
+    if uid in self.entries:
+      del self.entries[uid]
+      self.currentBytes -= self.entrySizes.pop(uid)
+
+  def clear(self):
+    self.entries.clear()
+    self.entrySizes.clear()
+    self.currentBytes = 0
+
+  def resetStatistics(self):
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def hitRate(self):
+    lookups = self.hits + self.misses
+    if lookups == 0:
+      return 0.0
+    return float(self.hits) / lookups
+
+  def statistics(self):
+    return {
+      'entries': len(self.entries),
+      'bytes': self.currentBytes,
+      'maximumEntries': self.maximumEntries,
+      'maximumBytes': self.maximumBytes,
+      'hits': self.hits,
+      'misses': self.misses,
+      'evictions': self.evictions,
+      'hitRate': self.hitRate(),
+      }
+
+  def estimateSize(self, uid, values):
+    size = sys.getsizeof(uid) + sys.getsizeof(values)
+    for key, value in values.items():
+      size += sys.getsizeof(key) + sys.getsizeof(value)
+    return size
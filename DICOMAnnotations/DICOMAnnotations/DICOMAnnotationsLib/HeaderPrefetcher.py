@@ -0,0 +1,132 @@
+import threading
+from collections import deque
+
+try:
+  import Queue as queue
+except ImportError:
+  import queue
+
+from .HeaderReader import readHeaderFile, canReadFiles, GENERIC_TAGS, MODALITY_TAGS
+
+#
+# HeaderPrefetcher
+#
+
+class HeaderPrefetcher(object):
+  """Reads instance headers on a pool of worker threads ahead of display.
+
+  Requests are grouped under a key (the volume node ID) so that all
+  outstanding work of a node can be cancelled at once. The DICOM
+  database is only used from the thread calling pump(), which resolves
+  instance UIDs to file paths in small batches and hands them to the
+  workers. The workers only parse files, and their results come back
+  through a queue that is emptied by pump() as well.
+
+  If restoreValues is given, it is called by pump() with (uid, filePath)
+  before a file is handed to the workers, and the file is not read if it
+  returns True, meaning the values were found elsewhere.
+
+  tags and modalityTags are the tag profile read from each file.
+
+  When the files cannot be parsed, nothing is handed to the workers:
+  pump() returns up to batchSize requests with values None, for the
+  caller to read through the database a batch at a time.
+  """
+
+  def __init__(self, filePathForInstance, workerCount=2, batchSize=32, restoreValues=None,
+      tags=GENERIC_TAGS, modalityTags=MODALITY_TAGS):
+    self.filePathForInstance = filePathForInstance
+    self.restoreValues = restoreValues
+    self.tags = tags
+    self.modalityTags = modalityTags
+    self.workerCount = workerCount
+    self.batchSize = batchSize
+    self.pendingUids = {}
+    self.generations = {}
+    self.inFlight = {}
+    self.requests = queue.Queue()
+    self.results = queue.Queue()
+    self.workers = []
+
+  def submit(self, key, uids):
+    """Queue the headers of uids for reading, after any work already
+    queued under key."""
+    if key not in self.pendingUids:
+      self.pendingUids[key] = deque()
+      self.generations.setdefault(key, 0)
+      self.inFlight.setdefault(key, 0)
+    self.pendingUids[key].extend(uids)
+    self.startWorkers()
+
+  def cancel(self, key):
+    """Drop all work queued under key. Files already being read are
+    finished, but their results are discarded."""
+    self.pendingUids.pop(key, None)
+    if key in self.generations:
+      self.generations[key] += 1
+
+  def isBusy(self):
+    return bool(self.pendingUids) or any(self.inFlight.values())
+
+  def pump(self):
+    """Hand the next batch of requests to the workers and return the
+    results that are ready, as a list of (uid, filePath, values). values
+    is None if the worker could not read the file, or if the database has
+    no file for the instance, filePath being empty then.
+    """
+    ready = []
+    queued = 0
+    for key in list(self.pendingUids.keys()):
+      uids = self.pendingUids[key]
+      while uids and queued < self.batchSize:
+        uid = uids.popleft()
+        filePath = self.filePathForInstance(uid)
+        if not filePath:
+          # nothing to read, but whoever waits for it must hear back
+          ready.append((uid, filePath, None))
+          continue
+        queued += 1
+        if self.restoreValues and self.restoreValues(uid, filePath):
+          continue
+        if not canReadFiles():
+          ready.append((uid, filePath, None))
+          continue
+        self.inFlight[key] += 1
+        self.requests.put((key, self.generations[key], uid, filePath))
+      if not uids:
+        del self.pendingUids[key]
+
+    while True:
+      try:
+        key, generation, uid, filePath, values = self.results.get_nowait()
+      except queue.Empty:
+        break
+      self.inFlight[key] -= 1
+      if generation == self.generations.get(key):
+        ready.append((uid, filePath, values))
+    return ready
+
+  def startWorkers(self):
+    while len(self.workers) < self.workerCount:
+      worker = threading.Thread(target=self.work, name='DICOMAnnotationsPrefetch')
+      worker.daemon = True
+      worker.start()
+      self.workers.append(worker)
+
+  def shutdown(self):
+    for key in list(self.generations.keys()):
+      self.cancel(key)
+    for worker in self.workers:
+      self.requests.put(None)
+    self.workers = []
+
+  def work(self):
+    while True:
+      request = self.requests.get()
+      if request is None:
+        return
+      key, generation, uid, filePath = request
+      values = None
+      if generation == self.generations.get(key):
+        values = readHeaderFile(filePath, self.tags, self.modalityTags)
+      self.results.put((key, generation, uid, filePath, values))
@@ -0,0 +1,253 @@
+try:
+  import pydicom
+except ImportError:
+  try:
+    import dicom as pydicom
+  except ImportError:
+    pydicom = None
+
+try:
+  from collections.abc import Sequence
+except ImportError:
+  from collections import Sequence
+
+from .ModalityProfiles import modalityTags
+
+try:
+  stringTypes = (basestring,)
+except NameError:
+  stringTypes = (str, bytes)
+
+#
+# Tag profiles: (tag, name, value representation)
+#
+
+GENERIC_TAGS = (
+  ("0008,0020", "Study Date", "DA"),
+  ("0008,0030", "Study Time", "TM"),
+  ("0008,0032", "Acquisition Time", "TM"),
+  ("0008,0060", "Modality", "CS"),
+  ("0008,0070", "Manufacturer", "LO"),
+  ("0008,0080", "Institution Name", "LO"),
+  ("0008,0090", "Referring Physician Name", "PN"),
+  ("0008,1030", "Study Description", "LO"),
+  ("0008,103e", "Series Description", "LO"),
+  ("0008,1090", "Model", "LO"),
+  ("0010,0010", "Patient Name", "PN"),
+  ("0010,0020", "Patient ID", "LO"),
+  ("0010,0030", "Patient Birth Date", "DA"),
+  ("0010,0040", "Patient Sex", "CS"),
+  ("0010,1010", "Patient Age", "AS"),
+  ("0010,4000", "Patient Comments", "LT"),
+  ("0018,1030", "Protocol Name", "LO"),
+  ("0018,5100", "Patient Position", "CS"),
+  ("0020,0010", "Study ID", "SH"),
+  ("0020,000d", "Study Instance UID", "UI"),
+  ("0020,000e", "Series Instance UID", "UI"),
+  ("0020,0011", "Series Number", "IS"),
+  ("0020,0013", "Instance Number", "IS"),
+  ("0020,1041", "Slice Location", "DS"),
+  ("0020,4000", "Image Comments", "LT"),
+  )
+
+# Read in addition to the generic tags, depending on the Modality value
+MODALITY_TAGS = modalityTags()
+
+UNKNOWN_VALUE = "Unknown"
+
+# Value the DICOM database tag cache stores for tags an instance does not
+# have, so that looking them up does not read the file again
+TAG_NOT_IN_INSTANCE = "__TAG_NOT_IN_INSTANCE__"
+
+# Values the tag cache stores for empty values and for values too long
+# to be stored, which have to be read from the file
+VALUE_IS_EMPTY_STRING = "__VALUE_IS_EMPTY_STRING__"
+VALUE_NOT_STORED = "__VALUE_NOT_STORED__"
+
+def canReadFiles():
+  """True if headers can be parsed without the DICOM database."""
+  return pydicom is not None
+
+def tagNumber(tag):
+  """Convert a "gggg,eeee" tag string to the integer pydicom uses."""
+  group, element = tag.split(',')
+  return (int(group, 16) << 16) | int(element, 16)
+
+def convertValue(value, vr):
+  """Convert the string form of a DICOM value to a Python value:
+  float for DS, int for IS, a list for multi-valued numbers and the
+  stripped string otherwise. Missing values become UNKNOWN_VALUE.
+  """
+  if value is None:
+    return UNKNOWN_VALUE
+  if isinstance(value, bytes) and not isinstance(value, str):
+    value = value.decode('latin-1')
+  value = value.strip()
+  if value == '':
+    return UNKNOWN_VALUE
+  if vr in ('DS', 'IS'):
+    number = float if vr == 'DS' else int
+    try:
+      numbers = [number(part) for part in value.split('\\')]
+    except ValueError:
+      return value
+    if len(numbers) == 1:
+      return numbers[0]
+    return numbers
+  return value
+
+def elementString(value):
+  """Return a pydicom element value in the backslash separated string
+  form that the DICOM database also uses."""
+  if isinstance(value, stringTypes):
+    return value
+  if isinstance(value, Sequence):
+    return '\\'.join([item if isinstance(item, stringTypes) else str(item) for item in value])
+  return str(value)
+
+def profileTags(tags, modalityTags):
+  allTags = list(tags)
+  for extraTags in modalityTags.values():
+    allTags.extend(extraTags)
+  return allTags
+
+def annotationTags(tags=GENERIC_TAGS, modalityTags=MODALITY_TAGS):
+  """All the "gggg,eeee" tags the annotations can use, including the
+  tags of every modality profile."""
+  return [tag for tag, name, vr in profileTags(tags, modalityTags)]
+
+def dumpValue(dump):
+  """Extract the value from a header dump line as returned by the DICOM
+  database, such as "(0010,0010) PN [Doe^John]  # 8, 1 PatientName".
+  Returns an empty string for elements without a value."""
+  start = dump.find('[')
+  end = dump.rfind(']')
+  if start < 0 or end < start:
+    return ''
+  return dump[start + 1:end]
+
+def hasAllValues(values, tags=GENERIC_TAGS, modalityTags=MODALITY_TAGS):
+  """True if values, read with another tag profile, has a value for
+  every tag of this profile."""
+  for tag, name, vr in tags:
+    if name not in values:
+      return False
+  for tag, name, vr in modalityTags.get(values.get("Modality"), ()):
+    if name not in values:
+      return False
+  return True
+
+def profileContains(tags, modalityTags, otherTags, otherModalityTags):
+  """True if the values read with the tags, modalityTags profile include
+  all the values of the otherTags, otherModalityTags profile, whatever
+  the modality."""
+  for modality in set(modalityTags) | set(otherModalityTags) | set([None]):
+    read = set(tags) | set(modalityTags.get(modality, ()))
+    needed = set(otherTags) | set(otherModalityTags.get(modality, ()))
+    if not needed <= read:
+      return False
+  return True
+
+def readHeaderFile(filePath, tags=GENERIC_TAGS, modalityTags=MODALITY_TAGS):
+  """Read the requested tags of a DICOM file with a single header-only
+  parse. Returns None if pydicom is not available or the file cannot be
+  read. Does not touch the DICOM database, so it can be called from any
+  thread or process.
+  """
+  if pydicom is None:
+    return None
+  try:
+    if hasattr(pydicom, 'dcmread'):
+      dataset = pydicom.dcmread(filePath, stop_before_pixels=True,
+        specific_tags=[tagNumber(tag) for tag, name, vr in profileTags(tags, modalityTags)])
+    else:
+      dataset = pydicom.read_file(filePath, stop_before_pixels=True)
+  except Exception:
+    return None
+
+  def datasetValue(tag):
+    try:
+      return elementString(dataset[tagNumber(tag)].value)
+    except KeyError:
+      return None
+
+  return extractValues(datasetValue, tags, modalityTags)
+
+def extractValues(valueForTag, tags, modalityTags):
+  """Build the name -> value dictionary for tags, followed by the tags of
+  the matching modality profile, using valueForTag to look up raw values.
+  """
+  values = {}
+  for tag, name, vr in tags:
+    values[name] = convertValue(valueForTag(tag), vr)
+  for tag, name, vr in modalityTags.get(values.get("Modality"), ()):
+    values[name] = convertValue(valueForTag(tag), vr)
+  return values
+
+#
+# HeaderReader
+#
+
+class HeaderReader(object):
+  """Reads all annotation tags of an instance in one call.
+
+  The file is parsed once with pydicom, stopping before the pixel data.
+  If pydicom is not available or cannot read the file, values are taken
+  from the DICOM database tag cache, and the tags it does not cache from
+  a single load of the file header by the database.
+  """
+
+  def __init__(self, database):
+    self.database = database
+
+  def readValues(self, uid, tags=GENERIC_TAGS, modalityTags=MODALITY_TAGS):
+    filePath = self.database.fileForInstance(uid)
+    values = None
+    if filePath:
+      values = readHeaderFile(filePath, tags, modalityTags)
+    if values is None:
+      values = self.readDatabaseValues(filePath, tags, modalityTags, uid)
+    return values
+
+  def readDatabaseValues(self, filePath, tags=GENERIC_TAGS, modalityTags=MODALITY_TAGS, uid=None):
+    """Read the values of the file of instance uid through the database.
+    The header is loaded at most once, when a tag is not in the tag
+    cache. All values are unknown if there is no file."""
+    if not filePath:
+      return extractValues(lambda tag: None, tags, modalityTags)
+    if uid is None:
+      uid = self.database.instanceForFile(filePath)
+    headerLoaded = []
+
+    def databaseValue(tag):
+      value = self.database.cachedTag(uid, tag) if uid else ''
+      if value == TAG_NOT_IN_INSTANCE or value == VALUE_IS_EMPTY_STRING:
+        return None
+      if value and value != VALUE_NOT_STORED:
+        return value
+      if not headerLoaded:
+        self.database.loadFileHeader(filePath)
+        headerLoaded.append(filePath)
+      return dumpValue(self.database.headerValue(tag))
+
+    return extractValues(databaseValue, tags, modalityTags)
+
+  def registerTagsToPrecache(self, tags=GENERIC_TAGS, modalityTags=MODALITY_TAGS):
+    """Add the annotation tags to the tags the database caches while it
+    indexes files, keeping the tags other modules registered."""
+    precached = list(self.database.tagsToPrecache)
+    missing = [tag for tag in annotationTags(tags, modalityTags) if tag not in precached]
+    if missing:
+      self.database.tagsToPrecache = precached + missing
+
+  def precacheInstance(self, uid, tags=GENERIC_TAGS, modalityTags=MODALITY_TAGS):
+    """Fill the database tag cache with all the annotation tags of an
+    instance, loading its header once."""
+    allTags = annotationTags(tags, modalityTags)
+    if self.database.cachedTag(uid, allTags[-1]):
+      # indexed after registerTagsToPrecache, the database cached them
+      return
+    self.database.loadInstanceHeader(uid)
+    for tag in allTags:
+      value = dumpValue(self.database.headerValue(tag))
+      self.database.cacheTag(uid, tag, value or TAG_NOT_IN_INSTANCE)
@@ -0,0 +1,91 @@
+import bisect
+
+#
+# InstanceUIDIndex
+#
+
+class InstanceUIDIndex(object):
+  """Instance UIDs of a volume node, split once from the space separated
+  DICOM.instanceUIDs attribute.
+  """
+
+  def __init__(self, uidsAttribute):
+    if uidsAttribute:
+      self.uids = tuple(uidsAttribute.split())
+    else:
+      self.uids = ()
+
+  def __len__(self):
+    return len(self.uids)
+
+  def __iter__(self):
+    return iter(self.uids)
+
+  def __getitem__(self, index):
+    return self.uids[index]
+
+  def first(self):
+    """UID of the first instance, or None for non-DICOM volumes."""
+    if self.uids:
+      return self.uids[0]
+    return None
+
+#
+# SlicePositionIndex
+#
+
+def dot(a, b):
+  return a[0]*b[0] + a[1]*b[1] + a[2]*b[2]
+
+class SlicePositionIndex(object):
+  """Positions of the slices of a volume along its slice normal, sorted
+  and mapped to the instance UID of each slice, so that the instance
+  displayed in a slice view is found with a binary search.
+  """
+
+  # slice views tilted further than this from the volume slices
+  # do not display a single instance
+  alignmentTolerance = 0.99
+
+  def __init__(self, normal, positions, uids):
+    order = sorted(range(len(positions)), key=positions.__getitem__)
+    self.normal = normal
+    self.positions = [positions[i] for i in order]
+    self.uids = [uids[i] for i in order]
+    spacings = [b - a for a, b in zip(self.positions, self.positions[1:])]
+    self.tolerance = min(spacings) / 2.0 if spacings else 0.5
+
+  @classmethod
+  def fromGeometry(cls, ijkToRAS, sliceCount, uids):
+    """Build the index from the rows of a volume IJK to RAS matrix,
+    assuming one instance per K slice in the order of uids. Returns None
+    if the number of instances does not match the number of slices.
+    """
+    if sliceCount != len(uids) or sliceCount == 0:
+      return None
+    column = [ijkToRAS[row][2] for row in range(3)]
+    origin = [ijkToRAS[row][3] for row in range(3)]
+    spacing = dot(column, column) ** 0.5
+    if spacing == 0:
+      return None
+    normal = [value / spacing for value in column]
+    originPosition = dot(origin, normal)
+    positions = [originPosition + k * spacing for k in range(sliceCount)]
+    return cls(normal, positions, uids)
+
+  def uidAt(self, point, planeNormal):
+    """UID of the slice that contains point on a plane with planeNormal,
+    or None if the plane is oblique to the slices or outside the volume.
+    """
+    length = dot(planeNormal, planeNormal) ** 0.5
+    if length == 0 or abs(dot(planeNormal, self.normal)) / length < self.alignmentTolerance:
+      return None
+    position = dot(point, self.normal)
+    index = bisect.bisect_left(self.positions, position)
+    candidates = [i for i in (index - 1, index) if 0 <= i < len(self.positions)]
+    if not candidates:
+      return None
+    nearest = min(candidates, key=lambda i: abs(self.positions[i] - position))
+    if abs(self.positions[nearest] - position) > self.tolerance:
+      return None
+    return self.uids[nearest]
@@ -0,0 +1,116 @@
+import math
+from collections import OrderedDict
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+def sliceAxis(rasToIJK, sliceToRAS, dimensions, tolerance=1e-3):
+  """Return the (IJK axis, index) of the volume slice displayed in a
+  slice view, or None if the view is oblique to the volume axes or
+  outside of the volume."""
+  normal = rasToIJK.MultiplyPoint((sliceToRAS.GetElement(0, 2), sliceToRAS.GetElement(1, 2),
+    sliceToRAS.GetElement(2, 2), 0.0))[:3]
+  length = math.sqrt(sum([component * component for component in normal]))
+  if length == 0:
+    return None
+  axis = max(range(3), key=lambda axis: abs(normal[axis]))
+  if abs(abs(normal[axis]) / length - 1.0) > tolerance:
+    return None
+  origin = rasToIJK.MultiplyPoint((sliceToRAS.GetElement(0, 3), sliceToRAS.GetElement(1, 3),
+    sliceToRAS.GetElement(2, 3), 1.0))
+  index = int(math.floor(origin[axis] + 0.5))
+  if index < 0 or index >= dimensions[axis]:
+    return None
+  return axis, index
+
+def labelCounts(sliceArray):
+  """Return the label -> voxel count dictionary of the non-zero labels
+  of a label array, counted with a single bincount, or by sorting when
+  the labels are too sparse for a counter per value."""
+  values = sliceArray.ravel()
+  if values.dtype.kind not in 'iu':
+    values = values.astype(numpy.int64)
+  if values.size == 0:
+    return {}
+  # bincount cannot take uint64 and allocates max(label) + 1 counters
+  if (values.dtype == numpy.uint64 or values.min() < 0 or
+      values.max() > max(2 * values.size, 65536)):
+    labels, counts = numpy.unique(values, return_counts=True)
+  else:
+    counts = numpy.bincount(values)
+    labels = numpy.nonzero(counts)[0]
+    counts = counts[labels]
+  return dict([(int(label), int(count)) for label, count in zip(labels, counts) if label != 0])
+
+#
+# SliceStatistics
+#
+
+class SliceStatistics(object):
+  """Voxel count of each label in a slice of a label volume, and the
+  labeled area in square millimeters."""
+
+  def __init__(self, counts, voxelArea):
+    self.counts = counts
+    self.area = voxelArea * sum(counts.values())
+
+  def segmentCount(self):
+    return len(self.counts)
+
+#
+# LabelStatistics
+#
+
+class LabelStatistics(object):
+  """Per-slice label statistics, cached by label volume and slice.
+
+  arrayView(imageData) returns the (k, j, i, component) NumPy view of
+  the scalars of an image, as PixelReadout.arrayView does. Statistics
+  of a slice are computed once and kept until the label volume is
+  modified. A modification only drops the slices of that volume, the
+  slices of the other volumes stay cached. The volumes used least
+  recently are dropped above maximumVolumes.
+  """
+
+  maximumVolumes = 16
+
+  def __init__(self, arrayView):
+    self.arrayView = arrayView
+    # volume key -> (modification time, {(axis, index): SliceStatistics})
+    self.volumes = OrderedDict()
+
+  def sliceStatistics(self, key, modifiedTime, imageData, spacing, axis, index):
+    """Return the SliceStatistics of slice index along IJK axis of the
+    label image, or None without NumPy. key identifies the volume, and
+    modifiedTime tells when its voxels last changed."""
+    if numpy is None:
+      return None
+    entry = self.volumes.pop(key, None)
+    if entry is None or entry[0] != modifiedTime:
+      # edited since the slices were counted
+      entry = (modifiedTime, {})
+    self.volumes[key] = entry
+    if len(self.volumes) > self.maximumVolumes:
+      self.volumes.popitem(last=False)
+    slices = entry[1]
+    statistics = slices.get((axis, index))
+    if statistics is None:
+      view = self.arrayView(imageData)
+      if view is None:
+        return None
+      # the view is indexed (k, j, i, component)
+      selection = [slice(None)] * 3
+      selection[2 - axis] = index
+      sliceArray = view[tuple(selection) + (0,)]
+      inPlane = [spacing[otherAxis] for otherAxis in range(3) if otherAxis != axis]
+      statistics = SliceStatistics(labelCounts(sliceArray), inPlane[0] * inPlane[1])
+      slices[(axis, index)] = statistics
+    return statistics
+
+  def discard(self, key):
+    self.volumes.pop(key, None)
+
+  def clear(self):
+    self.volumes.clear()
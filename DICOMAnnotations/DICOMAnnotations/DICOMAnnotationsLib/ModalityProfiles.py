@@ -0,0 +1,155 @@
+#
+# Field sources
+#
+
+# the first instance of the series
+SERIES = 'series'
+# the displayed instance, the field is left out while it is not known
+INSTANCE = 'instance'
+# the displayed instance if known, the first instance of the series otherwise
+INSTANCE_OR_SERIES = 'instanceOrSeries'
+
+#
+# ModalityProfile
+#
+
+class ModalityProfile(object):
+  """What the annotations show for the instances of some modalities.
+
+  tags are the (tag, name, value representation) tuples the profile
+  reads in addition to the generic tags. fields maps the template field
+  names of the profile to (header value name, format, source, leave out
+  unknown values), where format is one of the names of
+  CornerTemplates.FORMATTERS. bottomRight lists the template lines that
+  follow the generic lines of the bottom right corner.
+
+  The tags are only read for instances of these modalities, and only
+  while a corner using them is enabled.
+  """
+
+  def __init__(self, modalities, tags, fields, bottomRight):
+    self.modalities = tuple(modalities)
+    self.tags = tuple(tags)
+    self.fields = dict(fields)
+    self.bottomRight = list(bottomRight)
+
+#
+# Registry
+#
+
+# ModalityProfile by Modality value
+PROFILES = {}
+
+# fields of all registered profiles
+PROFILE_FIELDS = {}
+
+def registerProfile(profile):
+  """Add profile, replacing the profiles previously registered for its
+  modalities. Templates created afterwards use it."""
+  for modality in profile.modalities:
+    PROFILES[modality] = profile
+  PROFILE_FIELDS.update(profile.fields)
+
+def profileForModality(modality):
+  return PROFILES.get(modality)
+
+def modalityTags():
+  """Return the modality -> tags dictionary of the registered profiles."""
+  return dict((modality, profile.tags) for modality, profile in PROFILES.items())
+
+registerProfile(ModalityProfile(['MR'],
+  tags=(
+    ("0018,0080", "Repetition Time", "DS"),
+    ("0018,0081", "Echo Time", "DS"),
+    ("0018,1314", "Flip Angle", "DS"),
+    ),
+  fields={
+    'RepetitionTime': ('Repetition Time', 'number', INSTANCE_OR_SERIES, False),
+    'EchoTime': ('Echo Time', 'number', INSTANCE_OR_SERIES, False),
+    'FlipAngle': ('Flip Angle', 'number', INSTANCE_OR_SERIES, True),
+    },
+  bottomRight=['TR {RepetitionTime}', 'TE {EchoTime}', 'FA {FlipAngle}']))
+
+registerProfile(ModalityProfile(['CT'],
+  tags=(
+    ("0018,0050", "Slice Thickness", "DS"),
+    ("0018,0060", "KVP", "DS"),
+    ("0018,1151", "X-Ray Tube Current", "IS"),
+    ("0018,1152", "Exposure", "IS"),
+    ("0018,1210", "Convolution Kernel", "SH"),
+    ),
+  fields={
+    'SliceThickness': ('Slice Thickness', 'number', INSTANCE_OR_SERIES, True),
+    'KVP': ('KVP', 'number', INSTANCE_OR_SERIES, True),
+    'TubeCurrent': ('X-Ray Tube Current', 'number', INSTANCE_OR_SERIES, True),
+    'Exposure': ('Exposure', 'number', INSTANCE_OR_SERIES, True),
+    'ConvolutionKernel': ('Convolution Kernel', 'text', INSTANCE_OR_SERIES, True),
+    },
+  bottomRight=['ST {SliceThickness} mm', '{KVP} kVp', '{TubeCurrent} mA', '{Exposure} mAs',
+    'Kernel {ConvolutionKernel}']))
+
+# The injected dose and half life are in the Radiopharmaceutical
+# Information Sequence, which is not read, so only the values that tell
+# how the pixels relate to SUV are shown
+registerProfile(ModalityProfile(['PT'],
+  tags=(
+    ("0010,1030", "Patient Weight", "DS"),
+    ("0028,0051", "Corrected Image", "CS"),
+    ("0054,1001", "Units", "CS"),
+    ("0054,1102", "Decay Correction", "CS"),
+    ),
+  fields={
+    'PatientWeight': ('Patient Weight', 'number', SERIES, True),
+    'CorrectedImage': ('Corrected Image', 'text', SERIES, True),
+    'Units': ('Units', 'text', SERIES, True),
+    'DecayCorrection': ('Decay Correction', 'text', SERIES, True),
+    },
+  bottomRight=['Units {Units}', 'Wt {PatientWeight} kg', 'Decay {DecayCorrection}',
+    'Corr {CorrectedImage}']))
+
+registerProfile(ModalityProfile(['US'],
+  tags=(
+    ("0018,5010", "Transducer Data", "LO"),
+    ("0018,5022", "Mechanical Index", "DS"),
+    ("0018,5027", "Soft Tissue Thermal Index", "DS"),
+    ("0018,5050", "Depth of Scan Field", "IS"),
+    ),
+  fields={
+    'TransducerData': ('Transducer Data', 'text', INSTANCE_OR_SERIES, True),
+    'MechanicalIndex': ('Mechanical Index', 'number', INSTANCE_OR_SERIES, True),
+    'SoftTissueThermalIndex': ('Soft Tissue Thermal Index', 'number', INSTANCE_OR_SERIES, True),
+    'DepthOfScanField': ('Depth of Scan Field', 'number', INSTANCE_OR_SERIES, True),
+    },
+  bottomRight=['{TransducerData}', 'MI {MechanicalIndex}', 'TIS {SoftTissueThermalIndex}',
+    'Depth {DepthOfScanField} mm']))
+
+registerProfile(ModalityProfile(['CR', 'DX'],
+  tags=(
+    ("0018,0015", "Body Part Examined", "CS"),
+    ("0018,0060", "KVP", "DS"),
+    ("0018,1150", "Exposure Time", "IS"),
+    ("0018,1152", "Exposure", "IS"),
+    ("0018,5101", "View Position", "CS"),
+    ),
+  fields={
+    'BodyPartExamined': ('Body Part Examined', 'text', INSTANCE_OR_SERIES, True),
+    'KVP': ('KVP', 'number', INSTANCE_OR_SERIES, True),
+    'ExposureTime': ('Exposure Time', 'number', INSTANCE_OR_SERIES, True),
+    'Exposure': ('Exposure', 'number', INSTANCE_OR_SERIES, True),
+    'ViewPosition': ('View Position', 'text', INSTANCE_OR_SERIES, True),
+    },
+  bottomRight=['{BodyPartExamined} {ViewPosition}', '{KVP} kVp', '{Exposure} mAs',
+    '{ExposureTime} ms']))
+
+registerProfile(ModalityProfile(['SEG'],
+  tags=(
+    ("0062,0001", "Segmentation Type", "CS"),
+    ("0070,0080", "Content Label", "CS"),
+    ("0070,0084", "Content Creator Name", "PN"),
+    ),
+  fields={
+    'SegmentationType': ('Segmentation Type', 'text', SERIES, True),
+    'ContentLabel': ('Content Label', 'text', SERIES, True),
+    'ContentCreatorName': ('Content Creator Name', 'person', SERIES, True),
+    },
+  bottomRight=['{ContentLabel}', 'Type {SegmentationType}', 'By {ContentCreatorName}']))
@@ -0,0 +1,64 @@
+#
+# ObserverRegistry
+#
+
+class ObserverRegistry(object):
+  """Owns the VTK observers and Qt signal connections of the module, so
+  that they can all be detached when the module is cleaned up, disabled
+  or reloaded.
+
+  Observations are kept in named groups that are detached together. An
+  observer or connection that is already registered with the same
+  object, event and callback is not added a second time, so repeated
+  setup cannot make a callback run more than once per event.
+  """
+
+  def __init__(self):
+    # (group, object, event or signal, callback, VTK observer tag or None)
+    self.entries = []
+
+  def find(self, observedObject, event, callback):
+    for entry in self.entries:
+      if entry[1] is observedObject and entry[2] == event and entry[3] == callback:
+        return entry
+    return None
+
+  def addObserver(self, group, vtkObject, event, callback, priority=0.0):
+    """Add a VTK observer and return its tag."""
+    entry = self.find(vtkObject, event, callback)
+    if entry:
+      return entry[4]
+    tag = vtkObject.AddObserver(event, callback, priority)
+    self.entries.append((group, vtkObject, event, callback, tag))
+    return tag
+
+  def connect(self, group, qtObject, signal, slot):
+    """Connect a Qt signal to slot."""
+    if self.find(qtObject, signal, slot):
+      return
+    qtObject.connect(signal, slot)
+    self.entries.append((group, qtObject, signal, slot, None))
+
+  def removeObserver(self, vtkObject, tag):
+    self.detach([entry for entry in self.entries if entry[1] is vtkObject and entry[4] == tag])
+
+  def removeGroup(self, group):
+    self.detach([entry for entry in self.entries if entry[0] == group])
+
+  def removeAll(self):
+    self.detach(list(self.entries))
+
+  def detach(self, entries):
+    for entry in entries:
+      group, observedObject, event, callback, tag = entry
+      if tag is None:
+        observedObject.disconnect(event, callback)
+      else:
+        observedObject.RemoveObserver(tag)
+      self.entries.remove(entry)
+
+  def count(self, group=None):
+    """Number of live observers and connections, in group if given."""
+    if group is None:
+      return len(self.entries)
+    return len([entry for entry in self.entries if entry[0] == group])
@@ -0,0 +1,85 @@
+import time
+from collections import OrderedDict
+
+#
+# PerformanceCounters
+#
+
+class PerformanceCounters(object):
+  """Call counts, cumulative and maximum time of the annotation stages,
+  and hit rates of the caches.
+
+  Timing a stage is done with a start()/stop() pair. While counting is
+  disabled start() returns None and stop() returns right away, so the
+  instrumented code pays two trivial calls per stage.
+  """
+
+  stages = (
+    'Observer dispatch',
+    'UID resolution',
+    'Tag extraction',
+    'Header load',
+    'Label statistics',
+    'Text formatting',
+    'SetText',
+    'Render request',
+    )
+
+  def __init__(self):
+    self.enabled = False
+    self.reset()
+
+  def reset(self):
+    self.counts = OrderedDict((stage, 0) for stage in self.stages)
+    self.totalTimes = OrderedDict((stage, 0.0) for stage in self.stages)
+    self.maximumTimes = OrderedDict((stage, 0.0) for stage in self.stages)
+    self.cacheHits = OrderedDict()
+    self.cacheMisses = OrderedDict()
+
+  def start(self):
+    if not self.enabled:
+      return None
+    return time.time()
+
+  def stop(self, stage, startTime):
+    if startTime is None:
+      return
+    elapsed = time.time() - startTime
+    self.counts[stage] = self.counts.get(stage, 0) + 1
+    self.totalTimes[stage] = self.totalTimes.get(stage, 0.0) + elapsed
+    if elapsed > self.maximumTimes.get(stage, 0.0):
+      self.maximumTimes[stage] = elapsed
+
+  def countLookup(self, cache, hit):
+    if not self.enabled:
+      return
+    counts = self.cacheHits if hit else self.cacheMisses
+    counts[cache] = counts.get(cache, 0) + 1
+
+  def hitRate(self, cache):
+    hits = self.cacheHits.get(cache, 0)
+    lookups = hits + self.cacheMisses.get(cache, 0)
+    if lookups == 0:
+      return 0.0
+    return float(hits) / lookups
+
+  def caches(self):
+    return list(OrderedDict.fromkeys(list(self.cacheHits.keys()) + list(self.cacheMisses.keys())))
+
+  def asDict(self):
+    """Return the counters in a JSON serializable form, times in ms."""
+    stages = OrderedDict()
+    for stage in self.counts:
+      stages[stage] = {
+        'calls': self.counts[stage],
+        'totalMs': 1000.0 * self.totalTimes[stage],
+        'maximumMs': 1000.0 * self.maximumTimes[stage],
+        }
+    caches = OrderedDict()
+    for cache in self.caches():
+      caches[cache] = {
+        'hits': self.cacheHits.get(cache, 0),
+        'misses': self.cacheMisses.get(cache, 0),
+        'hitRate': self.hitRate(cache),
+        }
+    return {'stages': stages, 'caches': caches}
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import sqlite3
+
+try:
+  textType = unicode
+except NameError:
+  textType = str
+
+def nativeName(name):
+  # json returns unicode strings, the tag names of the profiles are str.
+  # Values are left unicode, as the DICOM database returns them.
+  if textType is not str:
+    return name.encode('utf-8')
+  return name
+
+#
+# PersistentHeaderCache
+#
+
+class PersistentHeaderCache(object):
+  """SQLite file keeping the extracted tag dictionaries between sessions.
+
+  Entries are keyed by SOPInstanceUID and store the SeriesInstanceUID
+  and the modification time and size of the file they were read from.
+  An entry is only returned while the file is unchanged.
+
+  Several Slicer instances can share the file: it is opened in WAL mode
+  with a busy timeout, and every write is a short transaction. When the
+  number of entries goes above maximumEntries, the least recently used
+  ones are deleted. Database errors are reported and treated as misses,
+  so that the cache can never prevent annotations from being shown.
+  """
+
+  defaultMaximumEntries = 200000
+
+  # access times are only refreshed when older than this, so that most
+  # hits do not write to the file
+  accessResolution = 3600.0
+
+  def __init__(self, filePath, maximumEntries=None, timeout=10.0):
+    self.filePath = filePath
+    self.maximumEntries = maximumEntries or self.defaultMaximumEntries
+    self.timeout = timeout
+    self.connection = None
+    self.insertsSinceEviction = 0
+
+  def connect(self):
+    if self.connection is None:
+      connection = sqlite3.connect(self.filePath, timeout=self.timeout)
+      try:
+        connection.execute('PRAGMA journal_mode=WAL')
+      except sqlite3.Error:
+        # the file stays usable with the default rollback journal
+        pass
+      with connection:
+        connection.execute('CREATE TABLE IF NOT EXISTS headers ('
+          'instanceUID TEXT PRIMARY KEY, seriesUID TEXT, '
+          'mtime REAL, size INTEGER, accessed REAL, tagValues TEXT)')
+        connection.execute('CREATE INDEX IF NOT EXISTS headersAccessed ON headers (accessed)')
+        connection.execute('CREATE INDEX IF NOT EXISTS headersSeries ON headers (seriesUID)')
+      self.connection = connection
+    return self.connection
+
+  def close(self):
+    if self.connection is not None:
+      self.connection.close()
+      self.connection = None
+
+  def fileSignature(self, filePath):
+    try:
+      status = os.stat(filePath)
+    except (OSError, TypeError):
+      return None
+    return status.st_mtime, status.st_size
+
+  def get(self, uid, filePath):
+    """Return the tag dictionary stored for uid, or None if there is none
+    or filePath changed since it was stored."""
+    signature = self.fileSignature(filePath)
+    if signature is None:
+      return None
+    try:
+      connection = self.connect()
+      row = connection.execute('SELECT mtime, size, accessed, tagValues FROM headers '
+        'WHERE instanceUID = ?', (uid,)).fetchone()
+      if row is None or (row[0], row[1]) != signature:
+        return None
+      now = time.time()
+      if now - row[2] > self.accessResolution:
+        with connection:
+          connection.execute('UPDATE headers SET accessed = ? WHERE instanceUID = ?', (now, uid))
+      values = json.loads(row[3])
+    except (sqlite3.Error, ValueError) as e:
+      print('DICOMAnnotations: header cache read failed: ' + str(e))
+      return None
+    return dict((nativeName(name), value) for name, value in values.items())
+
+  def put(self, uid, filePath, values, seriesUid=None):
+    self.putMany([(uid, filePath, values, seriesUid)])
+
+  def putMany(self, entries):
+    """Store (uid, filePath, values, seriesUid) entries in one
+    transaction."""
+    now = time.time()
+    rows = []
+    for uid, filePath, values, seriesUid in entries:
+      signature = self.fileSignature(filePath)
+      if signature is None or values is None:
+        continue
+      try:
+        rows.append((uid, seriesUid, signature[0], signature[1], now, json.dumps(values)))
+      except (TypeError, ValueError):
+        # values that cannot be stored are read from the header again
+        continue
+    if not rows:
+      return
+    try:
+      connection = self.connect()
+      with connection:
+        connection.executemany('INSERT OR REPLACE INTO headers VALUES (?, ?, ?, ?, ?, ?)', rows)
+      self.insertsSinceEviction += len(rows)
+      if self.insertsSinceEviction >= max(1, self.maximumEntries // 100):
+        self.evict()
+    except sqlite3.Error as e:
+      print('DICOMAnnotations: header cache write failed: ' + str(e))
+
+  def evict(self):
+    """Delete the least recently used entries above maximumEntries."""
+    self.insertsSinceEviction = 0
+    connection = self.connect()
+    with connection:
+      count = connection.execute('SELECT COUNT(*) FROM headers').fetchone()[0]
+      if count > self.maximumEntries:
+        connection.execute('DELETE FROM headers WHERE instanceUID IN ('
+          'SELECT instanceUID FROM headers ORDER BY accessed LIMIT ?)', (count - self.maximumEntries,))
+
+  def clear(self):
+    try:
+      connection = self.connect()
+      with connection:
+        connection.execute('DELETE FROM headers')
+      connection.execute('VACUUM')
+    except sqlite3.Error as e:
+      print('DICOMAnnotations: header cache clear failed: ' + str(e))
+
+  def __len__(self):
+    try:
+      return self.connect().execute('SELECT COUNT(*) FROM headers').fetchone()[0]
+    except sqlite3.Error:
+      return 0
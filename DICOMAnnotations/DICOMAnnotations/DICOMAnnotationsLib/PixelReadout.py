@@ -0,0 +1,88 @@
+import math
+from collections import OrderedDict
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+try:
+  from vtk.util.numpy_support import vtk_to_numpy
+except ImportError:
+  vtk_to_numpy = None
+
+def formatVoxelValue(value):
+  """Integers as they are, other values with 4 significant digits, and
+  the components of multi-component voxels separated by commas."""
+  if isinstance(value, (list, tuple)) or (numpy is not None and isinstance(value, numpy.ndarray)):
+    return ','.join([formatVoxelValue(component) for component in value])
+  value = float(value)
+  if value == int(value) and abs(value) < 1e9:
+    return '%d' % value
+  return '%.4g' % value
+
+def voxelIndex(rasToIJK, ras):
+  """Return the (i, j, k) voxel containing the ras point, using the
+  vtkMatrix4x4 rasToIJK."""
+  ijk = rasToIJK.MultiplyPoint(tuple(ras) + (1.0,))
+  return tuple([int(math.floor(coordinate + 0.5)) for coordinate in ijk[:3]])
+
+#
+# PixelReadout
+#
+
+class PixelReadout(object):
+  """Reads the voxel values under the cursor.
+
+  When NumPy is available, voxels are read through a NumPy view of the
+  scalars of the image data, which shares the memory of the VTK array.
+  The view is created once per scalar array and kept until the array is
+  replaced or modified, so a readout costs an index lookup. Without
+  NumPy each voxel is read with GetScalarComponentAsDouble.
+  """
+
+  maximumViews = 8
+
+  def __init__(self):
+    # image data -> (scalars, scalars modification time, array view)
+    self.views = OrderedDict()
+
+  def arrayView(self, imageData):
+    """Return the scalars of imageData as a (k, j, i, component) array
+    that does not copy the voxels, or None without NumPy."""
+    if numpy is None or vtk_to_numpy is None:
+      return None
+    scalars = imageData.GetPointData().GetScalars()
+    if scalars is None:
+      return None
+    entry = self.views.get(imageData)
+    if entry and entry[0] is scalars and entry[1] == scalars.GetMTime():
+      return entry[2]
+    dimensions = imageData.GetDimensions()
+    view = vtk_to_numpy(scalars).reshape(dimensions[2], dimensions[1], dimensions[0], -1)
+    self.views[imageData] = (scalars, scalars.GetMTime(), view)
+    if len(self.views) > self.maximumViews:
+      self.views.popitem(last=False)
+    return view
+
+  def voxelValue(self, imageData, ijk):
+    """Return the value of voxel ijk, a list for multi-component images,
+    or None if the voxel is outside of the image."""
+    if imageData is None:
+      return None
+    dimensions = imageData.GetDimensions()
+    for index, dimension in zip(ijk, dimensions):
+      if index < 0 or index >= dimension:
+        return None
+    i, j, k = ijk
+    view = self.arrayView(imageData)
+    if view is not None:
+      value = view[k, j, i]
+      return value[0] if len(value) == 1 else list(value)
+    components = imageData.GetNumberOfScalarComponents()
+    if components == 1:
+      return imageData.GetScalarComponentAsDouble(i, j, k, 0)
+    return [imageData.GetScalarComponentAsDouble(i, j, k, c) for c in range(components)]
+
+  def clear(self):
+    self.views.clear()
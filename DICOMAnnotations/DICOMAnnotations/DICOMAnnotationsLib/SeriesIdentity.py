@@ -0,0 +1,145 @@
+from collections import OrderedDict
+
+from .HeaderReader import UNKNOWN_VALUE, stringTypes
+from .ModalityProfiles import SERIES
+from .CornerTemplates import FIELDS, LAYER_PREFIXES, dicomField, formatFieldValue
+
+# Values telling whether two series are of the same patient
+PATIENT_VALUES = ('Patient Name', 'Patient ID', 'Patient Birth Date')
+
+# Fields shown from the background once the layers are known to be of the
+# same patient, which their normalized values may only tell. The templates
+# have no Background and Foreground variants of these, and the age of the
+# patient differs between studies.
+PATIENT_FIELDS = ('PatientName', 'PatientID', 'PatientBirthDate', 'PatientAge', 'PatientSex',
+  'PatientComments')
+
+# Fields that are the same for all the series of a study
+STUDY_FIELDS = ('StudyDate', 'StudyTime', 'StudyDescription', 'StudyID')
+
+# Series level dates and times, formatted when the identity is created
+PREFORMATTED_FIELDS = tuple(sorted([field for field, (name, formatName, source, omitUnknown)
+  in FIELDS.items() if formatName in ('date', 'time') and source == SERIES]))
+
+def normalizeValue(value):
+  """Normalize a patient value for comparison: surrounding spaces, empty
+  trailing name components and case do not tell patients apart."""
+  if not isinstance(value, stringTypes):
+    return value
+  return value.strip().rstrip('^ ').upper()
+
+def knownKey(value):
+  return value if value != UNKNOWN_VALUE else None
+
+#
+# SeriesIdentity
+#
+
+class SeriesIdentity(object):
+  """What identifies a series, built once from the header values of its
+  first instance: the normalized patient key, the study and series keys,
+  which are None when unknown, and the formatted text of each field.
+  Dates and times are formatted upfront, the other fields when first
+  asked for.
+  """
+
+  def __init__(self, values):
+    self.values = values
+    self.patientKey = tuple([normalizeValue(values.get(name, UNKNOWN_VALUE)) for name in PATIENT_VALUES])
+    self.studyKey = knownKey(values.get('Study Instance UID', UNKNOWN_VALUE))
+    self.seriesKey = knownKey(values.get('Series Instance UID', UNKNOWN_VALUE))
+    self.texts = {}
+    for field in PREFORMATTED_FIELDS:
+      self.text(field)
+
+  def text(self, field):
+    """Return the text of field, or None if it is left out."""
+    try:
+      return self.texts[field]
+    except KeyError:
+      text = self.texts[field] = formatFieldValue(field, self.values)
+      return text
+
+def compareLayers(background, foreground, fields):
+  """Return the field -> text dictionary of the DICOM fields of a
+  background and a foreground SeriesIdentity. Nothing is shown for
+  layers of different patients. The patient fields of the background
+  and texts that are the same in both layers are stored under the
+  field, the others under the field prefixed with Background and
+  Foreground.
+  """
+  values = {}
+  if background.patientKey != foreground.patientKey:
+    return values
+  sameSeries = background.seriesKey is not None and background.seriesKey == foreground.seriesKey
+  sameStudy = sameSeries or (background.studyKey is not None and background.studyKey == foreground.studyKey)
+  for field in set([dicomField(field) for field in fields]):
+    if field is None:
+      continue
+    backgroundText = background.text(field)
+    if sameSeries or field in PATIENT_FIELDS or (sameStudy and field in STUDY_FIELDS):
+      foregroundText = backgroundText
+    else:
+      foregroundText = foreground.text(field)
+    if backgroundText == foregroundText:
+      if backgroundText is not None:
+        values[field] = backgroundText
+    else:
+      for prefix, text in zip(LAYER_PREFIXES, (backgroundText, foregroundText)):
+        if text is not None:
+          values[prefix + field] = text
+  return values
+
+#
+# LayerComparison
+#
+
+class LayerComparison(object):
+  """Memoized comparisons of background and foreground series.
+
+  A SeriesIdentity is kept per series and the comparison result per
+  (background series, foreground series) pair and set of fields. Both
+  are keyed by the UID of the first instance of the series and remain
+  valid while the same header value dictionaries are passed in, so a
+  reloaded header replaces them without explicit invalidation.
+  """
+
+  maximumIdentities = 256
+  maximumPairs = 256
+
+  def __init__(self):
+    self.identities = OrderedDict()
+    # (background uid, foreground uid) -> (background identity,
+    # foreground identity, {fields: values})
+    self.pairs = OrderedDict()
+
+  def identity(self, uid, values):
+    identity = self.identities.pop(uid, None)
+    if identity is None or identity.values is not values:
+      identity = SeriesIdentity(values)
+    self.identities[uid] = identity
+    if len(self.identities) > self.maximumIdentities:
+      self.identities.popitem(last=False)
+    return identity
+
+  def layerValues(self, backgroundUid, backgroundValues, foregroundUid, foregroundValues, fields):
+    """Return compareLayers of the two series for fields. The returned
+    dictionary is shared, it must not be modified."""
+    background = self.identity(backgroundUid, backgroundValues)
+    foreground = self.identity(foregroundUid, foregroundValues)
+    key = (backgroundUid, foregroundUid)
+    entry = self.pairs.pop(key, None)
+    if entry is None or entry[0] is not background or entry[1] is not foreground:
+      entry = (background, foreground, {})
+    self.pairs[key] = entry
+    if len(self.pairs) > self.maximumPairs:
+      self.pairs.popitem(last=False)
+    fields = frozenset(fields)
+    values = entry[2].get(fields)
+    if values is None:
+      values = entry[2][fields] = compareLayers(background, foreground, fields)
+    return values
+
+  def clear(self):
+    self.identities.clear()
+    self.pairs.clear()
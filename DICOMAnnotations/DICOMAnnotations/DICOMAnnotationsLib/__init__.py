@@ -0,0 +1,14 @@
+from .HeaderCache import HeaderCache
+from .PersistentHeaderCache import PersistentHeaderCache
+from .HeaderReader import HeaderReader, canReadFiles, hasAllValues, profileContains
+from .HeaderPrefetcher import HeaderPrefetcher
+from .InstanceUIDIndex import InstanceUIDIndex, SlicePositionIndex
+from .ModalityProfiles import ModalityProfile, registerProfile
+from .CornerTemplates import CornerTemplates
+from .SeriesIdentity import SeriesIdentity, LayerComparison
+from .AnnotationEngine import AnnotationEngine, AnnotationLayer
+from .PerformanceCounters import PerformanceCounters
+from .EventCapture import EventCapture
+from .PixelReadout import PixelReadout, formatVoxelValue, voxelIndex
+from .LabelStatistics import LabelStatistics, sliceAxis, labelCounts
+from .ObserverRegistry import ObserverRegistry
@@ -0,0 +1,159 @@
+"""Per-event latency benchmark of the DICOMAnnotations slice annotations.
+
+Runs offline with a plain Python interpreter, using the stand-ins of
+DICOMAnnotationsStandIn for slicer.dicomDatabase, the layout manager and
+the corner annotations. Header reads sleep for a configurable latency.
+
+Usage:
+  python DICOMAnnotationsBenchmark.py [--views 1 4 9] [--instances 100 1000 5000]
+                                      [--events 1000] [--latency 0.0005] [--json out.json]
+
+For every combination of view count and series size the benchmark
+reports p50/p99/max latency, in milliseconds, of:
+  scroll    one linked scroll step, i.e. a ModifiedEvent in every view
+            dispatched to updateCornerAnnotations
+  swap      a layer change in every view, forcing new corner texts
+  gui       updateSliceViewFromGUI, run after a settings change
+and the number of header loads during the events, the headers read
+ahead when the volumes are loaded excluded.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import DICOMAnnotationsStandIn
+
+def percentile(samples, percent):
+  ordered = sorted(samples)
+  index = int(round(percent / 100.0 * (len(ordered) - 1)))
+  return ordered[index]
+
+def summary(samples):
+  return {
+    'p50': 1000.0 * percentile(samples, 50),
+    'p99': 1000.0 * percentile(samples, 99),
+    'max': 1000.0 * max(samples),
+    }
+
+class Benchmark(object):
+
+  def __init__(self, module, slicer, viewCount, instanceCount, eventCount, latency):
+    self.module = module
+    self.slicer = slicer
+    self.viewCount = viewCount
+    self.instanceCount = instanceCount
+    self.eventCount = eventCount
+    self.latency = latency
+
+  def setUp(self):
+    slicer = self.slicer
+    slicer.dicomDatabase = DICOMAnnotationsStandIn.StandInDICOMDatabase(self.latency)
+    slicer.mrmlScene = DICOMAnnotationsStandIn.StandInScene()
+    slicer.app = DICOMAnnotationsStandIn.StandInApplication()
+    layoutManager = slicer.app.layoutManager()
+    for index in range(self.viewCount):
+      layoutManager.addSliceView('View%d' % (index + 1))
+    self.volumes = []
+    for index in range(2):
+      seriesUID = '1.2.826.0.1.%d' % (index + 1)
+      uids = slicer.dicomDatabase.addSeries(seriesUID, self.instanceCount,
+        seriesDescription='Series %d' % (index + 1))
+      volumeNode = DICOMAnnotationsStandIn.StandInVolumeNode(
+        'vtkMRMLScalarVolumeNode%d' % (index + 1), 'Series %d' % (index + 1), uids)
+      slicer.mrmlScene.AddNode(volumeNode)
+      self.volumes.append(volumeNode)
+    self.widget = DICOMAnnotationsStandIn.createWidget(self.module)
+    self.sliceLogics = [layoutManager.sliceWidget(name).sliceLogic()
+      for name in layoutManager.sliceViewNames()]
+    for sliceLogic in self.sliceLogics:
+      sliceLogic.setLayers(self.volumes[0])
+    # headers read ahead when the volumes are loaded are not counted
+    DICOMAnnotationsStandIn.EventLoop.processEvents()
+    slicer.dicomDatabase.resetCounters()
+
+  def tearDown(self):
+    self.widget.cleanup()
+
+  def timeEvents(self, step):
+    samples = []
+    for event in range(self.eventCount):
+      startTime = time.time()
+      step(event)
+      DICOMAnnotationsStandIn.EventLoop.processEvents()
+      samples.append(time.time() - startTime)
+    return samples
+
+  def scroll(self, event):
+    offset = (event % self.instanceCount) * self.volumes[0].spacing[2]
+    for sliceLogic in self.sliceLogics:
+      sliceLogic.GetSliceNode().SetSliceOffset(offset)
+
+  def swap(self, event):
+    volumeNode = self.volumes[event % 2]
+    for sliceLogic in self.sliceLogics:
+      sliceLogic.setLayers(volumeNode)
+
+  def gui(self, event):
+    self.widget.fontSizeSpinBox.value = 10 + event % 10
+    self.widget.updateSliceViewFromGUI()
+
+  def run(self):
+    results = []
+    for name in ('scroll', 'swap', 'gui'):
+      self.setUp()
+      database = self.slicer.dicomDatabase
+      samples = self.timeEvents(getattr(self, name))
+      result = summary(samples)
+      result.update({'scenario': name, 'views': self.viewCount,
+        'instances': self.instanceCount, 'events': self.eventCount,
+        'headerLoads': database.headerLoads})
+      results.append(result)
+      self.tearDown()
+    return results
+
+def main(argv):
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--views', type=int, nargs='+', default=[1, 4, 9])
+  parser.add_argument('--instances', type=int, nargs='+', default=[100, 1000, 5000])
+  parser.add_argument('--events', type=int, default=1000,
+    help='number of events in each burst')
+  parser.add_argument('--latency', type=float, default=0.0005,
+    help='seconds spent in each stand-in header load')
+  parser.add_argument('--asynchronous', action='store_true',
+    help='use the asynchronous update mode')
+  parser.add_argument('--json', help='also write the results to this file')
+  args = parser.parse_args(argv)
+
+  slicer = DICOMAnnotationsStandIn.install()
+  import DICOMAnnotations
+  if args.asynchronous:
+    createWidget = DICOMAnnotationsStandIn.createWidget
+    def createAsynchronousWidget(module):
+      widget = createWidget(module)
+      widget.asynchronousUpdates = True
+      return widget
+    DICOMAnnotationsStandIn.createWidget = createAsynchronousWidget
+
+  results = []
+  print('%-8s %5s %9s %7s %9s %9s %9s %12s' % ('scenario', 'views', 'instances',
+    'events', 'p50 ms', 'p99 ms', 'max ms', 'header loads'))
+  for viewCount in args.views:
+    for instanceCount in args.instances:
+      benchmark = Benchmark(DICOMAnnotations, slicer, viewCount, instanceCount,
+        args.events, args.latency)
+      for result in benchmark.run():
+        print('%-8s %5d %9d %7d %9.3f %9.3f %9.3f %12d' % (result['scenario'],
+          result['views'], result['instances'], result['events'], result['p50'],
+          result['p99'], result['max'], result['headerLoads']))
+        results.append(result)
+  if args.json:
+    with open(args.json, 'w') as outputFile:
+      json.dump(results, outputFile, indent=2)
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
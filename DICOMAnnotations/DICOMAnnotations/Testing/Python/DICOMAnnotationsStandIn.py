@@ -0,0 +1,846 @@
+"""Offline stand-ins for the parts of slicer, vtk, qt and ctk used by the
+DICOMAnnotations module, so that the widget can be exercised and timed
+with a plain Python interpreter.
+
+Call install() before importing DICOMAnnotations.
+"""
+import sys
+import time
+
+#
+# vtk
+#
+
+class vtkCommand(object):
+  ModifiedEvent = 'ModifiedEvent'
+  StartEvent = 'StartEvent'
+  EndEvent = 'EndEvent'
+
+
+class StandInVTKObject(object):
+  """Minimal vtkObject: observers, Modified() and modification time."""
+
+  globalMTime = 0
+
+  def __init__(self):
+    self.observers = {}
+    self.nextObserverTag = 1
+    self.mtime = self.nextMTime()
+
+  @classmethod
+  def nextMTime(cls):
+    StandInVTKObject.globalMTime += 1
+    return StandInVTKObject.globalMTime
+
+  def AddObserver(self, event, callback, priority=0.0):
+    tag = self.nextObserverTag
+    self.nextObserverTag += 1
+    self.observers[tag] = (event, callback)
+    return tag
+
+  def RemoveObserver(self, tag):
+    self.observers.pop(tag, None)
+
+  def HasObserver(self, event):
+    return any(e == event for e, c in self.observers.values())
+
+  def InvokeEvent(self, event, callData=None):
+    for tag in sorted(self.observers.keys()):
+      if tag not in self.observers:
+        continue
+      e, callback = self.observers[tag]
+      if e == event:
+        callback(self, event)
+
+  def Modified(self):
+    self.mtime = self.nextMTime()
+    self.InvokeEvent(vtkCommand.ModifiedEvent)
+
+  def GetMTime(self):
+    return self.mtime
+
+
+class vtkMatrix4x4(object):
+
+  def __init__(self):
+    self.elements = [[1.0 if r == c else 0.0 for c in range(4)] for r in range(4)]
+
+  def GetElement(self, r, c):
+    return self.elements[r][c]
+
+  def SetElement(self, r, c, v):
+    self.elements[r][c] = v
+
+  def DeepCopy(self, other):
+    self.elements = [list(row) for row in other.elements]
+
+  def MultiplyPoint(self, point):
+    return tuple(sum(self.elements[r][c] * point[c] for c in range(4)) for r in range(4))
+
+
+def calldata_type(callDataType):
+  def decorate(function):
+    function.CallDataType = callDataType
+    return function
+  return decorate
+
+
+class VTKModule(object):
+  VTK_OBJECT = 'VTK_OBJECT'
+  calldata_type = staticmethod(calldata_type)
+  vtkCommand = vtkCommand
+  vtkMatrix4x4 = vtkMatrix4x4
+  vtkObject = StandInVTKObject
+
+#
+# qt and ctk
+#
+
+class Signals(object):
+  """Signal/slot bookkeeping shared by the qt stand-ins."""
+
+  def connect(self, signal, slot):
+    self.__dict__.setdefault('connections', []).append((signal, slot))
+    return True
+
+  def disconnect(self, signal, slot=None):
+    connections = self.__dict__.get('connections', [])
+    self.__dict__['connections'] = [(s, c) for s, c in connections
+        if not (s == signal and (slot is None or c == slot))]
+    return True
+
+  def emit(self, signal, *args):
+    for s, slot in list(self.__dict__.get('connections', [])):
+      if s == signal:
+        slot(*args)
+
+  def connectionCount(self):
+    return len(self.__dict__.get('connections', []))
+
+
+class QtObject(Signals):
+  """Permissive widget stand-in: accepts any constructor arguments and
+  method calls, and stores properties as plain attributes."""
+
+  defaults = {'checked': False, 'value': 0, 'enabled': True, 'text': '',
+              'toolTip': '', 'name': '', 'collapsed': False}
+
+  def __init__(self, *args, **kwargs):
+    if args and isinstance(args[0], str):
+      self.__dict__['text'] = args[0]
+
+  def __getattr__(self, name):
+    if name in QtObject.defaults:
+      return QtObject.defaults[name]
+    if name.startswith('__'):
+      raise AttributeError(name)
+    def method(*args, **kwargs):
+      return None
+    return method
+
+  def setText(self, text):
+    self.text = text
+
+  def setChecked(self, checked):
+    self.checked = checked
+
+  def setValue(self, value):
+    self.value = value
+
+  def click(self):
+    if 'checkable' not in self.__dict__:
+      self.checked = not self.checked
+    self.emit('clicked()')
+    self.emit('toggled(bool)', self.checked)
+
+
+class EventLoop(object):
+  """Queue of zero-delay and interval timers, drained by processEvents()."""
+
+  pending = []
+
+  @classmethod
+  def post(cls, callback):
+    cls.pending.append(callback)
+
+  @classmethod
+  def processEvents(cls):
+    rounds = 0
+    while cls.pending and rounds < 1000:
+      callbacks, cls.pending = cls.pending, []
+      for callback in callbacks:
+        callback()
+      rounds += 1
+
+
+class QTimer(QtObject):
+
+  def __init__(self, *args):
+    self.__dict__['active'] = False
+    self.__dict__['singleShot'] = False
+    self.__dict__['interval'] = 0
+
+  @staticmethod
+  def singleShot(msec, callback):
+    EventLoop.post(callback)
+
+  def setSingleShot(self, singleShot):
+    self.__dict__['singleShot'] = singleShot
+
+  def setInterval(self, msec):
+    self.__dict__['interval'] = msec
+
+  def isActive(self):
+    return self.active
+
+  def start(self, msec=None):
+    if self.active:
+      return
+    self.active = True
+    EventLoop.post(self.fire)
+
+  def stop(self):
+    self.active = False
+
+  def fire(self):
+    if not self.active:
+      return
+    if self.__dict__['interval']:
+      # let worker threads make progress between timer ticks
+      time.sleep(0.001)
+    if self.__dict__['singleShot']:
+      self.active = False
+    else:
+      EventLoop.post(self.fire)
+    self.emit('timeout()')
+
+
+class QSettings(object):
+  """Settings kept in memory for the lifetime of the interpreter."""
+
+  values = {}
+
+  def value(self, key, defaultValue=None):
+    return QSettings.values.get(key, defaultValue)
+
+  def setValue(self, key, value):
+    QSettings.values[key] = value
+
+
+class ctkPathLineEdit(QtObject):
+
+  Files = 1
+
+  def __init__(self, *args):
+    self.__dict__['currentPath'] = ''
+
+  def setCurrentPath(self, path):
+    self.currentPath = path
+    self.emit('currentPathChanged(QString)', path)
+
+
+class QtModule(object):
+
+  QTimer = QTimer
+  QSettings = QSettings
+  ctkPathLineEdit = ctkPathLineEdit
+
+  def __getattr__(self, name):
+    if name.startswith('__'):
+      raise AttributeError(name)
+    return QtObject
+
+#
+# slicer
+#
+
+class StandInDICOMDatabase(Signals):
+  """In-memory DICOM database with configurable header read latency.
+
+  Instances are stored as tag -> value dictionaries. Each header load
+  sleeps for headerLatency seconds to mimic file and database I/O.
+  """
+
+  def __init__(self, headerLatency=0.0):
+    self.headerLatency = headerLatency
+    self.instances = {}
+    self.instanceSeries = {}
+    self.series = {}
+    self.tagCache = {}
+    self.precachedTags = []
+    self.currentInstance = None
+    self.headerLoads = 0
+    self.headerValueCalls = 0
+    self.fileValueCalls = 0
+
+  def resetCounters(self):
+    self.headerLoads = 0
+    self.headerValueCalls = 0
+    self.fileValueCalls = 0
+
+  def addSeries(self, seriesUID, instanceCount, modality='MR', patientName='Doe^John',
+                patientID='1234', studyDate='20140102', studyTime='134500',
+                seriesDescription=None, **extraTags):
+    uids = []
+    for index in range(instanceCount):
+      uid = '%s.%d' % (seriesUID, index + 1)
+      tags = {
+        '0008,0018': uid,
+        '0008,0020': studyDate,
+        '0008,0030': studyTime,
+        '0008,0032': '1346%02d' % (index % 60),
+        '0008,0060': modality,
+        '0008,0070': 'ACME',
+        '0008,0080': 'General Hospital',
+        '0008,0090': 'House^Gregory',
+        '0008,1030': 'Study',
+        '0008,103e': seriesDescription or seriesUID,
+        '0008,1090': 'Scanner 3000',
+        '0010,0010': patientName,
+        '0010,0020': patientID,
+        '0010,0030': '19700101',
+        '0010,0040': 'M',
+        '0010,1010': '044Y',
+        '0018,0080': '2000',
+        '0018,0081': '%d' % (80 + index % 3),
+        '0018,1314': '90',
+        '0018,5100': 'HFS',
+        '0020,000d': '%s.%s' % (patientID, studyDate),
+        '0020,000e': seriesUID,
+        '0020,0011': '1',
+        '0020,0013': str(index + 1),
+        '0020,1041': '%.1f' % (index * 2.5),
+        }
+      tags.update(extraTags)
+      self.instances[uid] = tags
+      self.instanceSeries[uid] = seriesUID
+      uids.append(uid)
+    self.series[seriesUID] = uids
+    return uids
+
+  def isOpen(self):
+    return True
+
+  def fileForInstance(self, uid):
+    if uid not in self.instances:
+      return ''
+    return '/standin/%s.dcm' % uid
+
+  def instanceForFile(self, fileName):
+    return fileName[len('/standin/'):-len('.dcm')]
+
+  def filesForSeries(self, seriesUID):
+    return [self.fileForInstance(uid) for uid in self.series.get(seriesUID, [])]
+
+  def seriesForFile(self, fileName):
+    return self.instanceSeries.get(self.instanceForFile(fileName), '')
+
+  def loadInstanceHeader(self, uid):
+    self.headerLoads += 1
+    if self.headerLatency:
+      time.sleep(self.headerLatency)
+    self.currentInstance = self.instances.get(uid)
+
+  def loadFileHeader(self, fileName):
+    self.loadInstanceHeader(self.instanceForFile(fileName))
+
+  def headerValue(self, tag):
+    self.headerValueCalls += 1
+    if not self.currentInstance or tag not in self.currentInstance:
+      return ''
+    return '(%s) LO [%s]  # %d, 1 Stand In' % (tag, self.currentInstance[tag],
+        len(self.currentInstance[tag]))
+
+  def fileValue(self, fileName, tag):
+    self.fileValueCalls += 1
+    uid = self.instanceForFile(fileName)
+    if (uid, tag) not in self.tagCache:
+      self.loadInstanceHeader(uid)
+    return self.instances.get(uid, {}).get(tag, '')
+
+  def cacheTag(self, uid, tag, value):
+    self.tagCache[(uid, tag)] = value
+
+  def cachedTag(self, uid, tag):
+    return self.tagCache.get((uid, tag), '')
+
+  # a property, as in ctkDICOMDatabase
+  @property
+  def tagsToPrecache(self):
+    return list(self.precachedTags)
+
+  @tagsToPrecache.setter
+  def tagsToPrecache(self, tags):
+    self.precachedTags = list(tags)
+
+  def indexSeries(self, seriesUID, instanceCount, **kwargs):
+    """Add a series the way an import does: the precached tags are
+    stored while indexing and instanceAdded is emitted per instance."""
+    uids = self.addSeries(seriesUID, instanceCount, **kwargs)
+    for uid in uids:
+      for tag in self.precachedTags:
+        self.tagCache[(uid, tag)] = self.instances[uid].get(tag, '__TAG_NOT_IN_INSTANCE__')
+      self.emit('instanceAdded(QString)', uid)
+    return uids
+
+
+class StandInCornerAnnotation(object):
+
+  def __init__(self):
+    self.texts = [''] * 4
+    self.setTextCalls = 0
+    self.textProperty = QtObject()
+
+  def SetText(self, corner, text):
+    self.setTextCalls += 1
+    self.texts[corner] = text
+
+  def GetText(self, corner):
+    return self.texts[corner]
+
+  def SetMaximumFontSize(self, size):
+    pass
+
+  def SetMinimumFontSize(self, size):
+    pass
+
+  def GetTextProperty(self):
+    return self.textProperty
+
+
+class StandInSliceView(object):
+
+  def __init__(self):
+    self.annotation = StandInCornerAnnotation()
+    self.renders = 0
+
+  def cornerAnnotation(self):
+    return self.annotation
+
+  def scheduleRender(self):
+    self.renders += 1
+
+
+class StandInNode(StandInVTKObject):
+
+  def __init__(self, nodeID, name):
+    StandInVTKObject.__init__(self)
+    self.nodeID = nodeID
+    self.name = name
+    self.attributes = {}
+    self.scene = None
+
+  def GetID(self):
+    return self.nodeID
+
+  def GetName(self):
+    return self.name
+
+  def GetAttribute(self, name):
+    return self.attributes.get(name)
+
+  def SetAttribute(self, name, value):
+    self.attributes[name] = value
+    self.Modified()
+
+  def GetScene(self):
+    return self.scene
+
+  def IsA(self, className):
+    return className in self.classNames
+
+
+class StandInPointData(object):
+
+  def __init__(self, imageData):
+    self.imageData = imageData
+
+  def GetScalars(self):
+    return self.imageData.scalars
+
+
+class StandInImageData(StandInVTKObject):
+  """Image without stored scalars: voxel (i, j, k) has the value i + j + k."""
+
+  def __init__(self, dimensions, spacing=(1.0, 1.0, 1.0)):
+    StandInVTKObject.__init__(self)
+    self.dimensions = dimensions
+    self.spacing = spacing
+    self.scalars = None
+    self.voxelReads = 0
+
+  def GetDimensions(self):
+    return self.dimensions
+
+  def GetSpacing(self):
+    return self.spacing
+
+  def GetPointData(self):
+    return StandInPointData(self)
+
+  def GetNumberOfScalarComponents(self):
+    return 1
+
+  def GetScalarComponentAsDouble(self, i, j, k, component):
+    self.voxelReads += 1
+    return float(i + j + k)
+
+
+class StandInDisplayNode(StandInNode):
+
+  classNames = ('vtkMRMLNode', 'vtkMRMLDisplayNode', 'vtkMRMLScalarVolumeDisplayNode')
+
+  def __init__(self, nodeID, window=400.0, level=40.0):
+    StandInNode.__init__(self, nodeID, nodeID)
+    self.window = window
+    self.level = level
+
+  def GetWindow(self):
+    return self.window
+
+  def GetLevel(self):
+    return self.level
+
+
+class StandInVolumeNode(StandInNode):
+  """Scalar volume with IJK axes aligned with RAS, one slice per instance."""
+
+  classNames = ('vtkMRMLNode', 'vtkMRMLVolumeNode', 'vtkMRMLScalarVolumeNode')
+  ImageDataModifiedEvent = 'ImageDataModifiedEvent'
+
+  def __init__(self, nodeID, name, instanceUIDs=None, spacing=(1.0, 1.0, 2.5),
+               dimensions=(256, 256, None)):
+    StandInNode.__init__(self, nodeID, name)
+    self.spacing = spacing
+    count = len(instanceUIDs) if instanceUIDs else 1
+    self.dimensions = (dimensions[0], dimensions[1], dimensions[2] or count)
+    if instanceUIDs:
+      self.attributes['DICOM.instanceUIDs'] = ' '.join(instanceUIDs)
+    self.imageData = StandInImageData(self.dimensions)
+    self.displayNode = StandInDisplayNode(nodeID + 'Display')
+
+  def GetIJKToRASMatrix(self, matrix):
+    for axis in range(3):
+      matrix.SetElement(axis, axis, self.spacing[axis])
+
+  def GetRASToIJKMatrix(self, matrix):
+    for axis in range(3):
+      matrix.SetElement(axis, axis, 1.0 / self.spacing[axis])
+
+  def GetImageData(self):
+    return self.imageData
+
+  def GetDisplayNode(self):
+    return self.displayNode
+
+  def ModifyImageData(self):
+    """Simulate an edit of the voxels."""
+    self.imageData.Modified()
+    self.InvokeEvent(self.ImageDataModifiedEvent)
+
+  def GetSpacing(self):
+    return self.spacing
+
+
+class StandInSliceNode(StandInNode):
+
+  classNames = ('vtkMRMLNode', 'vtkMRMLSliceNode')
+
+  def __init__(self, nodeID, layoutName):
+    StandInNode.__init__(self, nodeID, layoutName)
+    self.layoutName = layoutName
+    self.sliceToRAS = vtkMatrix4x4()
+
+  def GetLayoutName(self):
+    return self.layoutName
+
+  def GetSliceToRAS(self):
+    return self.sliceToRAS
+
+  def GetXYToRAS(self):
+    # one millimeter per pixel
+    return self.sliceToRAS
+
+  def GetSliceOffset(self):
+    return self.sliceToRAS.GetElement(2, 3)
+
+  def SetSliceOffset(self, offset):
+    self.sliceToRAS.SetElement(2, 3, offset)
+    self.Modified()
+
+
+class StandInCrosshairNode(StandInNode):
+
+  classNames = ('vtkMRMLNode', 'vtkMRMLCrosshairNode')
+  CursorPositionModifiedEvent = 'CursorPositionModifiedEvent'
+
+  def __init__(self):
+    StandInNode.__init__(self, 'vtkMRMLCrosshairNodedefault', 'Crosshair')
+    self.cursorXYZ = (0.0, 0.0, 0.0)
+    self.cursorSliceNode = None
+
+  def SetCursorPositionXYZ(self, xyz, sliceNode):
+    """Move the mouse over a slice view, or out of all views with None."""
+    self.cursorXYZ = tuple(xyz)
+    self.cursorSliceNode = sliceNode
+    self.InvokeEvent(self.CursorPositionModifiedEvent)
+
+  def GetCursorPositionXYZ(self, xyz):
+    xyz[:] = list(self.cursorXYZ)
+    return self.cursorSliceNode
+
+
+class StandInSliceCompositeNode(StandInNode):
+
+  classNames = ('vtkMRMLNode', 'vtkMRMLSliceCompositeNode')
+
+  def __init__(self, nodeID, layoutName):
+    StandInNode.__init__(self, nodeID, layoutName)
+    self.layoutName = layoutName
+    self.foregroundOpacity = 0.0
+    self.labelOpacity = 1.0
+
+  def GetLayoutName(self):
+    return self.layoutName
+
+  def GetForegroundOpacity(self):
+    return self.foregroundOpacity
+
+  def GetLabelOpacity(self):
+    return self.labelOpacity
+
+
+class StandInSliceLayer(object):
+
+  def __init__(self, sliceNode):
+    self.sliceNode = sliceNode
+    self.volumeNode = None
+
+  def GetVolumeNode(self):
+    return self.volumeNode
+
+  def GetSliceNode(self):
+    return self.sliceNode
+
+
+class StandInSliceLogic(StandInVTKObject):
+
+  def __init__(self, sliceNode, compositeNode):
+    StandInVTKObject.__init__(self)
+    self.sliceNode = sliceNode
+    self.compositeNode = compositeNode
+    self.backgroundLayer = StandInSliceLayer(sliceNode)
+    self.foregroundLayer = StandInSliceLayer(sliceNode)
+    self.labelLayer = StandInSliceLayer(sliceNode)
+    # like vtkMRMLSliceLogic, forward node modifications
+    sliceNode.AddObserver(vtkCommand.ModifiedEvent, lambda caller, event: self.Modified())
+    compositeNode.AddObserver(vtkCommand.ModifiedEvent, lambda caller, event: self.Modified())
+
+  def GetBackgroundLayer(self):
+    return self.backgroundLayer
+
+  def GetForegroundLayer(self):
+    return self.foregroundLayer
+
+  def GetLabelLayer(self):
+    return self.labelLayer
+
+  def GetSliceNode(self):
+    return self.sliceNode
+
+  def GetSliceCompositeNode(self):
+    return self.compositeNode
+
+  def setLayers(self, background=None, foreground=None, label=None,
+                foregroundOpacity=None, labelOpacity=None):
+    self.backgroundLayer.volumeNode = background
+    self.foregroundLayer.volumeNode = foreground
+    self.labelLayer.volumeNode = label
+    if foregroundOpacity is not None:
+      self.compositeNode.foregroundOpacity = foregroundOpacity
+    if labelOpacity is not None:
+      self.compositeNode.labelOpacity = labelOpacity
+    self.compositeNode.Modified()
+
+
+class StandInSliceWidget(object):
+
+  def __init__(self, logic, width=800):
+    self.logic = logic
+    self.view = StandInSliceView()
+    self.width = width
+
+  def sliceLogic(self):
+    return self.logic
+
+  def sliceView(self):
+    return self.view
+
+  def mrmlSliceNode(self):
+    return self.logic.GetSliceNode()
+
+
+class StandInLayoutManager(Signals):
+
+  def __init__(self):
+    self.widgets = {}
+    self.names = []
+
+  def addSliceView(self, name, width=800):
+    sliceNode = StandInSliceNode('vtkMRMLSliceNode' + name, name)
+    compositeNode = StandInSliceCompositeNode('vtkMRMLSliceCompositeNode' + name, name)
+    widget = StandInSliceWidget(StandInSliceLogic(sliceNode, compositeNode), width)
+    self.widgets[name] = widget
+    self.names.append(name)
+    self.emit('layoutChanged(int)', 0)
+    return widget
+
+  def removeSliceView(self, name):
+    self.names.remove(name)
+    widget = self.widgets.pop(name)
+    self.emit('layoutChanged(int)', 0)
+    return widget
+
+  def sliceViewNames(self):
+    return list(self.names)
+
+  def sliceWidget(self, name):
+    return self.widgets.get(name)
+
+
+class StandInScene(StandInVTKObject):
+
+  NodeAddedEvent = 'NodeAddedEvent'
+  NodeRemovedEvent = 'NodeRemovedEvent'
+  StartBatchProcessEvent = 'StartBatchProcessEvent'
+  EndBatchProcessEvent = 'EndBatchProcessEvent'
+  StartImportEvent = 'StartImportEvent'
+  EndImportEvent = 'EndImportEvent'
+  StartCloseEvent = 'StartCloseEvent'
+  EndCloseEvent = 'EndCloseEvent'
+  BatchProcessState = 0x0001
+
+  def __init__(self):
+    StandInVTKObject.__init__(self)
+    self.nodes = {}
+    self.batchProcessing = False
+    # singleton, kept when the scene is cleared
+    self.crosshairNode = StandInCrosshairNode()
+
+  def AddNode(self, node):
+    self.nodes[node.GetID()] = node
+    node.scene = self
+    self.lastEventNode = node
+    self.InvokeEvent(self.NodeAddedEvent, node)
+    return node
+
+  def RemoveNode(self, node):
+    self.nodes.pop(node.GetID(), None)
+    self.lastEventNode = node
+    self.InvokeEvent(self.NodeRemovedEvent, node)
+
+  def GetNodeByID(self, nodeID):
+    return self.nodes.get(nodeID)
+
+  def GetNumberOfNodesByClass(self, className):
+    return len(self.nodesByClass(className))
+
+  def GetNthNodeByClass(self, index, className):
+    return self.nodesByClass(className)[index]
+
+  def nodesByClass(self, className):
+    return [self.nodes[nodeID] for nodeID in sorted(self.nodes.keys())
+      if self.nodes[nodeID].IsA(className)]
+
+  def GetFirstNodeByClass(self, className):
+    if className == 'vtkMRMLCrosshairNode':
+      return self.crosshairNode
+    for node in self.nodes.values():
+      if node.IsA(className):
+        return node
+    return None
+
+  def IsBatchProcessing(self):
+    return self.batchProcessing
+
+  def StartState(self, state):
+    self.batchProcessing = True
+    self.InvokeEvent(self.StartBatchProcessEvent)
+
+  def EndState(self, state):
+    self.batchProcessing = False
+    self.InvokeEvent(self.EndBatchProcessEvent)
+
+  def InvokeEvent(self, event, callData=None):
+    # scene events carry the node as call data
+    for tag in sorted(self.observers.keys()):
+      if tag not in self.observers:
+        continue
+      e, callback = self.observers[tag]
+      if e == event:
+        if getattr(callback, 'CallDataType', None) is not None:
+          callback(self, event, callData)
+        else:
+          callback(self, event)
+
+  def Clear(self, removeSingletons=0):
+    for node in list(self.nodes.values()):
+      self.RemoveNode(node)
+
+
+class StandInApplication(object):
+
+  def __init__(self):
+    self.layout = StandInLayoutManager()
+    self.temporaryPath = '/tmp'
+
+  def layoutManager(self):
+    return self.layout
+
+  def processEvents(self):
+    EventLoop.processEvents()
+
+
+class SlicerModule(object):
+
+  def __init__(self):
+    self.app = StandInApplication()
+    self.dicomDatabase = StandInDICOMDatabase()
+    self.mrmlScene = StandInScene()
+    self.selfTests = {}
+    self.vtkMRMLScene = StandInScene
+    self.vtkMRMLCrosshairNode = StandInCrosshairNode
+    self.vtkMRMLVolumeNode = StandInVolumeNode
+    self.util = QtObject()
+
+  def qMRMLWidget(self):
+    widget = QtObject()
+    widget.layout = lambda: QtObject()
+    return widget
+
+
+def standInModules():
+  """Return new stand-ins of the vtk, qt, ctk and slicer modules, by
+  name."""
+  return {'vtk': VTKModule(), 'qt': QtModule(), 'ctk': QtModule(), 'slicer': SlicerModule()}
+
+
+def install():
+  """Register the stand-in modules in __main__ (where the module imports
+  them from) and return the stand-in slicer module."""
+  main = sys.modules['__main__']
+  for name, module in standInModules().items():
+    setattr(main, name, module)
+  return main.slicer
+
+
+def createWidget(module):
+  """Create a DICOMAnnotationsWidget of the imported module, set it up
+  and turn the annotations on."""
+  parent = QtObject()
+  parent.layout = lambda: QtObject()
+  widget = module.DICOMAnnotationsWidget(parent)
+  widget.setup()
+  widget.dicomAnnotationsCheckBox.checked = True
+  widget.updateSliceViewFromGUI()
+  return widget